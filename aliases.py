@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Player aliases (elo.alias): names known to be the same person. Every "combine a to b" and
+# "alias a to b" joins the two names here, so when "a" turns up again (an old export, a
+# scoresheet, another station) canonicalize resolves it to b's record instead of creating a
+# new player.
+#
+# A union-find over normalized names with union by size and path compression, so resolving
+# a name is a couple of dict lookups however long the chain of merges behind it. Each set
+# also remembers the key its players are filed under (the last merge's target), which need
+# not be the union-find root. The file holds one "name<TAB>key" line per merged-away name.
+#   python aliases.py [elo.alias] [NAME]    (every alias, or those of one player)
+import sys
+
+
+class AliasTable:
+    def __init__(self):
+        self.parent = {}  # name -> parent name; roots point at themselves
+        self.size = {}  # root -> names in its set
+        self.key = {}  # root -> player key the set resolves to
+        self.dirty = False
+
+    def find(self, name):
+        root = name
+        parent = self.parent
+        while parent[root] != root:
+            root = parent[root]
+        while parent[name] != root:
+            parent[name], name = root, parent[name]
+        return root
+
+    def resolve(self, name):
+        # The player key for a normalized name: itself unless it has been merged away.
+        if name not in self.parent:
+            return name
+        return self.key[self.find(name)]
+
+    def add(self, name):
+        if name not in self.parent:
+            self.parent[name] = name
+            self.size[name] = 1
+            self.key[name] = name
+
+    def union(self, alias, name):
+        # `alias` is now the same player as `name`; the set resolves to whatever `name` did.
+        target = self.resolve(name)
+        self.add(alias)
+        self.add(name)
+        a, b = self.find(alias), self.find(name)
+        if a != b:
+            if self.size[a] > self.size[b]:
+                a, b = b, a
+            self.parent[a] = b
+            self.size[b] += self.size.pop(a)
+            del self.key[a]
+        self.key[b] = target
+        self.dirty = True
+
+    def names(self, key):
+        # Every name that resolves to `key`, other than `key` itself.
+        return sorted(name for name in self.parent if name != key and self.resolve(name) == key)
+
+    def clear(self):
+        self.__init__()
+
+    def load(self, path):
+        self.clear()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    name, sep, key = line.rstrip("\n").partition("\t")
+                    if sep:
+                        self.union(name, key)
+        except FileNotFoundError:
+            pass
+        self.dirty = False
+
+    def dump(self):
+        return "".join(f"{name}\t{self.resolve(name)}\n" for name in sorted(self.parent)
+                       if self.resolve(name) != name).encode("utf-8")
+
+
+def main():
+    import foosball
+
+    args = sys.argv[1:]
+    path = args.pop(0) if args and args[0].endswith(".alias") else foosball.ALIAS_FILE
+    table = AliasTable()
+    table.load(path)
+    if args:
+        key = table.resolve(foosball.normalize_name(args[0]))
+        print(f"{key}: {', '.join(table.names(key)) or 'no aliases'}")
+        return 0
+    sys.stdout.write(table.dump().decode("utf-8"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# Synthetic-league benchmark for the core paths: load_data, process_game, save_data,
+# get_players_display, get_best_players_display and the autocomplete lookup behind
+# FoosballGUI.update_suggestions. Leagues and game streams are generated from a seed, so
+# runs are comparable; each league size runs in a fresh process in a temp directory.
+# Memory per stage is how far it raised the process's peak RSS (peak_rss_growth_mb) and,
+# with --tracemalloc, the peak of the traced Python heap during the stage; process_peak_rss_mb
+# is the process's peak so far, which only ever goes up.
+#   python benchmarks/bench_league.py [--sizes 1000,10000,100000,1000000] [--games 5000]
+#   python benchmarks/bench_league.py --out new.json --compare old.json
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "sen", "tu", "vo", "bri", "dan", "el", "jo", "mar", "no", "pe", "qui", "zed"]
+WIN_TYPES = [("win", 50), ("smallwin", 15), ("closewin", 15), ("bigwin", 15), ("perfectwin", 5)]
+SHAPES = [((1, 1), (1, 1), 70), ((1, 0), (1, 0), 20), ((1, 1), (1, 0), 10)]  # (off, def) per team, weight
+REGRESSION = 1.2  # a stage is flagged when it gets this much slower...
+MIN_DELTA = 0.05  # ...and at least this many seconds slower (short stages are noisy)
+
+
+def league_name(i):
+    # Distinct, pronounceable names; the number keeps them unique.
+    a = SYLLABLES[i % len(SYLLABLES)]
+    b = SYLLABLES[(i // len(SYLLABLES)) % len(SYLLABLES)]
+    return f"{a.capitalize()}{b}{i}"
+
+
+def make_league(n, seed):
+    # elo.txt lines: most players low-rated and casual, a long tail of strong regulars.
+    import foosball
+
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        skill = min(rng.expovariate(1 / 250), 2400)
+        off = int(foosball.RATING_MIN + max(0, rng.gauss(skill, 60)))
+        deff = int(foosball.RATING_MIN + max(0, rng.gauss(skill, 60)))
+        off, deff = min(off, foosball.RATING_MAX), min(deff, foosball.RATING_MAX)
+        played = int(rng.paretovariate(1.2) * 5)
+        win_rate = rng.randint(20, 80) if played else 0
+        avg = round((off + deff) / 2)
+        ranks = [foosball.get_computed_rank(v) for v in (deff, off, avg)]
+        lines.append(f"{league_name(i)}, {off}, {deff}, {played}, {win_rate}, {avg}, {', '.join(ranks)}.\n")
+    return "".join(lines).encode("utf-8")
+
+
+def make_games(n, count, seed, new_players=0.01):
+    # Game commands; busy players appear far more often, and ~1% of names are new to the league.
+    rng = random.Random(seed + 1)
+    weights = [1 / (i + 1) ** 0.8 for i in range(n)]
+    cumulative = []
+    total = 0.0
+    for w in weights:
+        total += w
+        cumulative.append(total)
+    order = list(range(n))
+    rng.shuffle(order)
+    win_types, win_weights = zip(*WIN_TYPES)
+    shapes = [(a, b) for a, b, _ in SHAPES]
+    shape_weights = [w for _, _, w in SHAPES]
+    games = []
+    for g in range(count):
+        (o1, d1), (o2, d2) = rng.choices(shapes, shape_weights)[0]
+        if rng.random() < 0.5:
+            (o1, d1), (o2, d2) = (o2, d2), (o1, d1)
+        names = []
+        while len(names) < o1 + d1 + o2 + d2:
+            if rng.random() < new_players:
+                name = f"Rookie{seed}x{g}x{len(names)}"
+            else:
+                name = league_name(order[rng.choices(range(n), cum_weights=cumulative)[0]])
+            if name not in names:
+                names.append(name)
+        team1 = ",".join(names[:o1]) + (";" + ",".join(names[o1:o1 + d1]) if d1 else "")
+        rest = names[o1 + d1:]
+        team2 = ",".join(rest[:o2]) + (";" + ",".join(rest[o2:]) if d2 else "")
+        games.append(f"{team1} {rng.choices(win_types, win_weights)[0]} {team2}")
+    return games
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_league(n, games, seed, trace):
+    # Runs in the child process, inside a scratch directory. Returns a list of stage dicts.
+    import foosball
+
+    results = []
+    if trace:
+        import tracemalloc
+        tracemalloc.start()
+
+    def stage(name, func, ops=1, **extra):
+        if trace:
+            tracemalloc.reset_peak()
+        before = peak_rss_mb()
+        t0 = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - t0
+        after = peak_rss_mb()
+        row = {"players": n, "stage": name, "seconds": round(seconds, 6), "ops": ops,
+               "per_sec": round(ops / seconds, 1) if seconds > 0 else None,
+               "peak_rss_growth_mb": round(after - before, 2) if after is not None else None,
+               "process_peak_rss_mb": after}
+        if trace:
+            row["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        row.update(extra)
+        results.append(row)
+        print(f"  {name:<28} {seconds:>9.3f}s {row['per_sec'] or 0:>12.0f}/s", file=sys.stderr, flush=True)
+        return value
+
+    raw = stage("generate league", lambda: make_league(n, seed))
+    with open(foosball.FILE_NAME, "wb") as f:
+        f.write(raw)
+    stream = stage("generate games", lambda: make_games(n, games, seed), games)
+    foosball.BINARY_SNAPSHOT = False
+    stage("load_data (elo.txt)", foosball.load_data, n)
+
+    def play(commands, report):
+        for command in commands:
+            foosball.process_game(command, report)
+
+    half = len(stream) // 2
+    stage("process_game", lambda: play(stream[:half], False), half)
+    stage("process_game (report)", lambda: play(stream[half:], True), len(stream) - half)
+    foosball.BINARY_SNAPSHOT = True
+    stage("save_data", foosball.save_data, 1)
+    results[-1]["bytes"] = os.path.getsize(foosball.FILE_NAME) + os.path.getsize(foosball.SNAPSHOT_FILE)
+    stage("process_games (batch)", lambda: foosball.process_games(stream[:half]), half)
+    stage("get_players_display", foosball.get_players_display, 1)
+    stage("get_players_display gold", lambda: foosball.get_players_display("gold"), 1)
+    stage("get_best_players_display", foosball.get_best_players_display, 1)
+    rng = random.Random(seed + 2)
+    prefixes = [league_name(rng.randrange(n))[:rng.randint(1, 4)].lower() for _ in range(2000)]
+
+    def suggest():
+        for prefix in prefixes:
+            foosball.leaderboard.sync()
+            foosball.completions.match(prefix)
+
+    stage("update_suggestions lookup", suggest, len(prefixes))
+    foosball.shutdown()
+    # Fresh start from what was just saved: elo.snap first, then the text path.
+    foosball.players.clear()
+    foosball.leaderboard.rebuild()
+    stage("load_data (elo.snap)", foosball.load_data, n)
+    stage("first pp after elo.snap", foosball.get_players_display, 1)
+    foosball.shutdown(save=False)
+    return results
+
+
+def run_child(n, games, seed, trace):
+    # One league size in a fresh interpreter, so memory and caches don't carry over.
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(n), "--games", str(games), "--seed", str(seed)]
+    if trace:
+        cmd.append("--tracemalloc")
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as cwd:
+        out = subprocess.run(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(out)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def stage_mb(row, key):
+    value = row.get(key)
+    return "-" if value is None else f"{value:.1f}"
+
+
+def compare(old, new):
+    # Prints per-stage ratios and memory; returns the stages that got slower than REGRESSION allows.
+    # Memory is the traced heap peak when both runs have it, else how far the stage raised peak RSS.
+    before = {(r["players"], r["stage"]): r for r in old["results"]}
+    slower = []
+    print(f"{'players':>8} {'stage':<28} {'old s':>9} {'new s':>9} {'ratio':>6} {'old MB':>8} {'new MB':>8}")
+    for row in new["results"]:
+        prev = before.get((row["players"], row["stage"]))
+        if prev is None or not prev["seconds"] or row["stage"].startswith("generate"):
+            continue
+        ratio = row["seconds"] / prev["seconds"]
+        flag = "  SLOWER" if ratio > REGRESSION and row["seconds"] - prev["seconds"] > MIN_DELTA else ""
+        key = "peak_traced_mb" if "peak_traced_mb" in row and "peak_traced_mb" in prev else "peak_rss_growth_mb"
+        print(f"{row['players']:>8} {row['stage']:<28} {prev['seconds']:>9.3f} {row['seconds']:>9.3f} {ratio:>6.2f}"
+              f" {stage_mb(prev, key):>8} {stage_mb(row, key):>8}{flag}")
+        if flag:
+            slower.append(row)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the core paths on synthetic leagues.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated league sizes, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--games", type=int, default=5000, help="games played per league")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tracemalloc", action="store_true", help="also record the traced Python heap peak per stage (slower)")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", metavar="OLD_JSON", help="compare with an earlier --out file; exit 1 on regressions")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        json.dump(run_league(args.child, args.games, args.seed, args.tracemalloc), sys.stdout)
+        return 0
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "revision": git_revision(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "games": args.games, "seed": args.seed},
+        "results": [],
+    }
+    for n in (int(s) for s in args.sizes.split(",")):
+        print(f"{n} players, {args.games} games", file=sys.stderr)
+        report["results"] += run_child(n, args.games, args.seed, args.tracemalloc)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    print(f"{'players':>8} {'stage':<28} {'seconds':>9} {'per sec':>12} {'+peak MB':>9} {'proc MB':>8}")
+    for row in report["results"]:
+        print(f"{row['players']:>8} {row['stage']:<28} {row['seconds']:>9.3f} {row['per_sec'] or 0:>12.0f}"
+              f" {row['peak_rss_growth_mb'] or 0:>9.1f} {row['process_peak_rss_mb'] or 0:>8.0f}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        if compare(old, report):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
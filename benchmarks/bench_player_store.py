@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Memory and speed of the columnar PlayerStore against the old dict-of-dicts layout.
+#   python benchmarks/bench_player_store.py [players]
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from player_store import PlayerStore  # noqa: E402
+
+RANKS = ["iron", "steel", "bronze", "copper", "silver", "gold", "plat"]
+
+
+def make_record(rng, i):
+    off, deff = rng.randint(100, 1200), rng.randint(100, 1200)
+    played = rng.randint(0, 300)
+    return {
+        "display": f"Player{i}",
+        "offense": off,
+        "defense": deff,
+        "played": played,
+        "wins": rng.randint(0, played),
+        "avg": round((off + deff) / 2),
+        "rank_d": rng.choice(RANKS),
+        "rank_o": rng.choice(RANKS),
+        "rank_a": rng.choice(RANKS)
+    }
+
+
+def fill(table, n):
+    rng = random.Random(1)
+    for i in range(n):
+        table[f"player{i}"] = make_record(rng, i)
+    return table
+
+
+def measure_memory(factory, n):
+    tracemalloc.start()
+    table = fill(factory(), n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return table, current
+
+
+def measure_updates(table, n, rounds):
+    # The access pattern of process_game: look a player up, read a rating, write it back, bump counters.
+    rng = random.Random(2)
+    keys = [f"player{rng.randrange(n)}" for _ in range(rounds)]
+    t0 = time.perf_counter()
+    for key in keys:
+        player = table[key]
+        player["offense"] = player["offense"] + 1
+        player["played"] += 1
+        player["wins"] += 1
+        player["avg"] = round((player["offense"] + player["defense"]) / 2)
+    return time.perf_counter() - t0
+
+
+def measure_scan(table):
+    t0 = time.perf_counter()
+    sorted(table.items(), key=lambda kv: (-kv[1]["avg"], kv[1]["display"]))
+    return time.perf_counter() - t0
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rounds = 200000
+    print(f"{n} players")
+    print(f"{'layout':<12} {'memory MB':>10} {'updates/s':>12} {'full sort s':>12}")
+    for name, factory in (("dict", dict), ("PlayerStore", lambda: PlayerStore(RANKS))):
+        table, memory = measure_memory(factory, n)
+        updates = rounds / measure_updates(table, n, rounds)
+        scan = measure_scan(table)
+        print(f"{name:<12} {memory / 1e6:>10.1f} {updates:>12.0f} {scan:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# Direct rating formulas against the lookup tables in rating_table.py, scalar and vectorized.
+#   python benchmarks/bench_rating_math.py [updates]
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+
+import foosball  # noqa: E402
+
+
+def update_rating_direct(curr_rating, score, opposition_rating, multiplier):
+    # foosball.update_rating as it was before the tables.
+    expected = 1 / (1 + math.pow(10, (opposition_rating - curr_rating) / 400))
+    change = multiplier * foosball.K_FACTOR * (score - expected)
+    adjustment = 0
+    for threshold, adj in foosball.RATING_PROTECTION_THRESHOLDS:
+        if curr_rating <= threshold:
+            adjustment = adj
+            break
+    change += adjustment
+    if score == 0:
+        change = min(change, 0)
+    if change < 0 and curr_rating <= foosball.RATING_MIN:
+        return foosball.RATING_MIN, 0
+    new_rating = max(min(round(curr_rating + change), foosball.RATING_MAX), foosball.RATING_MIN)
+    return new_rating, change
+
+
+def workload(n):
+    # 2v2-style inputs: integer ratings against the average of two opponents.
+    rng = random.Random(1)
+    multipliers = list(foosball.WIN_TYPE_MULTIPLIERS.values())
+    return [(rng.randint(100, 1500), rng.randint(0, 1), (rng.randint(100, 1500) + rng.randint(100, 1500)) / 2,
+             rng.choice(multipliers)) for _ in range(n)]
+
+
+def timed(func, args):
+    t0 = time.perf_counter()
+    for a in args:
+        func(*a)
+    return time.perf_counter() - t0
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    args = workload(n)
+    tables = foosball.rating_tables()
+    assert all(update_rating_direct(*a) == foosball.update_rating(*a) for a in args[:20000])
+    direct = timed(update_rating_direct, args)
+    table = timed(foosball.update_rating, args)
+    print(f"update_rating x{n}: direct {direct:.3f}s, tables {table:.3f}s ({direct / table:.2f}x)")
+
+    curr = np.array([a[0] for a in args], dtype=np.float64)
+    opp = np.array([a[2] for a in args], dtype=np.float64)
+    t0 = time.perf_counter()
+    direct_expected = 1.0 / (1.0 + np.power(10.0, (opp - curr) / 400.0))
+    direct_adjust = np.array([adj for _, adj in foosball.RATING_PROTECTION_THRESHOLDS] + [0], dtype=np.float64)[
+        np.searchsorted(np.array([t for t, _ in foosball.RATING_PROTECTION_THRESHOLDS]), curr, side="left")]
+    direct = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    table_expected = tables.expected_array(opp - curr)
+    table_adjust = tables.protection_array(curr)
+    table = time.perf_counter() - t0
+    mismatches = int(np.count_nonzero(direct_expected != table_expected))
+    assert np.array_equal(direct_adjust, table_adjust)
+    print(f"vectorized x{n}: np.power {direct:.4f}s, tables {table:.4f}s ({direct / table:.2f}x); "
+          f"np.power differs from math.pow in {mismatches} of {n} expected scores")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# Wall-clock startup of the headless entry points, against importing tkinter.
+#   python benchmarks/bench_startup.py [runs]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CASES = [
+    ("python (baseline)", [sys.executable, "-c", "pass"]),
+    ("import foosball", [sys.executable, "-c", "import foosball"]),
+    ("import tkinter", [sys.executable, "-c", "import tkinter, tkinter.scrolledtext, tkinter.messagebox"]),
+    ("foosball.py -c best", [sys.executable, os.path.join(ROOT, "foosball.py"), "-c", "best"]),
+]
+
+
+def time_case(argv, runs, cwd, env):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(argv, cwd=cwd, env=env, stdout=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples), min(samples)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure warm starts from cached bytecode
+    with tempfile.TemporaryDirectory() as cwd:
+        # Work on a copy so elo.journal/elo.history land in the temp dir.
+        with open(os.path.join(ROOT, "elo.txt"), "rb") as src, open(os.path.join(cwd, "elo.txt"), "wb") as dst:
+            dst.write(src.read())
+        print(f"{'case':<22} {'median ms':>10} {'min ms':>8}")
+        for name, argv in CASES:
+            median, best = time_case(argv, runs, cwd, env)
+            print(f"{name:<22} {median * 1000:>10.1f} {best * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Stress test for SHARED_MODE: several processes record games into one elo.txt at the same
+# time, each saving under the lock after every game (or every --batch games). Afterwards
+# every game must be in elo.txt: total "played" grows by exactly one per player per game,
+# however often a station had to rebase onto another's save.
+#   python benchmarks/stress_shared.py [--procs 4] [--games 200] [--batch 1] [--players 40]
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from bench_league import make_games, make_league  # noqa: E402
+
+
+def station(index, games, batch, players, seed):
+    # Runs in the child process, inside the shared directory. Prints "<rebases> <seconds>".
+    import foosball
+
+    foosball.SHARED_MODE = True
+    foosball.BINARY_SNAPSHOT = False
+    rebases = 0
+    refresh = foosball.refresh_from_disk
+
+    def counted():
+        nonlocal rebases
+        reloaded = refresh()
+        rebases += reloaded
+        return reloaded
+
+    foosball.refresh_from_disk = counted
+    foosball.load_data()
+    stream = make_games(players, games, seed + index, new_players=0)
+    t0 = time.perf_counter()
+    for start in range(0, len(stream), batch):
+        if batch == 1:
+            foosball.run_command(stream[start])
+        else:
+            foosball.process_games(stream[start:start + batch])
+    seconds = time.perf_counter() - t0
+    foosball.shutdown(save=False)
+    print(rebases, seconds)
+
+
+def total_played(path):
+    total = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split(",")
+            if len(parts) > 3:
+                total += int(parts[3])
+    return total
+
+
+def slots(command):
+    # Players in one game command: everything but the win-type word, split on , and ;
+    words = command.split()
+    return sum(len([n for n in word.replace(";", ",").split(",") if n]) for word in (words[0], words[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Several processes sharing one elo.txt in --shared mode.")
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--games", type=int, default=200, help="games per process")
+    parser.add_argument("--batch", type=int, default=1, help="games per save (process_games) instead of one at a time")
+    parser.add_argument("--players", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        station(args.child, args.games, args.batch, args.players, args.seed)
+        return 0
+    import foosball
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as cwd:
+        with open(os.path.join(cwd, foosball.FILE_NAME), "wb") as f:
+            f.write(make_league(args.players, args.seed))
+        path = os.path.join(cwd, foosball.FILE_NAME)
+        before = total_played(path)
+        expected = sum(slots(command) for i in range(args.procs)
+                       for command in make_games(args.players, args.games, args.seed + i, new_players=0))
+        cmd = [sys.executable, os.path.abspath(__file__), "--games", str(args.games), "--batch", str(args.batch),
+               "--players", str(args.players), "--seed", str(args.seed), "--child"]
+        t0 = time.perf_counter()
+        children = [subprocess.Popen(cmd + [str(i)], cwd=cwd, env=env, stdout=subprocess.PIPE, text=True)
+                    for i in range(args.procs)]
+        outputs = [child.communicate()[0].split() for child in children]
+        wall = time.perf_counter() - t0
+        if any(child.returncode for child in children):
+            print("a station failed")
+            return 1
+        after = total_played(path)
+    games = args.procs * args.games
+    rebases = sum(int(out[0]) for out in outputs)
+    print(f"{args.procs} processes x {args.games} games (batch {args.batch}): {wall:.2f}s wall, "
+          f"{games / wall:.0f} games/s, {rebases} rebases")
+    if after - before != expected:
+        print(f"LOST GAMES: played grew by {after - before}, expected {expected}")
+        return 1
+    print(f"ok: played grew by {expected}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
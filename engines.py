@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# Rating engines behind process_game. GamePlan asks the engine (foosball.rating_engine(),
+# chosen by RATING_ENGINE or --engine) for each player's new rating, then tells it about the
+# committed game; undo, combine and saving go through it as well.
+#
+#   elo      The original rules: update_rating after every game (the default).
+#   glicko2  Glicko-2 per player and role: rating, rating deviation (RD) and volatility.
+#            Games are collected during a rating period (GLICKO_PERIOD, a day by default)
+#            and rated together when it ends, in one vectorized update over every player;
+#            until then ratings don't move. A player's RD shrinks as they play and grows
+#            while they don't, so "Preston, 1 game" shows up as 600 ± 250 rather than 600.
+#            Results are weighted by the win-type multiplier. State lives in GLICKO_FILE.
+#   python engines.py [elo.glicko]    (ratings with RD, most certain first)
+#   python engines.py --check         (vectorized volatility step against a scalar one)
+import math
+import os
+import sys
+import time
+from array import array
+
+import foosball
+
+GLICKO_SCALE = 400 / math.log(10)  # 173.7178: Glicko-2 units per rating point
+GLICKO_RD_NEW = 350.0
+GLICKO_RD_MIN = 30.0
+GLICKO_VOLATILITY = 0.06
+GLICKO_TAU = 0.5  # how fast volatility may change
+ROLES = ("offense", "defense")
+
+
+class EloEngine:
+    name = "elo"
+    period_based = False
+    pending = ()
+
+    def update(self, key, role, old, score, opponent, multiplier):
+        return foosball.update_rating(old, score, opponent, multiplier)
+
+    def record_game(self, entry, plan, opponents):
+        pass
+
+    def revert(self, entry):
+        pass
+
+    def combine(self, src, dest):
+        pass
+
+    def deviation(self, key, role):
+        return None
+
+    def due(self, now=None):
+        return False
+
+    def end_period(self, now=None):
+        return None
+
+    def load(self, fingerprint):
+        return True
+
+    def save(self, fingerprint):
+        pass
+
+
+class Glicko2Engine:
+    name = "glicko2"
+    period_based = True
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}  # (key, role) -> row in the columns below
+        self.rating = array("d")
+        self.rd = array("d")
+        self.vol = array("d")
+        self.pending = []  # [entry or None, [(row, opponent rating, opponent RD, score, weight), ...]]
+        self.period_start = time.time()
+
+    # State
+
+    def row(self, key, role):
+        row = self.index.get((key, role))
+        if row is None:
+            # First time this engine sees the player: start from their current rating, with the
+            # RD that `played` games against equal opponents would leave (350 for a new player).
+            played = foosball.players[key]["played"] if key in foosball.players else 0
+            row = self.index[key, role] = len(self.rating)
+            self.rating.append(foosball.players[key][role] if key in foosball.players else foosball.RATING_MIN)
+            self.rd.append(self.starting_rd(played))
+            self.vol.append(GLICKO_VOLATILITY)
+        return row
+
+    @staticmethod
+    def starting_rd(played):
+        information = 1 / GLICKO_RD_NEW ** 2 + played * 0.25 / GLICKO_SCALE ** 2
+        return max(GLICKO_RD_MIN, 1 / math.sqrt(information))
+
+    def deviation(self, key, role):
+        row = self.index.get((key, role))
+        return self.rd[row] if row is not None else self.starting_rd(foosball.players[key]["played"] if key in foosball.players else 0)
+
+    # Games
+
+    def update(self, key, role, old, score, opponent, multiplier):
+        # Ratings only move when the period ends.
+        return old, 0
+
+    def record_game(self, entry, plan, opponents):
+        # Each slot is one result against the other side's player(s) in the matching role, as in
+        # Elo; a side of two counts as one opponent with the mean rating and RMS deviation.
+        def deviation(team, role):
+            rds = [self.rd[self.row(key, r)] for key, r, t in plan.slots if t == team and r == role]
+            return math.sqrt(sum(rd * rd for rd in rds) / len(rds)) if rds else None
+
+        weight = foosball.WIN_TYPE_MULTIPLIERS[plan.win_type]
+        results = []
+        for (key, role, team), opponent in zip(plan.slots, opponents):
+            other = 1 - team
+            wanted = "defense" if role == "offense" else "offense"
+            rd = deviation(other, wanted)
+            if rd is None:
+                rd = deviation(other, role)
+            results.append((self.row(key, role), opponent, rd, 1 - team, weight))
+        self.pending.append([entry, results])
+
+    def revert(self, entry):
+        for i in range(len(self.pending) - 1, -1, -1):
+            if self.pending[i][0] is entry:
+                del self.pending[i]
+                return
+
+    def combine(self, src, dest):
+        # The merged player keeps dest's history; their ratings come from merge_record.
+        for role in ROLES:
+            row = self.row(dest, role)
+            self.rating[row] = foosball.players[dest][role]
+            old = self.index.pop((src, role), None)
+            if old is not None:
+                self.rd[row] = min(self.rd[row], self.rd[old])
+                for _, results in self.pending:
+                    results[:] = [(row if r == old else r, *rest) for r, *rest in results]
+
+    # Rating periods
+
+    def due(self, now=None):
+        return (time.time() if now is None else now) - self.period_start >= foosball.GLICKO_PERIOD
+
+    def end_period(self, now=None):
+        # Rates every pending game at once and returns the keys whose ratings changed.
+        import numpy as np
+
+        self.period_start = time.time() if now is None else now
+        n = len(self.rating)
+        if not n:
+            self.pending = []
+            return []
+        mu = (np.frombuffer(self.rating, dtype=np.float64) - 1500) / GLICKO_SCALE
+        phi = np.frombuffer(self.rd, dtype=np.float64) / GLICKO_SCALE
+        sigma = np.frombuffer(self.vol, dtype=np.float64)
+        results = [r for _, game in self.pending for r in game]
+        self.pending = []
+        played = np.zeros(n, dtype=bool)
+        new_mu, new_phi = mu.copy(), np.sqrt(phi ** 2 + sigma ** 2)
+        if results:
+            rows, opp, opp_rd, score, weight = (np.array(column) for column in zip(*results))
+            rows = rows.astype(np.int64)
+            opp_mu = (opp - 1500) / GLICKO_SCALE
+            g = 1 / np.sqrt(1 + 3 * (opp_rd / GLICKO_SCALE) ** 2 / math.pi ** 2)
+            expected = 1 / (1 + np.exp(-g * (mu[rows] - opp_mu)))
+            info = np.bincount(rows, weights=weight * g * g * expected * (1 - expected), minlength=n)
+            gain = np.bincount(rows, weights=weight * g * (score - expected), minlength=n)
+            played = info > 0
+            v = 1 / info[played]
+            delta = v * gain[played]
+            sig = self.volatility(phi[played], sigma[played], v, delta)
+            phi_star = np.sqrt(phi[played] ** 2 + sig ** 2)
+            p = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+            new_mu[played] = mu[played] + p * p * gain[played]
+            new_phi[played] = p
+            sigma[played] = sig
+        rating = np.clip(1500 + new_mu * GLICKO_SCALE, foosball.RATING_MIN, foosball.RATING_MAX)
+        np.frombuffer(self.rating, dtype=np.float64)[:] = rating
+        np.frombuffer(self.rd, dtype=np.float64)[:] = np.clip(new_phi * GLICKO_SCALE, GLICKO_RD_MIN, GLICKO_RD_NEW)
+        changed = set()
+        for (key, role), row in self.index.items():
+            if played[row] and key in foosball.players:
+                value = int(round(rating[row]))
+                if foosball.players[key][role] != value:
+                    foosball.players[key][role] = value
+                    changed.add(key)
+        return sorted(changed)
+
+    @staticmethod
+    def volatility(phi, sigma, v, delta):
+        # Step 5 of Glickman's Glicko-2 paper (the Illinois method), for every player at once.
+        # f's root is the new log variance; A and B bracket it while a0 stays where f needs it.
+        import numpy as np
+
+        a0 = np.log(sigma ** 2)
+        tau2 = GLICKO_TAU ** 2
+
+        def f(x):
+            ex = np.exp(x)
+            return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a0) / tau2
+
+        big = delta ** 2 > phi ** 2 + v
+        k = np.ones_like(a0)
+        low = ~big & (f(a0 - k * GLICKO_TAU) < 0)
+        while low.any():
+            k[low] += 1
+            low &= f(a0 - k * GLICKO_TAU) < 0
+        A = a0.copy()
+        B = np.where(big, np.log(np.where(big, delta ** 2 - phi ** 2 - v, 1.0)), a0 - k * GLICKO_TAU)
+        fA, fB = f(A), f(B)
+        for _ in range(100):
+            active = np.abs(B - A) > 1e-6
+            if not active.any():
+                break
+            C = np.where(active, A + (A - B) * fA / np.where(active, fB - fA, 1.0), B)
+            fC = f(C)
+            swap = fC * fB <= 0
+            A = np.where(active & swap, B, A)
+            fA = np.where(active, np.where(swap, fB, fA / 2), fA)
+            B = np.where(active, C, B)
+            fB = np.where(active, fC, fB)
+        return np.exp(A / 2)
+
+    @staticmethod
+    def volatility_reference(phi, sigma, v, delta):
+        # The same step for one player, written out as in the paper; for --check.
+        a0 = math.log(sigma ** 2)
+        tau2 = GLICKO_TAU ** 2
+
+        def f(x):
+            ex = math.exp(x)
+            return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a0) / tau2
+
+        A = a0
+        if delta ** 2 > phi ** 2 + v:
+            B = math.log(delta ** 2 - phi ** 2 - v)
+        else:
+            k = 1
+            while f(a0 - k * GLICKO_TAU) < 0:
+                k += 1
+            B = a0 - k * GLICKO_TAU
+        fA, fB = f(A), f(B)
+        while abs(B - A) > 1e-6:
+            C = A + (A - B) * fA / (fB - fA)
+            fC = f(C)
+            if fC * fB <= 0:
+                A, fA = B, fB
+            else:
+                fA /= 2
+            B, fB = C, fC
+        return math.exp(A / 2)
+
+    # Persistence: the elo.txt it was saved with, the period start, one line per player and
+    # role, then the pending results numbered by game.
+
+    def load(self, fingerprint):
+        # Returns False if the file was saved with some other elo.txt than `fingerprint`.
+        self.__init__(self.path)
+        if not os.path.exists(self.path):
+            return True
+        base = None
+        rows = {}
+        game = None
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if parts[0] == "base":
+                    base = parts[1]
+                elif parts[0] == "period":
+                    self.period_start = float(parts[1])
+                elif parts[0] == "s":
+                    _, key, role, rating, rd, vol = parts
+                    if key not in foosball.players:
+                        continue
+                    rows[key, role] = self.index[key, role] = len(self.rating)
+                    # elo.txt wins if the two disagree (e.g. ratings changed under the Elo engine).
+                    visible = foosball.players[key][role]
+                    self.rating.append(float(rating) if round(float(rating)) == visible else visible)
+                    self.rd.append(float(rd))
+                    self.vol.append(float(vol))
+                elif parts[0] == "r":
+                    number, key, role, opp, opp_rd, score, weight = parts[1:]
+                    if (key, role) not in rows:
+                        continue
+                    if number != game:
+                        game = number
+                        self.pending.append([None, []])  # saved games can't be undone
+                    self.pending[-1][1].append((rows[key, role], float(opp), float(opp_rd), int(score), float(weight)))
+        return base == fingerprint
+
+    def save(self, fingerprint):
+        lines = [f"base\t{fingerprint}\n", f"period\t{self.period_start}\n"]
+        keys = {row: key for key, row in self.index.items()}
+        for (key, role), row in self.index.items():
+            lines.append(f"s\t{key}\t{role}\t{self.rating[row]!r}\t{self.rd[row]!r}\t{self.vol[row]!r}\n")
+        for number, (_, results) in enumerate(self.pending):
+            for row, opp, opp_rd, score, weight in results:
+                key, role = keys[row]
+                lines.append(f"r\t{number}\t{key}\t{role}\t{opp!r}\t{opp_rd!r}\t{score}\t{weight!r}\n")
+        foosball.atomic_write(self.path, "".join(lines).encode("utf-8"))
+
+
+def make_engine(name):
+    if name == "elo":
+        return EloEngine()
+    if name == "glicko2":
+        return Glicko2Engine(foosball.GLICKO_FILE)
+    raise ValueError(f"Unknown rating engine '{name}'. Use elo or glicko2.")
+
+
+def check(cases=2000, seed=1):
+    # Glickman's worked example, then random players on both sides of delta^2 > phi^2 + v.
+    import random
+
+    import numpy as np
+
+    rng = random.Random(seed)
+    rows = [(1.1513, 0.06, 1.7785, -0.4834)]
+    for _ in range(cases):
+        rows.append((rng.uniform(0.15, 2.0), rng.uniform(0.03, 0.1), rng.uniform(0.3, 20.0), rng.uniform(-8.0, 8.0)))
+    phi, sigma, v, delta = (np.array(column) for column in zip(*rows))
+    got = Glicko2Engine.volatility(phi, sigma, v, delta)
+    want = np.array([Glicko2Engine.volatility_reference(*row) for row in rows])
+    big = int((delta ** 2 > phi ** 2 + v).sum())
+    worst = float(np.max(np.abs(got - want) / want))
+    ok = worst < 1e-6 and abs(got[0] - 0.05999) < 1e-5
+    print(f"{len(rows)} cases ({big} with delta^2 > phi^2 + v): worst relative error {worst:.2e}, "
+          f"volatility {got.min():.4f}..{got.max():.4f}, example {got[0]:.5f}")
+    print("OK" if ok else "MISMATCH")
+    return 0 if ok else 1
+
+
+def main():
+    if sys.argv[1:] == ["--check"]:
+        return check()
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    foosball.load_data()
+    engine = Glicko2Engine(path or foosball.GLICKO_FILE)
+    engine.load(None)
+    rows = sorted(engine.index.items(), key=lambda item: engine.rd[item[1]])
+    for (key, role), row in rows:
+        print(f"{foosball.players[key]['display']:<20} {role:<8} {engine.rating[row]:7.1f} ± {engine.rd[row]:5.1f}  vol {engine.vol[row]:.4f}")
+    foosball.shutdown(save=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Static leaderboard export for index.html, written by save_data when EXPORT_DIR is set
+# (python foosball.py --export board). The directory holds:
+#   leaderboard.json   {"version": base, "players": [row, ...]} in "pp" order, with "no"
+#   delta-<v>.json     {"version": v, "players": [row, ...], "removed": [key, ...]}, one per save
+#   manifest.json      {"version": latest, "base": base, "fingerprint": elo.txt it reflects}
+# A save only writes the rows of the players changed since the previous save, plus the
+# manifest; the full board is rewritten when the delta chain gets long (COMPACT_AFTER), or
+# when the directory doesn't reflect the elo.txt this process started from. Pages keep the
+# board they last saw and fetch just delta-<their version + 1> ... delta-<latest>.
+#   python export.py DIR    (full export of elo.txt into DIR)
+import json
+import os
+import sys
+
+import foosball
+
+MANIFEST = "manifest.json"
+BOARD = "leaderboard.json"
+COMPACT_AFTER = 200  # deltas since the last full board before writing a new one
+
+
+def player_json(key):
+    data = foosball.players[key]
+    played = data["played"]
+    return {
+        "key": key,
+        "name": data["display"],
+        "avg": data["avg"],
+        "offense": data["offense"],
+        "defense": data["defense"],
+        "played": played,
+        "wins": data["wins"],
+        "win_rate": round((data["wins"] / played) * 100) if played > 0 else 0,
+        "rank": foosball.highest_overall_rank(key) + foosball.get_rank_indicator(key),
+        "rank_d": data["rank_d"],
+        "rank_o": data["rank_o"],
+        "rank_a": data["rank_a"],
+    }
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, payload):
+    foosball.atomic_write(path, json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def write_full(directory, version, fingerprint, old=None):
+    rows = [dict(player_json(key), no=idx) for idx, key in enumerate(foosball.leaderboard.keys(), start=1)]
+    write_json(os.path.join(directory, BOARD), {"version": version, "players": rows})
+    write_json(os.path.join(directory, MANIFEST), {"version": version, "base": version, "fingerprint": fingerprint})
+    if old is not None:
+        # Deltas on top of the previous board are no use to anyone now.
+        for v in range(old["base"] + 1, old["version"] + 1):
+            try:
+                os.remove(os.path.join(directory, f"delta-{v}.json"))
+            except OSError:
+                pass
+
+
+def publish(directory, fingerprint, base, changed):
+    # fingerprint: the elo.txt just written. base: the elo.txt the `changed` keys are counted
+    # from, or None when that is unknown (a fresh load merged other changes, etc.).
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    if manifest is None:
+        write_full(directory, 1, fingerprint)
+        return
+    if manifest.get("fingerprint") == fingerprint:
+        return  # already published
+    version = manifest["version"] + 1
+    if base is None or manifest.get("fingerprint") != base or version - manifest["base"] > COMPACT_AFTER:
+        write_full(directory, version, fingerprint, manifest)
+        return
+    rows = []
+    removed = []
+    for key in sorted(changed):
+        if key in foosball.players:
+            rows.append(player_json(key))
+        else:
+            removed.append(key)
+    write_json(os.path.join(directory, f"delta-{version}.json"), {"version": version, "players": rows, "removed": removed})
+    write_json(os.path.join(directory, MANIFEST), {"version": version, "base": manifest["base"], "fingerprint": fingerprint})
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("usage: export.py DIR")
+        return 2
+    foosball.load_data()
+    data = foosball.format_data()
+    directory = sys.argv[1]
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    write_full(directory, manifest["version"] + 1 if manifest else 1, foosball.snapshot_fingerprint(data), manifest)
+    foosball.shutdown(save=False)
+    print(f"Exported {len(foosball.players)} players to {directory}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
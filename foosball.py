@@ -1,14 +1,43 @@
 #!/usr/bin/env python3
-import math
+import bisect
+import collections
+import contextlib
 import os
 import re
 import random
 import string
-import tkinter as tk
-from tkinter import scrolledtext, messagebox, OptionMenu, StringVar
+import sys
+import threading
+import time
+import zlib
+
+from aliases import AliasTable
+from player_store import PlayerStore
+from rating_table import RatingTables, expected_score
+from series import RatingSeries
+from snapshot import Snapshot, SnapshotError, fsync_dir, source_stat, write_snapshot
 
 # Global constants
 FILE_NAME = "elo.txt"
+JOURNAL_FILE = "elo.journal"
+JOURNAL_MODE = True  # append games to JOURNAL_FILE, rewrite FILE_NAME only every SNAPSHOT_EVERY games
+SNAPSHOT_EVERY = 100
+JOURNAL_GROUP_COMMIT = 8  # journal records per fsync
+SUGGESTION_LIMIT = 20  # autocomplete entries shown under the command entry
+JOURNAL_SYNC_INTERVAL = 2.0  # max seconds a written record waits for its fsync
+SNAPSHOT_FILE = "elo.snap"  # binary copy of elo.txt, mmapped at startup (see snapshot.py)
+BINARY_SNAPSHOT = True
+ALIAS_FILE = "elo.alias"  # names merged into other players, so they resolve there (see aliases.py)
+HISTORY_FILE = "elo.history"  # every game/combine ever recorded, for replay.py
+SERIES_FILE = "elo.series"  # timestamped rating points per player and role (see series.py)
+HISTORY_BUCKETS = 12  # rows in the "history <name>" chart
+EXPORT_DIR = None  # if set, every save also publishes the board as JSON there for index.html (see export.py)
+UNDO_LIMIT = 1000  # most recent games that "undo" can take back
+SHARED_MODE = False  # several processes share FILE_NAME: save every change under LOCK_FILE (see save_data)
+LOCK_FILE = "elo.lock"
+RATING_ENGINE = "elo"  # "elo", or "glicko2": ratings with uncertainty, updated once per rating period (see engines.py)
+GLICKO_FILE = "elo.glicko"  # glicko2 ratings, deviations and the games of the current period
+GLICKO_PERIOD = 86400  # seconds per glicko2 rating period; "period" ends one early
 K_FACTOR = 32
 RATING_MIN = 100  # default starting rating
 RATING_MAX = 2999  # maximum rating (not passing PEAK)
@@ -84,11 +113,17 @@ RANK_INITIAL = {
 # Create an inverse dictionary to convert an initial letter back to a full rank name.
 RANK_FULL = {v: k for k, v in RANK_INITIAL.items()}
 
-players = {}
+players = PlayerStore(RANK_ORDER)
+aliases = AliasTable()
 
-def canonicalize(name):
+def normalize_name(name):
     return ''.join(c for c in name.lower() if c.isalnum())
 
+def canonicalize(name):
+    # The player key for a name: normalized, then through the alias table.
+    key = normalize_name(name)
+    return aliases.resolve(key) if aliases.parent else key
+
 def get_hidden_rank():
     letters = string.ascii_lowercase
     return "L" + ''.join(random.choice(letters) for _ in range(4)) + "Z" + ''.join(random.choice(letters) for _ in range(4))
@@ -103,17 +138,17 @@ def get_rank_display(rank):
     return rank
 
 def get_computed_rank(score):
-    for threshold, rank in RANK_THRESHOLDS:
-        if score >= threshold:
-            return rank
-    return "iron"
+    return rating_tables().computed_rank(score)
 
 def update_player_avg(key):
     data = players[key]
     data["avg"] = round((data["offense"] + data["defense"]) / 2)
 
 def update_player_ranks(key):
-    rec = players[key]
+    upgrade_ranks(players[key])
+
+def upgrade_ranks(rec):
+    # Un-droppable ranks: works on any player record, live or simulated.
     new_o = get_computed_rank(rec["offense"])
     new_d = get_computed_rank(rec["defense"])
     new_a = get_computed_rank(rec["avg"])
@@ -155,6 +190,164 @@ def get_rank_indicator(key):
     else:
         return "(a)"
 
+def highest_visible_rank(data):
+    # Full name of the player's best shown rank ("pp <rank>" bucket). Initials count as their
+    # rank, as in get_rank_order; codes this file doesn't know put the player in no bucket.
+    ranks = [RANK_FULL.get(r, r) for r in (data.get("rank_o", "iron"), data.get("rank_d", "iron"), data.get("rank_a", "iron"))]
+    valid_player_ranks = [r for r in ranks if r not in (HIDDEN_RANK, SPECIAL_IM) and RANK_ORDER.get(r) is not None]
+    if not valid_player_ranks:
+        return None
+    return max(valid_player_ranks, key=RANK_ORDER.get)
+
+class SortedBlocks:
+    # Sorted list kept as a list of blocks: bisect over the block maxima, then inside one block,
+    # so add/remove never shift more than one block.
+    BLOCK_SIZE = 256
+
+    def __init__(self):
+        self.blocks = []
+        self.maxes = []
+        self.size = 0
+
+    def add(self, item):
+        self.size += 1
+        if not self.blocks:
+            self.blocks.append([item])
+            self.maxes.append(item)
+            return
+        i = bisect.bisect_left(self.maxes, item)
+        if i == len(self.blocks):
+            i -= 1
+            self.blocks[i].append(item)
+            self.maxes[i] = item
+        else:
+            bisect.insort(self.blocks[i], item)
+        block = self.blocks[i]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            half = block[self.BLOCK_SIZE:]
+            del block[self.BLOCK_SIZE:]
+            self.blocks.insert(i + 1, half)
+            self.maxes[i] = block[-1]
+            self.maxes.insert(i + 1, half[-1])
+
+    def remove(self, item):
+        i = bisect.bisect_left(self.maxes, item)
+        block = self.blocks[i]
+        del block[bisect.bisect_left(block, item)]
+        self.size -= 1
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i]
+            del self.maxes[i]
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def iter_from(self, item):
+        # Items >= item, in order.
+        i = bisect.bisect_left(self.maxes, item)
+        if i == len(self.blocks):
+            return
+        block = self.blocks[i]
+        yield from block[bisect.bisect_left(block, item):]
+        for block in self.blocks[i + 1:]:
+            yield from block
+
+    def __len__(self):
+        return self.size
+
+class CompletionIndex:
+    # Case-insensitive prefix lookup for the command entry: commands, win types, ranks and player names.
+    def __init__(self, fixed_words):
+        self.counts = {}
+        self.words = SortedBlocks()
+        for word in fixed_words:
+            self.add(word)
+
+    def add(self, word):
+        count = self.counts.get(word, 0)
+        self.counts[word] = count + 1
+        if not count:
+            self.words.add((word.lower(), word))
+
+    def remove(self, word):
+        count = self.counts.get(word, 0)
+        if count > 1:
+            self.counts[word] = count - 1
+        elif count:
+            del self.counts[word]
+            self.words.remove((word.lower(), word))
+
+    def match(self, prefix, limit=SUGGESTION_LIMIT):
+        prefix = prefix.lower()
+        matching = []
+        for lower, word in self.words.iter_from((prefix, "")):
+            if not lower.startswith(prefix) or len(matching) >= limit:
+                break
+            matching.append(word)
+        return matching
+
+COMMAND_WORDS = ["pp", "best", "combine", "name", "to", "match", "whatif", "undo", "stats", "profile", "period", "alias"]
+
+completions = CompletionIndex(COMMAND_WORDS + list(WIN_TYPE_MULTIPLIERS) + [rank for _, rank in RANK_THRESHOLDS])
+
+class Leaderboard:
+    # Players ordered by (-avg, display), overall and per highest visible rank ("pp <rank>").
+    # Whatever changes a player's avg, ranks or display calls update(key).
+    def __init__(self):
+        self.entries = {}
+        self.all = SortedBlocks()
+        self.by_rank = {rank: SortedBlocks() for _, rank in RANK_THRESHOLDS}
+
+    def update(self, key):
+        data = players[key]
+        new = ((-data["avg"], data["display"], key), highest_visible_rank(data))
+        old = self.entries.get(key)
+        if old == new:
+            return
+        if old is not None:
+            self.discard(old)
+            if old[0][1] != new[0][1]:
+                completions.remove(old[0][1])
+                completions.add(new[0][1])
+        else:
+            completions.add(new[0][1])
+        self.entries[key] = new
+        self.all.add(new[0])
+        if new[1] is not None:
+            self.by_rank[new[1]].add(new[0])
+
+    def remove(self, key):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.discard(old)
+            completions.remove(old[0][1])
+
+    def discard(self, old):
+        self.all.remove(old[0])
+        if old[1] is not None:
+            self.by_rank[old[1]].remove(old[0])
+
+    def rebuild(self):
+        for key in list(self.entries):
+            self.remove(key)
+        for key in players:
+            self.update(key)
+
+    def sync(self):
+        # Cheap guard for code that replaces the players dict wholesale, and for lazily loaded players.
+        if len(self.entries) != len(players):
+            self.rebuild()
+
+    def keys(self, rank=None):
+        self.sync()
+        source = self.all if rank is None else self.by_rank[rank]
+        return [entry[2] for entry in source]
+
+leaderboard = Leaderboard()
+
 def merge_record(key, new_display, off, deff, played, wins, rank_d=None, rank_o=None, rank_a=None):
     old = players[key]
     total_played = old["played"] + played
@@ -179,6 +372,7 @@ def merge_record(key, new_display, off, deff, played, wins, rank_d=None, rank_o=
         "rank_o": choose_rank(old.get("rank_o", "iron"), rank_o if rank_o else get_computed_rank(new_off)),
         "rank_a": choose_rank(old.get("rank_a", "iron"), rank_a if rank_a else get_computed_rank(round((new_off + new_def) / 2)))
     }
+    leaderboard.update(key)
 
 def get_or_create_player(name):
     key = canonicalize(name)
@@ -194,6 +388,7 @@ def get_or_create_player(name):
             "rank_o": get_computed_rank(RATING_MIN),
             "rank_a": get_computed_rank(RATING_MIN)
         }
+        leaderboard.update(key)
         #Larry's Special Processing part
         #if "zhong" in key:
             #players[key]["rank_d"] = HIDDEN_RANK
@@ -201,62 +396,443 @@ def get_or_create_player(name):
             #players[key]["rank_a"] = HIDDEN_RANK
     return players[key]
 
-def load_data():
-    if not os.path.exists(FILE_NAME):
+def atomic_write(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path)
+
+def snapshot_fingerprint(data):
+    return f"{zlib.crc32(data):08x}:{len(data)}"
+
+class MatchJournal:
+    # Append-only log of game/combine commands applied since the last snapshot (elo.txt).
+    # The first line names the snapshot it builds on, so a journal left behind by a crash
+    # between writing a new snapshot and truncating the log is recognised as stale.
+    # Records are fsynced in groups of JOURNAL_GROUP_COMMIT; a timer syncs the rest of a
+    # group once JOURNAL_SYNC_INTERVAL is up, so the end of a burst isn't left waiting.
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.base = None
+        self.count = 0
+        self.pending = 0
+        self.last_sync = 0.0
+        self.replaying = False
+        self.lock = threading.RLock()  # the timer syncs from its own thread
+        self.timer = None
+
+    def replay(self, base):
+        self.base = base
+        self.count = 0
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        # Anything after the last newline is a torn write from a crash.
+        lines = lines[:-1]
+        if not lines or lines[0] != "base\t" + base:
+            return 0
+        self.replaying = True
+        try:
+            for line in lines[1:]:
+                kind, _, cmd = line.partition("\t")
+                if kind == "g":
+                    process_game(cmd)
+                elif kind == "c":
+                    process_combine_command(cmd)
+                else:
+                    continue
+                self.count += 1
+        finally:
+            self.replaying = False
+        return self.count
+
+    def append(self, kind, command):
+        with self.lock:
+            if self.file is None:
+                self.open()
+            self.file.write(f"{kind}\t{command}\n")
+            self.file.flush()
+            self.count += 1
+            self.pending += 1
+            wait = JOURNAL_SYNC_INTERVAL - (time.monotonic() - self.last_sync)
+            if self.pending >= JOURNAL_GROUP_COMMIT or wait <= 0:
+                self.sync()
+            elif self.timer is None:
+                self.timer = threading.Timer(wait, self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def open(self):
+        if self.count and os.path.exists(self.path):
+            self.file = open(self.path, "a", encoding="utf-8")
+            return
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.file.write("base\t" + (self.base or snapshot_fingerprint(b"")) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        fsync_dir(self.path)
+        self.count = 0
+        self.last_sync = time.monotonic()
+
+    def sync(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.file is not None and self.pending:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            self.pending = 0
+            self.last_sync = time.monotonic()
+
+    def reset(self, base):
+        # Called once a snapshot covering every journaled record is safely on disk.
+        self.close()
+        self.base = base
+        self.count = 0
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.sync()
+                self.file.close()
+                self.file = None
+
+journal = MatchJournal(JOURNAL_FILE)
+
+history_file = None
+
+def open_history():
+    # The history starts with the roster as it was when it was created ("p" lines, exact wins),
+    # followed by every game ("g"), combine ("c") and undo ("u") recorded since.
+    global history_file
+    if history_file is not None:
         return
-    with open(FILE_NAME, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip().rstrip(".")
-            if not line:
-                continue
-            parts = [x.strip() for x in line.split(",")]
-            if len(parts) < 5:
-                continue
-            disp = parts[0]
-            canon = canonicalize(disp)
-            try:
-                off = int(parts[1])
-                deff = int(parts[2])
-                played = int(parts[3])
-                win_rate = int(parts[4])
-            except ValueError:
-                continue
-            wins = round((win_rate / 100) * played) if played > 0 else 0
-            avg = int(parts[5]) if len(parts) >= 6 and parts[5].isdigit() else round((off + deff) / 2)
-            rank_d = parts[6] if len(parts) >= 7 else None
-            rank_o = parts[7] if len(parts) >= 8 else None
-            rank_a = parts[8] if len(parts) >= 9 else None
-            if canon in players:
-                merge_record(canon, disp, off, deff, played, wins, rank_d, rank_o, rank_a)
-            else:
-                players[canon] = {
-                    "display": disp,
-                    "offense": off,
-                    "defense": deff,
-                    "played": played,
-                    "wins": wins,
-                    "avg": avg,
-                    "rank_d": rank_d if rank_d else get_computed_rank(deff),
-                    "rank_o": rank_o if rank_o else get_computed_rank(off),
-                    "rank_a": rank_a if rank_a else get_computed_rank(avg)
-                }
-                if "zhong" in canon:
-                    players[canon]["rank_d"] = HIDDEN_RANK
-                    players[canon]["rank_o"] = HIDDEN_RANK
-                    players[canon]["rank_a"] = HIDDEN_RANK
+    new = not os.path.exists(HISTORY_FILE)
+    history_file = open(HISTORY_FILE, "a", encoding="utf-8")
+    if new:
+        for key, data in players.items():
+            history_file.write("p\t" + "\t".join(str(data[field]) for field in ("display", "offense", "defense", "played", "wins", "rank_d", "rank_o", "rank_a")) + "\n")
+        history_file.flush()
 
-def save_data():
+def close_history():
+    global history_file
+    if history_file is not None:
+        history_file.close()
+        history_file = None
+    rating_series.close()
+
+rating_series = RatingSeries(SERIES_FILE)
+
+def record_points(kind, detail):
+    # A point for every rating a game changed (all three for new players); undo takes them back.
+    if kind == "g":
+        command, created, before, after = detail
+        old = dict(before)
+        for key, fields in after:
+            for role, idx in SERIES_ROLES:
+                if key not in old or old[key][idx] != fields[idx]:
+                    rating_series.record(key, role, fields[idx])
+    elif kind == "u":
+        for command, created, before, after in detail:
+            old = dict(before)
+            for key, fields in after:
+                for role, idx in SERIES_ROLES:
+                    if key not in old or old[key][idx] != fields[idx]:
+                        rating_series.retract(key, role, fields[idx])
+    elif kind == "c":
+        dest = detail[1]
+        for role, _ in SERIES_ROLES:
+            rating_series.record(dest, role, players[dest][role])
+    elif kind == "r":
+        for key in detail:
+            for role, _ in SERIES_ROLES:
+                rating_series.record(key, role, players[key][role])
+    elif kind == "a" and detail[2]:
+        for role, _ in SERIES_ROLES:
+            rating_series.record(detail[1], role, players[detail[1]][role])
+
+# Players changed since board_base, the elo.txt (fingerprint) the exported board was last brought up to.
+board_changed = set()
+board_base = None
+
+def mark_board(kind, detail):
+    if kind == "g":
+        board_changed.update(key for key, _ in detail[3])
+    elif kind == "u":
+        for entry in detail:
+            board_changed.update(key for key, _ in entry[3])
+    elif kind in ("c", "r"):
+        board_changed.update(detail)
+    elif kind == "a":
+        board_changed.update(detail[:2])
+
+def publish_board(fingerprint):
+    global board_base
+    from export import publish
+    publish(EXPORT_DIR, fingerprint, board_base, board_changed)
+    board_base = fingerprint
+    board_changed.clear()
+
+batch_depth = 0  # > 0 while process_games defers saving to the end of the batch
+
+dirty = False  # changes not yet in elo.txt
+
+data_version = 0  # bumped on every change and reload from disk; server.py uses it for ETags
+
+def record_change(kind, command, detail=None):
+    global dirty, data_version
+    data_version += 1
+    if EXPORT_DIR is not None:
+        mark_board(kind, detail)
+    if journal.replaying:
+        return
+    dirty = True
+    record_points(kind, detail)
+    if history_file is not None:
+        history_file.write(f"{kind}\t{command}\n")
+        if not batch_depth:
+            history_file.flush()
+            rating_series.flush()
+    if SHARED_MODE:
+        # Kept until it is in elo.txt, in case another station saves first and we have to rebase.
+        shared_pending.append((kind, command, detail))
+    if batch_depth:
+        return
+    if SHARED_MODE:
+        save_data()
+        return
+    if not JOURNAL_MODE:
+        if kind in ("g", "u", "r"):
+            save_data()
+        return
+    if kind in ("u", "r"):
+        # Undos rewrite elo.txt rather than being journaled: the games they take back may
+        # already be in elo.txt, and after a restart there is nothing to undo them against.
+        # The end of a rating period is saved at once too, together with GLICKO_FILE.
+        save_data()
+        return
+    journal.append(kind, command)
+    if journal.count >= SNAPSHOT_EVERY:
+        save_data()
+
+def load_text(raw):
+    for line in raw.decode("utf-8").splitlines():
+        line = line.strip().rstrip(".")
+        if not line:
+            continue
+        parts = [x.strip() for x in line.split(",")]
+        if len(parts) < 5:
+            continue
+        disp = parts[0]
+        canon = canonicalize(disp)
+        try:
+            off = int(parts[1])
+            deff = int(parts[2])
+            played = int(parts[3])
+            win_rate = int(parts[4])
+        except ValueError:
+            continue
+        wins = round((win_rate / 100) * played) if played > 0 else 0
+        avg = int(parts[5]) if len(parts) >= 6 and parts[5].isdigit() else round((off + deff) / 2)
+        rank_d = parts[6] if len(parts) >= 7 else None
+        rank_o = parts[7] if len(parts) >= 8 else None
+        rank_a = parts[8] if len(parts) >= 9 else None
+        if canon in players:
+            merge_record(canon, disp, off, deff, played, wins, rank_d, rank_o, rank_a)
+        else:
+            players[canon] = {
+                "display": disp,
+                "offense": off,
+                "defense": deff,
+                "played": played,
+                "wins": wins,
+                "avg": avg,
+                "rank_d": rank_d if rank_d else get_computed_rank(deff),
+                "rank_o": rank_o if rank_o else get_computed_rank(off),
+                "rank_a": rank_a if rank_a else get_computed_rank(avg)
+            }
+            if "zhong" in canon:
+                players[canon]["rank_d"] = HIDDEN_RANK
+                players[canon]["rank_o"] = HIDDEN_RANK
+                players[canon]["rank_a"] = HIDDEN_RANK
+            leaderboard.update(canon)
+
+def load_binary(fingerprint):
+    # Attach elo.snap if it was written from the elo.txt with this fingerprint; players decode lazily.
+    # (Its contents, not size and mtime: an edit within one mtime tick can keep both.)
+    if not BINARY_SNAPSHOT or players or not os.path.exists(SNAPSHOT_FILE):
+        return False
+    try:
+        snap = Snapshot(SNAPSHOT_FILE)
+    except (OSError, SnapshotError):
+        return False
+    if snap.fingerprint != fingerprint:
+        snap.close()
+        return False
+    players.attach(snap)
+    return True
+
+def load_data():
+    aliases.load(ALIAS_FILE)
+    raw = b""
+    if os.path.exists(FILE_NAME):
+        with open(FILE_NAME, "rb") as f:
+            raw = f.read()
+    fingerprint = snapshot_fingerprint(raw)
+    if not load_binary(fingerprint):
+        load_text(raw)
+    global disk_fingerprint, disk_stat, board_base
+    disk_fingerprint, disk_stat = fingerprint, source_stat(FILE_NAME)
+    board_base = fingerprint
+    board_changed.clear()
+    # Text records are resolved as they load; this catches elo.snap and an elo.txt older than elo.alias.
+    merge_aliased(list(aliases.parent))
+    rating_engine().load(fingerprint)
+    journal.replay(fingerprint)
+    open_history()
+
+def format_data():
     for key in players:
         update_player_avg(key)
         update_player_ranks(key)
-    sorted_players = sorted(players.items(), key=lambda kv: (-kv[1]["avg"], kv[1]["display"]))
-    with open(FILE_NAME, "w", encoding="utf-8") as f:
-        for key, data in sorted_players:
-            played = data["played"]
-            wins = data["wins"]
-            win_rate = round((wins / played) * 100) if played > 0 else 0
-            line = f"{data['display']}, {data['offense']}, {data['defense']}, {played}, {win_rate}, {data['avg']}, {data.get('rank_d', 'iron')}, {data.get('rank_o', 'iron')}, {data.get('rank_a', 'iron')}.\n"
-            f.write(line)
+        leaderboard.update(key)
+    lines = []
+    for key in leaderboard.keys():
+        data = players[key]
+        played = data["played"]
+        wins = data["wins"]
+        win_rate = round((wins / played) * 100) if played > 0 else 0
+        line = f"{data['display']}, {data['offense']}, {data['defense']}, {played}, {win_rate}, {data['avg']}, {data.get('rank_d', 'iron')}, {data.get('rank_o', 'iron')}, {data.get('rank_a', 'iron')}.\n"
+        lines.append(line)
+    return "".join(lines).encode("utf-8")
+
+def save_data():
+    if SHARED_MODE:
+        # Load-modify-save under the lock: pick up anything another station saved first.
+        with file_lock(LOCK_FILE):
+            refresh_from_disk()
+            write_data_files()
+    else:
+        write_data_files()
+
+def write_data_files():
+    global dirty, disk_fingerprint, disk_stat
+    if aliases.dirty:
+        # Before elo.txt: a reader that sees the new elo.txt must see its aliases too.
+        atomic_write(ALIAS_FILE, aliases.dump())
+        aliases.dirty = False
+    data = format_data()
+    atomic_write(FILE_NAME, data)
+    if BINARY_SNAPSHOT:
+        write_snapshot(SNAPSHOT_FILE, ((key, players[key]) for key in leaderboard.keys()), list(RANK_ORDER),
+                       snapshot_fingerprint(data), source_stat(FILE_NAME))
+    journal.reset(snapshot_fingerprint(data))
+    # After the journal reset: a crash in between loses the period's pending games rather than counting them twice.
+    rating_engine().save(snapshot_fingerprint(data))
+    disk_fingerprint = snapshot_fingerprint(data)
+    disk_stat = source_stat(FILE_NAME)
+    shared_pending.clear()
+    dirty = False
+    if EXPORT_DIR is not None:
+        publish_board(disk_fingerprint)
+
+# What this process last read or wrote as elo.txt, and its changes not in there yet (SHARED_MODE).
+disk_fingerprint = None
+disk_stat = None
+shared_pending = []  # (kind, command, its undo_stack entry for "g" / the entries it took back for "u")
+
+@contextlib.contextmanager
+def file_lock(path):
+    # Advisory lock shared by every station using this directory; blocks until it is free.
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10s; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def refresh_from_disk():
+    # If elo.txt is no longer the file we last read or wrote, another station has saved:
+    # start again from their file and re-apply our pending changes on top of it.
+    # Returns True when it reloaded. elo.txt is only ever replaced whole, so this is safe
+    # without the lock; save_data holds it so nobody can save in between.
+    global disk_fingerprint, disk_stat, board_base, data_version
+    stat = source_stat(FILE_NAME)
+    if stat == disk_stat:
+        return False
+    raw = b""
+    if os.path.exists(FILE_NAME):
+        with open(FILE_NAME, "rb") as f:
+            raw = f.read()
+    disk_stat = stat
+    fingerprint = snapshot_fingerprint(raw)
+    if fingerprint == disk_fingerprint:
+        return False
+    data_version += 1
+    pending = list(shared_pending)
+    # Older undo entries stay: revert_entry refuses them once another station has changed their players.
+    replayed = {id(detail) for kind, _, detail in pending if kind == "g"}
+    kept = [entry for entry in undo_stack if id(entry) not in replayed]
+    players.clear()
+    leaderboard.rebuild()
+    undo_stack.clear()
+    undo_stack.extend(kept)
+    aliases.load(ALIAS_FILE)
+    load_text(raw)
+    current = rating_engine().load(fingerprint)
+    rating_series.series = None  # pick up the other stations' points on the next query
+    board_base = None  # the next export can't be a delta
+    journal.replaying = True  # re-applied changes are already in shared_pending and elo.history
+    try:
+        for kind, command, detail in pending:
+            if kind == "g":
+                process_game(command, report=False)
+            elif kind == "c":
+                process_combine_command(command)
+            elif kind == "a":
+                add_aliases([detail[:2]])
+            elif kind == "u":
+                for entry in detail:
+                    # A game re-applied above has a fresh entry on top of undo_stack; one saved
+                    # before the rebase is only taken back if nobody has played its players since.
+                    if id(entry) in replayed and undo_stack:
+                        entry = undo_stack.pop()
+                    revert_entry(entry)
+            elif kind == "r" and rating_engine().pending:
+                end_rating_period()  # unless another station has ended the period already
+    finally:
+        journal.replaying = False
+    disk_fingerprint = fingerprint
+    if not current:
+        # Read between another station writing elo.txt and GLICKO_FILE: read both again under the lock.
+        disk_stat = disk_fingerprint = None
+    return True
 
 def get_players_display(filter_rank=None):
     if not players:
@@ -271,18 +847,7 @@ def get_players_display(filter_rank=None):
     if filter_rank is not None:
         if filter_rank not in valid_ranks:
             return f"Invalid rank '{filter_rank}'. Valid ranks are: {', '.join(valid_ranks)}."
-        filtered_players = []
-        for key, data in players.items():
-            ranks = [data.get("rank_o", "iron"), data.get("rank_d", "iron"), data.get("rank_a", "iron")]
-            valid_player_ranks = [r for r in ranks if r not in (HIDDEN_RANK, SPECIAL_IM)]
-            if not valid_player_ranks:
-                continue
-            highest_rank = max(valid_player_ranks, key=lambda r: RANK_ORDER[r])
-            if highest_rank == filter_rank:
-                filtered_players.append((key, data))
-        sorted_list = sorted(filtered_players, key=lambda kv: (-kv[1]["avg"], kv[1]["display"]))
-    else:
-        sorted_list = sorted(players.items(), key=lambda kv: (-kv[1]["avg"], kv[1]["display"]))
+    sorted_list = [(key, players[key]) for key in leaderboard.keys(filter_rank)]
     
     header = f"{'No.':<3} {'Name':<15} {'Avg':>5} {'Off':>5} {'Def':>5} {'T':>3} {'Win%':>5} {'Rank (a/o/d)':<15}"
     lines.append(header)
@@ -298,7 +863,7 @@ def get_players_display(filter_rank=None):
     return '\n'.join(lines)
 
 def calculate_expected_win_rate(player_rating, opponent_rating):
-    expected = 1 / (1 + math.pow(10, (opponent_rating - player_rating) / 400))
+    expected = rating_tables().expected_for(opponent_rating - player_rating)
     return expected * 100
 
 def parse_team(team_str):
@@ -311,101 +876,322 @@ def parse_team(team_str):
         defense_players = []
     return offense_players, defense_players
 
-def process_game(command):
-    lines = []
+def parse_game_command(command):
     pattern = r"^(.*?)\s*(win|smallwin|closewin|bigwin|perfectwin)\s*(.*?)$"
     match = re.match(pattern, command, re.IGNORECASE)
     if not match:
-        return "Command format not recognized."
+        raise ValueError("Command format not recognized.")
     team1_str, win_type, team2_str = match.groups()
     win_type = win_type.lower()
     if win_type not in WIN_TYPE_MULTIPLIERS:
-        return "Invalid win type."
-    base_multiplier = WIN_TYPE_MULTIPLIERS[win_type]
+        raise ValueError("Invalid win type.")
     team1_off, team1_def = parse_team(team1_str)
     team2_off, team2_def = parse_team(team2_str)
-    # Ensure all players are created in our records.
-    for name in team1_off + team1_def + team2_off + team2_def:
-        get_or_create_player(name)
-    def get_average_rating(names, role):
-        if not names:
-            return None
-        total = sum(get_or_create_player(name)[role] for name in names)
-        return total / len(names)
-    # Calculate opponent averages.
-    opp_for_team1 = get_average_rating(team2_def, "defense") if team2_def else get_average_rating(team2_off, "offense")
-    opp_off_team1 = get_average_rating(team2_off, "offense") if team2_off else get_average_rating(team2_def, "defense")
-    opp_for_team2 = get_average_rating(team1_def, "defense") if team1_def else get_average_rating(team1_off, "offense")
-    opp_off_team2 = get_average_rating(team1_off, "offense") if team1_off else get_average_rating(team1_def, "defense")
-    lines.append("--------------------------------------------------------------------------------")
-    lines.append("Expected win rates:")
-    # Calculate win rates based on current ratings.
-    team1_rates = []
-    for name in team1_off:
-        player = get_or_create_player(name)
-        rate = calculate_expected_win_rate(player["offense"], opp_for_team1)
-        team1_rates.append(rate)
-        lines.append(f"{player['display']} (O): {rate:.1f}%")
-    for name in team1_def:
-        player = get_or_create_player(name)
-        rate = calculate_expected_win_rate(player["defense"], opp_off_team1)
-        team1_rates.append(rate)
-        lines.append(f"{player['display']} (D): {rate:.1f}%")
-    team2_rates = []
-    for name in team2_off:
-        player = get_or_create_player(name)
-        rate = calculate_expected_win_rate(player["offense"], opp_for_team2)
-        team2_rates.append(rate)
-        lines.append(f"{player['display']} (O): {rate:.1f}%")
-    for name in team2_def:
-        player = get_or_create_player(name)
-        rate = calculate_expected_win_rate(player["defense"], opp_off_team2)
-        team2_rates.append(rate)
-        lines.append(f"{player['display']} (D): {rate:.1f}%")
-    avg_team1 = sum(team1_rates) / len(team1_rates) if team1_rates else 0
-    avg_team2 = sum(team2_rates) / len(team2_rates) if team2_rates else 0
-    team1_names = " + ".join([get_or_create_player(name)['display'] for name in (team1_off + team1_def)])
-    team2_names = " + ".join([get_or_create_player(name)['display'] for name in (team2_off + team2_def)])
-    lines.append(f"\n{team1_names}: {avg_team1:.1f}% vs {team2_names}: {avg_team2:.1f}%")
-    lines.append("--------------------------------------------------------------------------------")
-    # Now process the score changes by updating the ratings.
-    for name in team1_off:
-        player = get_or_create_player(name)
-        new_off, change = update_rating(player["offense"], 1, opp_for_team1, base_multiplier)
-        lines.append(f"{player['display']} Offense: {player['offense']} → {new_off} ({change:+.1f})")
-        player["offense"] = new_off
-        player["played"] += 1
-        player["wins"] += 1
-    for name in team1_def:
-        player = get_or_create_player(name)
-        new_def, change = update_rating(player["defense"], 1, opp_off_team1, base_multiplier)
-        lines.append(f"{player['display']} Defense: {player['defense']} → {new_def} ({change:+.1f})")
-        player["defense"] = new_def
-        player["played"] += 1
-        player["wins"] += 1
-    for name in team2_off:
-        player = get_or_create_player(name)
-        new_off, change = update_rating(player["offense"], 0, opp_for_team2, base_multiplier)
-        lines.append(f"{player['display']} Offense: {player['offense']} → {new_off} ({change:+.1f})")
-        player["offense"] = new_off
-        player["played"] += 1
-    for name in team2_def:
-        player = get_or_create_player(name)
-        new_def, change = update_rating(player["defense"], 0, opp_off_team2, base_multiplier)
-        lines.append(f"{player['display']} Defense: {player['defense']} → {new_def} ({change:+.1f})")
-        player["defense"] = new_def
-        player["played"] += 1
-    save_data()
+    if not (team1_off or team1_def) or not (team2_off or team2_def):
+        raise ValueError("Both teams need at least one player.")
+    return team1_off, team1_def, win_type, team2_off, team2_def
+
+class GamePlan:
+    # A game command compiled once: canonical keys and roles in process_game's update order.
+    # preview() gives the exact rating changes without creating, changing or saving anything;
+    # commit() applies them. Ratings are read when previewing/committing, not when compiling.
+    def __init__(self, command):
+        self.command = command
+        team1_off, team1_def, self.win_type, team2_off, team2_def = parse_game_command(command)
+        self.names = {}  # canonical key -> name as first typed (display for new players)
+        self.slots = []  # (key, role, team); team 0 won
+        for names, role, team in ((team1_off, "offense", 0), (team1_def, "defense", 0),
+                                  (team2_off, "offense", 1), (team2_def, "defense", 1)):
+            for name in names:
+                key = canonicalize(name)
+                self.names.setdefault(key, name)
+                self.slots.append((key, role, team))
+
+    def rating(self, key, role):
+        return players[key][role] if key in players else RATING_MIN
+
+    def display(self, key):
+        return players[key]["display"] if key in players else self.names[key]
+
+    def opponents(self):
+        # Opponent rating for each slot: offense plays the other side's defense, defense its offense,
+        # falling back to the other role when a side has none.
+        def average(team, role):
+            values = [self.rating(key, role) for key, r, t in self.slots if t == team and r == role]
+            return sum(values) / len(values) if values else None
+        result = []
+        for key, role, team in self.slots:
+            other = 1 - team
+            off, deff = average(other, "offense"), average(other, "defense")
+            if role == "offense":
+                result.append(deff if deff is not None else off)
+            else:
+                result.append(off if off is not None else deff)
+        return result
+
+    def preview(self, win_type=None, opponents=None):
+        # [(key, role, old, new, change)] per slot; a player listed twice in a role sees their earlier update.
+        multiplier = WIN_TYPE_MULTIPLIERS[win_type or self.win_type]
+        if opponents is None:
+            opponents = self.opponents()
+        update = rating_engine().update
+        current = {}
+        result = []
+        for (key, role, team), opponent in zip(self.slots, opponents):
+            old = current.get((key, role))
+            if old is None:
+                old = self.rating(key, role)
+            new, change = update(key, role, old, 1 - team, opponent, multiplier)
+            current[(key, role)] = new
+            result.append((key, role, old, new, change))
+        return result
+
+    def preview_all(self):
+        # Every win type at once; the opponent averages are shared.
+        opponents = self.opponents()
+        return {win_type: self.preview(win_type, opponents) for win_type in WIN_TYPE_MULTIPLIERS}
+
+    def reversed(self):
+        # The same players with the other team winning.
+        plan = GamePlan.__new__(GamePlan)
+        plan.command = None
+        plan.win_type = self.win_type
+        plan.names = self.names
+        plan.slots = [s for s in self.slots if s[2] == 1] + [s for s in self.slots if s[2] == 0]
+        plan.slots = [(key, role, 1 - team) for key, role, team in plan.slots]
+        return plan
+
+    def report_lines(self, opponents, deltas):
+        lines = ["--------------------------------------------------------------------------------", "Expected win rates:"]
+        rates = ([], [])
+        for (key, role, team), opponent in zip(self.slots, opponents):
+            rate = calculate_expected_win_rate(self.rating(key, role), opponent)
+            rates[team].append(rate)
+            lines.append(f"{self.display(key)} ({role[0].upper()}): {rate:.1f}%")
+        avg_team1 = sum(rates[0]) / len(rates[0]) if rates[0] else 0
+        avg_team2 = sum(rates[1]) / len(rates[1]) if rates[1] else 0
+        team1_names = " + ".join(self.display(key) for key, _, team in self.slots if team == 0)
+        team2_names = " + ".join(self.display(key) for key, _, team in self.slots if team == 1)
+        lines.append(f"\n{team1_names}: {avg_team1:.1f}% vs {team2_names}: {avg_team2:.1f}%")
+        lines.append("--------------------------------------------------------------------------------")
+        for key, role, old, new, change in deltas:
+            lines.append(f"{self.display(key)} {role.capitalize()}: {old} → {new} ({change:+.1f})")
+        return lines
+
+    def commit(self, report=True):
+        opponents = self.opponents()
+        deltas = self.preview(None, opponents)
+        lines = self.report_lines(opponents, deltas) if report else []
+        created = [key for key in self.names if key not in players]
+        before = [(key, player_fields(key)) for key in self.names if key not in created]
+        for name in self.names.values():
+            get_or_create_player(name)
+        for (key, role, team), (_, _, _, new, _) in zip(self.slots, deltas):
+            player = players[key]
+            player[role] = new
+            player["played"] += 1
+            if team == 0:
+                player["wins"] += 1
+        for key in self.names:
+            update_player_avg(key)
+            update_player_ranks(key)
+            leaderboard.update(key)
+        entry = (self.command, created, before, [(key, player_fields(key)) for key in self.names])
+        undo_stack.append(entry)
+        engine = rating_engine()
+        engine.record_game(entry, self, opponents)
+        if report and engine.period_based:
+            lines.append(f"Ratings change when the rating period ends ({len(engine.pending)} game(s) so far).")
+        record_change("g", self.command, entry)
+        return '\n'.join(lines)
+
+UNDO_FIELDS = ("offense", "defense", "played", "wins", "avg", "rank_d", "rank_o", "rank_a")
+# Ratings kept in elo.series, with their position in UNDO_FIELDS.
+SERIES_ROLES = (("offense", UNDO_FIELDS.index("offense")), ("defense", UNDO_FIELDS.index("defense")),
+                ("avg", UNDO_FIELDS.index("avg")))
+
+# One entry per committed game: (command, keys it created, [(key, fields before)], [(key, fields after)]).
+# A combine clears it, since games before a merge can no longer be taken back player by player.
+undo_stack = collections.deque(maxlen=UNDO_LIMIT)
+
+def player_fields(key):
+    data = players[key]
+    return tuple(data[field] for field in UNDO_FIELDS)
+
+def undo_games(count=1):
+    # Restores the players of the last `count` games from their recorded deltas; returns the commands undone.
+    undone = []
+    while undo_stack and len(undone) < count:
+        if not revert_entry(undo_stack[-1]):
+            break  # changed by something other than a game since; leave it alone
+        undone.append(undo_stack.pop())
+    if undone:
+        record_change("u", f"undo {len(undone)}", undone)
+    return [entry[0] for entry in undone]
+
+def revert_entry(entry):
+    # Puts back the "before" fields of one undo_stack entry, if its players still hold its "after" fields.
+    command, created, before, after = entry
+    if any(key not in players or player_fields(key) != fields for key, fields in after):
+        return False
+    for key, fields in before:
+        data = players[key]
+        for field, value in zip(UNDO_FIELDS, fields):
+            data[field] = value
+        leaderboard.update(key)
+    for key in created:
+        del players[key]
+        leaderboard.remove(key)
+    rating_engine().revert(entry)
+    return True
+
+def parse_day(text):
+    # Local midnight of a YYYY-MM-DD date, as unix seconds; None if it isn't one.
+    try:
+        return int(time.mktime(time.strptime(text, "%Y-%m-%d")))
+    except ValueError:
+        return None
+
+def format_day(seconds):
+    return time.strftime("%Y-%m-%d", time.localtime(seconds))
+
+def get_history_display(command):
+    # history <name> [offense|defense|avg] [YYYY-MM-DD [YYYY-MM-DD]]
+    parts = command.split()[1:]
+    usage = "Invalid format. Use: history <name> [offense|defense|avg] [from-date [to-date]] (dates as YYYY-MM-DD)."
+    if not parts:
+        return usage
+    name = parts.pop(0)
+    key = canonicalize(name)
+    role = parts.pop(0).lower() if parts and parts[0].lower() in ("offense", "defense", "avg") else None
+    days = [parse_day(p) for p in parts]
+    if len(days) > 2 or None in days:
+        return usage
+    if key not in rating_series:
+        return f"No rating history for '{name}'."
+    display = players[key]["display"] if key in players else name
+    if len(days) == 1:
+        # Ratings as they stood at the end of that day.
+        when = days[0] + 86399
+        values = [(r, rating_series.value_at(key, r, when)) for r, _ in SERIES_ROLES if role in (None, r)]
+        if all(value is None for _, value in values):
+            return f"No rating history for '{display}' on or before {parts[0]}."
+        return f"{display} on {parts[0]}: " + ", ".join(f"{r} {'-' if v is None else v}" for r, v in values)
+    start, end = (days[0], days[1] + 86400) if days else (None, None)
+    lines = []
+    for r, _ in SERIES_ROLES:
+        if role not in (None, r):
+            continue
+        times, ratings = rating_series.points(key, r, start, end)
+        if not times:
+            continue
+        if not lines:
+            lines.append(f"{display}: rating history from {format_day(times[0])} to {format_day(times[-1])}")
+            lines.append(f"{'Role':<8} {'Points':>6} {'Now':>5} {'Peak':>5} {'on':<10} {'Low':>5} {'on':<10}")
+        peak_time, peak = rating_series.peak(key, r, start, end)
+        low_time, low = rating_series.low(key, r, start, end)
+        lines.append(f"{r:<8} {len(times):>6} {ratings[-1]:>5} {peak:>5} {format_day(peak_time):<10} {low:>5} {format_day(low_time):<10}")
+    if not lines:
+        return f"No rating history for '{display}' in that range."
+    chart = role or "avg"
+    lines.append(f"\n{chart.capitalize()} over time (low-high, last):")
+    for span, low, high, last in rating_series.downsample(key, chart, HISTORY_BUCKETS, start, end):
+        lines.append(f"{format_day(span)}  {low:>5}-{high:<5} {last:>5}")
     return '\n'.join(lines)
 
-def get_best_players_display():
-    if not players:
-        return "No player data available."
+def get_undo_display(command):
+    parts = command.split()
+    if len(parts) > 2 or (len(parts) == 2 and not parts[1].isdigit()):
+        return "Invalid format. Use: undo or undo N."
+    undone = undo_games(int(parts[1]) if len(parts) == 2 else 1)
+    if not undone:
+        return "Nothing to undo."
+    return f"Undid {len(undone)} game(s):\n" + "\n".join(undone)
+
+def process_game(command, report=True):
+    try:
+        plan = GamePlan(command)
+    except ValueError as e:
+        return str(e)
+    return plan.commit(report)
+
+def get_whatif_display(command):
+    # Dry run of a game command: its exact report, then every player's change for every result.
+    try:
+        plan = GamePlan(command)
+    except ValueError as e:
+        return str(e)
+    opponents = plan.opponents()
+    lines = ["What if (nothing is recorded):"]
+    lines += plan.report_lines(opponents, plan.preview(None, opponents))
+    header = f"{'':<20}" + "".join(f"{win_type:>11}" for win_type in WIN_TYPE_MULTIPLIERS)
+    for title, side in (("If team 1 wins:", plan), ("If team 2 wins:", plan.reversed())):
+        lines += ["", title, header]
+        outcomes = side.preview_all()
+        for i, (key, role, _) in enumerate(side.slots):
+            label = f"{side.display(key)} ({role[0].upper()})"
+            lines.append(f"{label:<20}" + "".join(f"{outcomes[w][i][3] - outcomes[w][i][2]:>+11}" for w in WIN_TYPE_MULTIPLIERS))
+    return '\n'.join(lines)
+
+def process_games(commands, report=False, out=None):
+    # Apply game (and combine) commands in order, saving once at the end instead of per game.
+    # Bad lines are reported through out(line_no, command, message) and skipped.
+    # Returns (applied, errors) where errors is a list of (line_no, command, message).
+    global batch_depth
+    applied = 0
+    errors = []
+    batch_depth += 1
+    try:
+        for line_no, command in enumerate(commands, start=1):
+            command = command.strip()
+            if not command or command.startswith("#"):
+                continue
+            if command.lower().startswith("combine"):
+                result = process_combine_command(command)
+                ok = result.startswith("Combined")
+            elif command.lower().split()[0] == "undo":
+                result = get_undo_display(command)
+                ok = result.startswith("Undid")
+            elif command.lower().split()[0] == "alias":
+                result = get_alias_display(command)
+                ok = " now means " in result
+            else:
+                try:
+                    parse_game_command(command)
+                except ValueError as e:
+                    result, ok = str(e), False
+                else:
+                    result, ok = process_game(command, report), True
+            if ok:
+                applied += 1
+                if report and out is not None:
+                    out(line_no, command, result)
+            else:
+                errors.append((line_no, command, result))
+                if out is not None:
+                    out(line_no, command, "error: " + result)
+    finally:
+        batch_depth -= 1
+        if applied and not batch_depth:
+            if history_file is not None:
+                history_file.flush()
+            rating_series.flush()
+            save_data()
+    return applied, errors
+
+def best_players():
+    # The records behind "best": best avg, offense, defense, most played and highest win rate.
     best_avg = max(players.values(), key=lambda x: x["avg"])
     best_off = max(players.values(), key=lambda x: x["offense"])
     best_def = max(players.values(), key=lambda x: x["defense"])
     most_played = max(players.values(), key=lambda x: x["played"])
     highest_win = max(players.values(), key=lambda x: (x["wins"]/x["played"]) if x["played"] else 0)
+    return best_avg, best_off, best_def, most_played, highest_win
+
+def get_best_players_display():
+    if not players:
+        return "No player data available."
+    best_avg, best_off, best_def, most_played, highest_win = best_players()
     
     lines = []
     lines.append(" Best Players:")
@@ -431,18 +1217,119 @@ def process_combine_command(command):
         return f"Player '{src_name}' not found."
     if dest_key not in players:
         return f"Player '{dest_name}' not found."
-    # Merge the source record into destination.
-    merge_record(
-        dest_key,
-        players[dest_key]["display"],  # keep dest display name
-        players[src_key]["offense"],
-        players[src_key]["defense"],
-        players[src_key]["played"],
-        players[src_key]["wins"]
-    )
+    if src_key == dest_key:
+        return f"'{src_name}' and '{dest_name}' are already the same player."
+    absorb_player(src_key, dest_key)
+    # Remember the merge, so the source name resolves to the destination from now on.
+    aliases.union(src_key, dest_key)
+    undo_stack.clear()
+    record_change("c", command, (src_key, dest_key))
+    return f"Combined '{src_name}' into '{dest_name}' (main record remains as '{dest_name}')."
+
+def absorb_player(src_key, dest_key):
+    # Merges the source record into destination (or files it there if dest has no record) and removes it.
+    if dest_key in players:
+        merge_record(
+            dest_key,
+            players[dest_key]["display"],  # keep dest display name
+            players[src_key]["offense"],
+            players[src_key]["defense"],
+            players[src_key]["played"],
+            players[src_key]["wins"]
+        )
+    else:
+        players[dest_key] = players[src_key]
+        leaderboard.update(dest_key)
+    rating_engine().combine(src_key, dest_key)
     # Remove the source player.
     del players[src_key]
-    return f"Combined '{src_name}' into '{dest_name}' (main record remains as '{dest_name}')."
+    leaderboard.remove(src_key)
+
+def merge_aliased(names):
+    # Folds every player among `names` filed under a key that now resolves elsewhere into that player.
+    merged = []
+    for key in names:
+        root = aliases.resolve(key)
+        if root != key and key in players:
+            absorb_player(key, root)
+            merged.append(key)
+    return merged
+
+def add_aliases(pairs):
+    # Records that each (alias, name) pair is one player, in one pass however many there are:
+    # all the unions first, then each affected record is merged straight into its final player.
+    # Returns (pairs applied, records merged) or raises ValueError before changing anything.
+    global batch_depth
+    applied = []
+    for alias, name in pairs:
+        alias_key, name_key = normalize_name(alias), normalize_name(name)
+        if not alias_key or not name_key:
+            raise ValueError(f"Invalid alias '{alias} to {name}'.")
+        applied.append((alias.strip(), name.strip(), alias_key, name_key))
+    touched = set()
+    for _, _, alias_key, name_key in applied:
+        touched.update((alias_key, aliases.resolve(alias_key), aliases.resolve(name_key)))
+        aliases.union(alias_key, name_key)
+    merged = merge_aliased(touched)
+    if merged:
+        undo_stack.clear()
+    changed = {aliases.resolve(key) for key in merged}
+    batch_depth += 1
+    try:
+        for alias, name, alias_key, name_key in applied:
+            dest_key = aliases.resolve(name_key)
+            # detail: (alias, the player it resolves to, whether that player's record changed)
+            record_change("a", f"alias {alias} to {name}", (alias_key, dest_key, dest_key in changed))
+            changed.discard(dest_key)
+    finally:
+        batch_depth -= 1
+    if applied and not batch_depth and not journal.replaying:
+        if history_file is not None:
+            history_file.flush()
+        rating_series.flush()
+        save_data()
+    return len(applied), len(merged)
+
+def parse_alias(line):
+    # "alias a to b" or just "a to b" -> (a, b)
+    match = re.match(r"^(?:alias\s+)?(.*?)\s+to\s+(.*?)\.?$", line.strip(), re.IGNORECASE)
+    if not match:
+        raise ValueError("Invalid format. Use: alias a to b.")
+    return match.group(1).strip(), match.group(2).strip()
+
+def get_alias_display(command):
+    if command.lower().split()[0] != "alias":
+        return "Invalid format. Use: alias a to b, or alias <name>."
+    rest = command[5:].strip()
+    if not rest:
+        return "Invalid format. Use: alias a to b, or alias <name>."
+    if not re.search(r"\sto\s", rest, re.IGNORECASE):
+        key = canonicalize(rest)
+        names = aliases.names(key)
+        label = players[key]["display"] if key in players else rest
+        return f"{label}: {', '.join(names)}" if names else f"{label} has no aliases."
+    try:
+        alias, name = parse_alias(rest)
+        if canonicalize(alias) == canonicalize(name):
+            return f"'{alias}' and '{name}' are already the same player."
+        _, merged = add_aliases([(alias, name)])
+    except ValueError as e:
+        return str(e)
+    note = f" and merged its record into '{name}'" if merged else ""
+    return f"'{alias}' now means '{name}'{note}."
+
+def import_aliases(lines):
+    # Bulk alias import ("a to b" per line, # comments); one save at the end.
+    pairs = []
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            pairs.append(parse_alias(line))
+        except ValueError as e:
+            raise ValueError(f"line {line_no}: {e}")
+    return add_aliases(pairs)
 
 def get_name_display():
     if not players:
@@ -450,10 +1337,16 @@ def get_name_display():
     sorted_list = sorted(players.items(), key=lambda kv: kv[1]["display"].lower())
     lines = []
     lines.append("Name, Average, Offense, Defense, Games Played, Win%")
+    engine = rating_engine()
     for key, data in sorted_list:
         played = data.get("played", 0)
         win_rate = round((data["wins"] / played) * 100) if played > 0 else 0
-        lines.append(f"{data['display']}: A-{data['avg']}, O-{data['offense']}, D-{data['defense']}, T-{played}, R-{win_rate}%")
+        off, deff = data["offense"], data["defense"]
+        if engine.period_based:
+            # With the rating deviation: a player with few games has a wide one.
+            off = f"{off}±{round(engine.deviation(key, 'offense'))}"
+            deff = f"{deff}±{round(engine.deviation(key, 'defense'))}"
+        lines.append(f"{data['display']}: A-{data['avg']}, O-{off}, D-{deff}, T-{played}, R-{win_rate}%")
     return '\n'.join(lines)
 
 def adjust_opponent_rating(opposition_rating, curr_rating):
@@ -461,16 +1354,35 @@ def adjust_opponent_rating(opposition_rating, curr_rating):
 
 RATING_PROTECTION_THRESHOLDS = [(150, 34),(200, 21),(400, 13),(850, 8),(1234, 5),(1650, 3),(2222, 2),(2468, 1),(2666, 0),(2900, -1),(float('inf'), -2)]
 
+_rating_tables = None
+
+def rating_tables():
+    # Built on first use so importing foosball stays cheap; call reset_rating_tables() after
+    # changing RATING_MIN/RATING_MAX, RATING_PROTECTION_THRESHOLDS or RANK_THRESHOLDS.
+    global _rating_tables
+    if _rating_tables is None:
+        _rating_tables = RatingTables(RATING_MIN, RATING_MAX, RATING_PROTECTION_THRESHOLDS, RANK_THRESHOLDS)
+    return _rating_tables
+
+def reset_rating_tables():
+    global _rating_tables
+    _rating_tables = None
+
 def update_rating(curr_rating, score, opposition_rating, multiplier):
-    expected = 1 / (1 + math.pow(10, (adjust_opponent_rating(opposition_rating, curr_rating) - curr_rating) / 400))
+    tables = _rating_tables or rating_tables()
+    # Table lookups inlined (this is the hottest function in bulk replays); see rating_table.py.
+    diff = adjust_opponent_rating(opposition_rating, curr_rating) - curr_rating
+    k = diff * 2 + tables.half_span
+    i = int(k)
+    expected = tables.expected[i] if i == k and 0 <= i < len(tables.expected) else expected_score(diff)
     change = multiplier * K_FACTOR * (score - expected)
     
     # 排位保护机制
-    adjustment = 0
-    for threshold, adj in RATING_PROTECTION_THRESHOLDS:
-        if curr_rating <= threshold:
-            adjustment = adj
-            break
+    j = curr_rating - RATING_MIN
+    if type(j) is int and 0 <= j < len(tables.adjust):
+        adjustment = tables.adjust[j]
+    else:
+        adjustment = tables.protection_adjustment_slow(curr_rating)
     
     # 处理加分/减分逻辑
     if score in (0, 1):
@@ -490,187 +1402,184 @@ def update_rating(curr_rating, score, opposition_rating, multiplier):
     
     return new_rating, change
 
-class FoosballGUI(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title("Foosball ELO System")
-        self.geometry("900x700")
-        self.configure(bg='#add8e6')  # light blue
-
-        # Side frame for clickable buttons
-        side_frame = tk.Frame(self, bg='#add8e6')
-        side_frame.pack(side=tk.LEFT, fill=tk.Y, padx=10, pady=10)
-
-        tk.Button(side_frame, text="Show All Players", command=lambda: self.process_predef("pp"), bg='#4caf50', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
-        tk.Button(side_frame, text="Show Best Players", command=lambda: self.process_predef("best"), bg='#4caf50', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
-        tk.Button(side_frame, text="List Names", command=lambda: self.process_predef("name"), bg='#4caf50', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
-        tk.Button(side_frame, text="Combine Players", command=self.combine_dialog, bg='#2196f3', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
-        tk.Button(side_frame, text="Add Game", command=self.game_dialog, bg='#2196f3', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
-
-        # Main frame
-        main_frame = tk.Frame(self, bg='#add8e6')
-        main_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # Output area
-        self.output = scrolledtext.ScrolledText(main_frame, wrap=tk.NONE, font=('Courier New', 10), bg='white', fg='black')
-        self.output.pack(fill=tk.BOTH, expand=True)
-
-        # Input frame
-        input_frame = tk.Frame(main_frame, bg='#add8e6')
-        input_frame.pack(fill=tk.X, pady=10)
-
-        tk.Label(input_frame, text="Command:", bg='#add8e6', font=('Arial', 12)).pack(side=tk.LEFT, padx=5)
-        self.entry = tk.Entry(input_frame, font=('Arial', 12))
-        self.entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        self.entry.bind("<KeyRelease>", self.update_suggestions)
-
-        submit_btn = tk.Button(input_frame, text="Submit", command=self.process_command, bg='#4caf50', fg='grey', font=('Arial', 12))
-        submit_btn.pack(side=tk.LEFT, padx=5)
-        quit_btn = tk.Button(input_frame, text="Quit", command=self.quit_app, bg='#f44336', fg='grey', font=('Arial', 12))
-        quit_btn.pack(side=tk.LEFT, padx=5)
-
-        # Suggestion listbox
-        self.suggestion_list = tk.Listbox(main_frame, height=5, font=('Arial', 12), bg='grey')
-        self.suggestion_list.bind("<Double-Button-1>", self.insert_suggestion)
-        # Initially not packed
-
-        load_data()
-        self.output.insert(tk.END, "Foosball ELO System\n")
-        self.output.insert(tk.END, "Commands: pp [rank], best, combine a to b, name, exit\n")
-        self.output.insert(tk.END, "Game: team1 win team2 (teams as off1,off2;def1,def2)\n\n")
-
-    def update_suggestions(self, event):
-        cursor_pos = self.entry.index(tk.INSERT)
-        text = self.entry.get()[:cursor_pos]
-        start = cursor_pos
-        while start > 0 and text[start-1] not in ' ,;':
-            start -= 1
-        current_word = text[start:]
-        if not current_word:
-            self.suggestion_list.pack_forget()
-            return
+engine = None
 
-        commands = ["pp", "best", "combine", "name"]
-        win_types = list(WIN_TYPE_MULTIPLIERS.keys())
-        ranks = [rank for _, rank in RANK_THRESHOLDS]
-        all_words = set(commands + win_types + ranks + ["to"])
-        player_names = [data['display'] for data in players.values()]
-        all_words.update(player_names)
+def rating_engine():
+    # The engine behind GamePlan, made from RATING_ENGINE on first use.
+    global engine
+    if engine is None:
+        from engines import make_engine
+        engine = make_engine(RATING_ENGINE)
+    return engine
 
-        matching = [word for word in all_words if word.lower().startswith(current_word.lower())]
-        matching.sort()
+def end_rating_period():
+    # Rates the games collected since the last period (period-based engines only). Games
+    # before this can't be undone any more: their players' ratings have moved on.
+    changed = rating_engine().end_period()
+    if changed is None:
+        return None
+    for key in changed:
+        update_player_avg(key)
+        update_player_ranks(key)
+        leaderboard.update(key)
+    undo_stack.clear()
+    record_change("r", "period", changed)
+    return changed
 
-        self.suggestion_list.delete(0, tk.END)
-        if not matching:
-            self.suggestion_list.pack_forget()
-            return
-        for m in matching:
-            self.suggestion_list.insert(tk.END, m)
-        self.suggestion_list.pack(fill=tk.X)
+def get_period_display():
+    changed = end_rating_period()
+    if changed is None:
+        return "The elo engine has no rating periods (see RATING_ENGINE)."
+    return f"Rating period ended: {len(changed)} player(s) changed."
 
-    def insert_suggestion(self, event):
-        if not self.suggestion_list.curselection():
-            return
-        selected = self.suggestion_list.get(self.suggestion_list.curselection())
-        cursor_pos = self.entry.index(tk.INSERT)
-        start = cursor_pos
-        text_before = self.entry.get()[:cursor_pos]
-        while start > 0 and text_before[start-1] not in ' ,;':
-            start -= 1
-        self.entry.delete(start, cursor_pos)
-        self.entry.insert(start, selected)
-        self.entry.icursor(start + len(selected))
-        self.suggestion_list.pack_forget()
-
-    def process_command(self):
-        cmd = self.entry.get().strip()
-        self.entry.delete(0, tk.END)
-        self.suggestion_list.pack_forget()
-        if cmd.lower() == "exit":
-            self.quit_app()
-            return
-        output_str = ""
-        if cmd.lower().startswith("pp"):
-            parts = cmd.strip().split()
-            filter_rank = parts[1].lower() if len(parts) > 1 else None
-            output_str = get_players_display(filter_rank)
-        elif cmd.lower() == "best":
-            output_str = get_best_players_display()
-        elif cmd.lower().startswith("combine"):
-            output_str = process_combine_command(cmd)
-        elif cmd.lower() == "name":
-            output_str = get_name_display()
-        else:
-            output_str = process_game(cmd)
-        self.output.insert(tk.END, output_str + "\n\n")
-        self.output.see(tk.END)
-
-    def process_predef(self, cmd):
-        output_str = ""
-        if cmd == "pp":
-            output_str = get_players_display()
-        elif cmd == "best":
-            output_str = get_best_players_display()
-        elif cmd == "name":
-            output_str = get_name_display()
-        self.output.insert(tk.END, output_str + "\n\n")
-        self.output.see(tk.END)
-
-    def combine_dialog(self):
-        dialog = tk.Toplevel(self)
-        dialog.title("Combine Players")
-        dialog.configure(bg='#add8e6')
-        tk.Label(dialog, text="Combine from:", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
-        src_entry = tk.Entry(dialog, font=('Arial', 12))
-        src_entry.pack(pady=5)
-        tk.Label(dialog, text="To:", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
-        dest_entry = tk.Entry(dialog, font=('Arial', 12))
-        dest_entry.pack(pady=5)
-        def do_combine():
-            src = src_entry.get().strip()
-            dest = dest_entry.get().strip()
-            if not src or not dest:
-                messagebox.showerror("Error", "Please enter both player names.")
-                return
-            cmd = f"combine {src} to {dest}"
-            output = process_combine_command(cmd)
-            self.output.insert(tk.END, output + "\n\n")
-            self.output.see(tk.END)
-            dialog.destroy()
-        tk.Button(dialog, text="Combine", command=do_combine, bg='#2196f3', fg='grey', font=('Arial', 12)).pack(pady=10)
-
-    def game_dialog(self):
-        dialog = tk.Toplevel(self)
-        dialog.title("Add Game")
-        dialog.configure(bg='#add8e6')
-        tk.Label(dialog, text="Team 1 (off1,off2;def1,def2):", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
-        team1_entry = tk.Entry(dialog, font=('Arial', 12))
-        team1_entry.pack(pady=5)
-        tk.Label(dialog, text="Win Type:", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
-        win_var = StringVar(dialog)
-        win_var.set("win")
-        OptionMenu(dialog, win_var, *WIN_TYPE_MULTIPLIERS.keys()).pack(pady=5)
-        tk.Label(dialog, text="Team 2:", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
-        team2_entry = tk.Entry(dialog, font=('Arial', 12))
-        team2_entry.pack(pady=5)
-        def do_game():
-            team1 = team1_entry.get().strip()
-            wint = win_var.get()
-            team2 = team2_entry.get().strip()
-            if not team1 or not team2:
-                messagebox.showerror("Error", "Please enter both teams.")
-                return
-            cmd = f"{team1} {wint} {team2}"
-            output = process_game(cmd)
-            self.output.insert(tk.END, output + "\n\n")
-            self.output.see(tk.END)
-            dialog.destroy()
-        tk.Button(dialog, text="Process Game", command=do_game, bg='#2196f3', fg='grey', font=('Arial', 12)).pack(pady=10)
-
-    def quit_app(self):
+def run_command(cmd):
+    # Shared dispatch for the GUI entry box, the REPL and one-shot commands.
+    if SHARED_MODE and not batch_depth:
+        refresh_from_disk()
+    if not batch_depth and rating_engine().due():
+        end_rating_period()
+    lower = cmd.lower()
+    if lower.startswith("pp"):
+        parts = cmd.strip().split()
+        filter_rank = parts[1].lower() if len(parts) > 1 else None
+        return get_players_display(filter_rank)
+    elif lower == "best":
+        return get_best_players_display()
+    elif lower.startswith("combine"):
+        return process_combine_command(cmd)
+    elif lower.startswith("alias "):
+        return get_alias_display(cmd)
+    elif lower == "name":
+        return get_name_display()
+    elif lower == "stats" or lower.startswith("stats "):
+        from instrument import run_stats_command
+        return run_stats_command(cmd)
+    elif lower.startswith("profile "):
+        from instrument import profile
+        return profile(cmd[8:].strip())
+    elif lower == "undo" or lower.startswith("undo "):
+        return get_undo_display(cmd)
+    elif lower.startswith("whatif "):
+        return get_whatif_display(cmd[7:])
+    elif lower.startswith("history "):
+        return get_history_display(cmd)
+    elif lower == "period":
+        return get_period_display()
+    elif lower.startswith("match "):
+        from matchmaking import get_match_display
+        return get_match_display([n for n in re.split(r"[\s,;]+", cmd[6:]) if n])
+    else:
+        return process_game(cmd)
+
+def shutdown(save=True):
+    if save or (dirty and not JOURNAL_MODE):
         save_data()
-        self.destroy()
+    journal.close()
+    close_history()
 
-if __name__ == "__main__":
+def repl():
+    load_data()
+    print("Foosball ELO System")
+    print("Commands: pp [rank], best, combine a to b, name, undo [N], whatif <game>, match p1 p2 ..., history <name>, alias a to b, period, exit")
+    print("Game: team1 win team2 (teams as off1,off2;def1,def2)")
+    try:
+        while True:
+            try:
+                cmd = input("> ").strip()
+            except EOFError:
+                print()
+                break
+            if not cmd:
+                continue
+            if cmd.lower() in ("exit", "quit"):
+                break
+            print(run_command(cmd) + "\n")
+    except KeyboardInterrupt:
+        print()
+    shutdown()
+    return 0
+
+def one_shot(commands):
+    load_data()
+    for cmd in commands:
+        print(run_command(cmd.strip()))
+    # Games are already journaled; only an unjournaled combine needs a save here.
+    shutdown(save=False)
+    return 0
+
+def ingest_main(path, report=False):
+    def out(line_no, command, message):
+        stream = sys.stderr if message.startswith("error: ") else sys.stdout
+        print(f"{line_no}: {command}\n{message}" if report else f"{line_no}: {command}: {message}", file=stream)
+    load_data()
+    if path == "-":
+        applied, errors = process_games(sys.stdin, report, out)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            applied, errors = process_games(f, report, out)
+    shutdown(save=False)
+    print(f"Applied {applied} command(s), {len(errors)} error(s).")
+    return 1 if errors else 0
+
+def aliases_main(path):
+    load_data()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            applied, merged = import_aliases(f)
+    except ValueError as e:
+        shutdown(save=False)
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    shutdown(save=False)
+    print(f"Imported {applied} alias(es), merged {merged} player record(s).")
+    return 0
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Foosball ELO System")
+    parser.add_argument("--cli", action="store_true", help="interactive prompt instead of the GUI")
+    parser.add_argument("-c", "--command", action="append", metavar="CMD", help="run CMD (pp, best, name, combine, or a game) and exit; repeatable")
+    parser.add_argument("--ingest", metavar="FILE", help="apply game/combine commands from FILE ('-' for stdin) with a single save")
+    parser.add_argument("--aliases", metavar="FILE", help="import aliases from FILE (one 'old name to name' per line) in one pass and exit")
+    parser.add_argument("--report", action="store_true", help="print the win-rate report for every ingested game")
+    parser.add_argument("--shared", action="store_true", help="elo.txt is shared with other stations: lock, merge and save every change")
+    parser.add_argument("--export", metavar="DIR", help="publish the leaderboard as JSON plus per-save deltas to DIR for index.html")
+    parser.add_argument("--engine", choices=("elo", "glicko2"), help="rating engine (default: RATING_ENGINE); see engines.py")
+    parser.add_argument("--stats", metavar="FILE", help="record per-stage timings (see instrument.py) and write them to FILE on exit")
+    args = parser.parse_args(argv)
+    global SHARED_MODE, EXPORT_DIR, RATING_ENGINE
+    SHARED_MODE = SHARED_MODE or args.shared
+    EXPORT_DIR = args.export or EXPORT_DIR
+    RATING_ENGINE = args.engine or RATING_ENGINE
+    if args.stats:
+        import atexit
+        import importlib
+        import instrument
+        if not (args.ingest or args.command or args.cli):
+            importlib.import_module("foosball_gui")  # loaded first so the Tk stages are wrapped too
+        instrument.enable()
+        atexit.register(instrument.dump, args.stats)
+    if args.aliases:
+        return aliases_main(args.aliases)
+    if args.ingest:
+        return ingest_main(args.ingest, args.report)
+    if args.command:
+        return one_shot(args.command)
+    if args.cli:
+        return repl()
+    from foosball_gui import FoosballGUI
     app = FoosballGUI()
     app.mainloop()
+    return 0
+
+def __getattr__(name):
+    # foosball.FoosballGUI still works, but tkinter is only imported when it is asked for.
+    if name == "FoosballGUI":
+        from foosball_gui import FoosballGUI
+        return FoosballGUI
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == "__main__":
+    # Let foosball_gui's "from foosball import ..." see this module instead of loading a second copy.
+    sys.modules.setdefault("foosball", sys.modules[__name__])
+    sys.exit(main())
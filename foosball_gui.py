@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# Tk front end for foosball.py. Kept in its own module so that importing foosball, the
+# command line and scripts never pay for (or need a display for) tkinter.
+import queue
+import threading
+import traceback
+import tkinter as tk
+from tkinter import scrolledtext, messagebox, OptionMenu, StringVar
+
+from foosball import (WIN_TYPE_MULTIPLIERS, completions, leaderboard, load_data, process_combine_command,
+                      process_game, run_command, shutdown)
+
+POLL_MS = 30  # how often the Tk loop picks up finished commands
+OUTPUT_CHUNK_LINES = 300  # lines inserted into the output box per Tk tick
+
+class CommandWorker(threading.Thread):
+    # Runs commands one at a time, in submission order, off the Tk thread. Everything that
+    # touches players goes through here; the Tk side only peeks under the lock.
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args, done=None):
+        self.tasks.put((func, args, done))
+
+    def run(self):
+        while True:
+            func, args, done = self.tasks.get()
+            with self.lock:
+                try:
+                    result = func(*args)
+                except Exception:
+                    result = "Error:\n" + traceback.format_exc()
+                # Bring the leaderboard (and with it the completion index) up to date here, so
+                # a lazily loaded elo.snap is never rebuilt on the Tk thread.
+                leaderboard.sync()
+            self.results.put((result, done))
+
+class FoosballGUI(tk.Tk):
+    def __init__(self):
+        super().__init__()
+        self.title("Foosball ELO System")
+        self.geometry("900x700")
+        self.configure(bg='#add8e6')  # light blue
+
+        # Side frame for clickable buttons
+        side_frame = tk.Frame(self, bg='#add8e6')
+        side_frame.pack(side=tk.LEFT, fill=tk.Y, padx=10, pady=10)
+
+        tk.Button(side_frame, text="Show All Players", command=lambda: self.process_predef("pp"), bg='#4caf50', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
+        tk.Button(side_frame, text="Show Best Players", command=lambda: self.process_predef("best"), bg='#4caf50', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
+        tk.Button(side_frame, text="List Names", command=lambda: self.process_predef("name"), bg='#4caf50', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
+        tk.Button(side_frame, text="Combine Players", command=self.combine_dialog, bg='#2196f3', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
+        tk.Button(side_frame, text="Add Game", command=self.game_dialog, bg='#2196f3', fg='grey', font=('Arial', 12), width=15).pack(pady=5)
+
+        # Main frame
+        main_frame = tk.Frame(self, bg='#add8e6')
+        main_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # Output area
+        self.output = scrolledtext.ScrolledText(main_frame, wrap=tk.NONE, font=('Courier New', 10), bg='white', fg='black')
+        self.output.pack(fill=tk.BOTH, expand=True)
+
+        # Input frame
+        input_frame = tk.Frame(main_frame, bg='#add8e6')
+        input_frame.pack(fill=tk.X, pady=10)
+
+        tk.Label(input_frame, text="Command:", bg='#add8e6', font=('Arial', 12)).pack(side=tk.LEFT, padx=5)
+        self.entry = tk.Entry(input_frame, font=('Arial', 12))
+        self.entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.entry.bind("<KeyRelease>", self.update_suggestions)
+
+        submit_btn = tk.Button(input_frame, text="Submit", command=self.process_command, bg='#4caf50', fg='grey', font=('Arial', 12))
+        submit_btn.pack(side=tk.LEFT, padx=5)
+        quit_btn = tk.Button(input_frame, text="Quit", command=self.quit_app, bg='#f44336', fg='grey', font=('Arial', 12))
+        quit_btn.pack(side=tk.LEFT, padx=5)
+
+        # Suggestion listbox
+        self.suggestion_list = tk.Listbox(main_frame, height=5, font=('Arial', 12), bg='grey')
+        self.suggestion_list.bind("<Double-Button-1>", self.insert_suggestion)
+        # Initially not packed
+
+        self.pending_output = []
+        self.closed = False
+        self.worker = CommandWorker()
+        self.worker.start()
+        self.worker.submit(load_data)
+        self.after(POLL_MS, self.poll_results)
+        self.output.insert(tk.END, "Foosball ELO System\n")
+        self.output.insert(tk.END, "Commands: pp [rank], best, combine a to b, name, undo [N], whatif <game>, match p1 p2 ..., history <name>, alias a to b, period, exit\n")
+        self.output.insert(tk.END, "Game: team1 win team2 (teams as off1,off2;def1,def2)\n\n")
+
+    def run_in_background(self, func, *args, done=None):
+        self.worker.submit(func, *args, done=done)
+
+    def poll_results(self):
+        while True:
+            try:
+                result, done = self.worker.results.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(result, str):
+                self.pending_output.extend((result + "\n\n").splitlines(keepends=True))
+            if done is not None:
+                done(result)
+            if self.closed:
+                return
+        if self.pending_output:
+            chunk = self.pending_output[:OUTPUT_CHUNK_LINES]
+            del self.pending_output[:OUTPUT_CHUNK_LINES]
+            self.output.insert(tk.END, "".join(chunk))
+            self.output.see(tk.END)
+        self.after(0 if self.pending_output else POLL_MS, self.poll_results)
+
+    def update_suggestions(self, event):
+        cursor_pos = self.entry.index(tk.INSERT)
+        text = self.entry.get()[:cursor_pos]
+        start = cursor_pos
+        while start > 0 and text[start-1] not in ' ,;':
+            start -= 1
+        current_word = text[start:]
+        if not current_word:
+            self.suggestion_list.pack_forget()
+            return
+
+        # Suggestions are a nicety: skip them rather than wait while a command is running.
+        if not self.worker.lock.acquire(blocking=False):
+            return
+        try:
+            matching = completions.match(current_word)
+        finally:
+            self.worker.lock.release()
+
+        self.suggestion_list.delete(0, tk.END)
+        if not matching:
+            self.suggestion_list.pack_forget()
+            return
+        for m in matching:
+            self.suggestion_list.insert(tk.END, m)
+        self.suggestion_list.pack(fill=tk.X)
+
+    def insert_suggestion(self, event):
+        if not self.suggestion_list.curselection():
+            return
+        selected = self.suggestion_list.get(self.suggestion_list.curselection())
+        cursor_pos = self.entry.index(tk.INSERT)
+        start = cursor_pos
+        text_before = self.entry.get()[:cursor_pos]
+        while start > 0 and text_before[start-1] not in ' ,;':
+            start -= 1
+        self.entry.delete(start, cursor_pos)
+        self.entry.insert(start, selected)
+        self.entry.icursor(start + len(selected))
+        self.suggestion_list.pack_forget()
+
+    def process_command(self):
+        cmd = self.entry.get().strip()
+        self.entry.delete(0, tk.END)
+        self.suggestion_list.pack_forget()
+        if cmd.lower() == "exit":
+            self.quit_app()
+            return
+        self.run_in_background(run_command, cmd)
+
+    def process_predef(self, cmd):
+        self.run_in_background(run_command, cmd)
+
+    def combine_dialog(self):
+        dialog = tk.Toplevel(self)
+        dialog.title("Combine Players")
+        dialog.configure(bg='#add8e6')
+        tk.Label(dialog, text="Combine from:", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
+        src_entry = tk.Entry(dialog, font=('Arial', 12))
+        src_entry.pack(pady=5)
+        tk.Label(dialog, text="To:", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
+        dest_entry = tk.Entry(dialog, font=('Arial', 12))
+        dest_entry.pack(pady=5)
+        def do_combine():
+            src = src_entry.get().strip()
+            dest = dest_entry.get().strip()
+            if not src or not dest:
+                messagebox.showerror("Error", "Please enter both player names.")
+                return
+            cmd = f"combine {src} to {dest}"
+            self.run_in_background(process_combine_command, cmd)
+            dialog.destroy()
+        tk.Button(dialog, text="Combine", command=do_combine, bg='#2196f3', fg='grey', font=('Arial', 12)).pack(pady=10)
+
+    def game_dialog(self):
+        dialog = tk.Toplevel(self)
+        dialog.title("Add Game")
+        dialog.configure(bg='#add8e6')
+        tk.Label(dialog, text="Team 1 (off1,off2;def1,def2):", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
+        team1_entry = tk.Entry(dialog, font=('Arial', 12))
+        team1_entry.pack(pady=5)
+        tk.Label(dialog, text="Win Type:", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
+        win_var = StringVar(dialog)
+        win_var.set("win")
+        OptionMenu(dialog, win_var, *WIN_TYPE_MULTIPLIERS.keys()).pack(pady=5)
+        tk.Label(dialog, text="Team 2:", bg='#add8e6', font=('Arial', 12)).pack(pady=5)
+        team2_entry = tk.Entry(dialog, font=('Arial', 12))
+        team2_entry.pack(pady=5)
+        def do_game():
+            team1 = team1_entry.get().strip()
+            wint = win_var.get()
+            team2 = team2_entry.get().strip()
+            if not team1 or not team2:
+                messagebox.showerror("Error", "Please enter both teams.")
+                return
+            cmd = f"{team1} {wint} {team2}"
+            self.run_in_background(process_game, cmd)
+            dialog.destroy()
+        tk.Button(dialog, text="Process Game", command=do_game, bg='#2196f3', fg='grey', font=('Arial', 12)).pack(pady=10)
+
+    def quit_app(self):
+        # Queued behind any commands still running, so nothing is lost on exit.
+        self.run_in_background(shutdown, done=self.close_window)
+
+    def close_window(self, _result=None):
+        self.closed = True
+        self.destroy()
@@ -0,0 +1,211 @@
+# Opt-in timing for the command paths: call counts, timing histograms and bytes written per
+# stage. Nothing is wrapped until enable() is called, so there is no cost while it is off;
+# enable() swaps the functions below for timed wrappers, including the copies that
+# `from foosball import ...` left in other loaded modules (foosball_gui). Stages nest, so
+# times are inclusive: "process_game" contains "parse", "rating math" and "journal append".
+#   stats on | stats | stats reset | stats dump FILE | stats off    (any command prompt)
+#   profile <command>                                                 (one command under cProfile)
+#   python foosball.py --stats stats.json -c "..."                    (record a run, dump at exit)
+import cProfile
+import functools
+import importlib
+import io
+import json
+import os
+import pstats
+import sys
+import time
+
+PROFILE_LINES = 25
+
+
+def _journal_bytes(args, result):
+    return len(args[1]) + len(args[2]) + 2
+
+
+def _snapshot_bytes(args, result):
+    return os.path.getsize(args[0]) if os.path.exists(args[0]) else 0
+
+
+def _write_stage(args):
+    # atomic_write saves elo.txt, elo.alias, elo.glicko and the export JSON: a stage for each.
+    import foosball
+
+    path = args[0]
+    if foosball.EXPORT_DIR is not None and os.path.dirname(os.path.abspath(path)) == os.path.abspath(foosball.EXPORT_DIR):
+        return "write export"
+    return "write " + os.path.basename(path)
+
+
+# (dotted owner in foosball / foosball_gui, attribute, stage name or name(args), bytes written(args, result) or None)
+TARGETS = [
+    ("foosball", "run_command", "command", None),
+    ("foosball", "process_game", "process_game", None),
+    ("foosball.GamePlan", "__init__", "parse", None),
+    ("foosball.GamePlan", "preview", "rating math", None),
+    ("foosball", "process_combine_command", "combine", None),
+    ("foosball.Leaderboard", "update", "leaderboard update", None),
+    ("foosball.Leaderboard", "keys", "leaderboard order", None),
+    ("foosball", "get_players_display", "display pp", None),
+    ("foosball", "get_best_players_display", "display best", None),
+    ("foosball", "get_name_display", "display name", None),
+    ("foosball", "load_data", "load_data", None),
+    ("foosball", "save_data", "save_data", None),
+    ("foosball", "format_data", "format elo.txt", None),
+    ("foosball", "atomic_write", _write_stage, lambda args, result: len(args[1])),
+    ("foosball", "write_snapshot", "write elo.snap", _snapshot_bytes),
+    ("foosball.MatchJournal", "append", "journal append", _journal_bytes),
+    ("foosball.MatchJournal", "sync", "journal fsync", None),
+    ("foosball_gui.FoosballGUI", "poll_results", "tk render", None),
+]
+
+
+class StageStats:
+    # Histogram buckets are powers of two of microseconds: bucket b holds calls under 2**b us.
+    __slots__ = ("count", "total", "max", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.bytes = 0
+        self.buckets = [0] * 32
+
+    def add(self, ns, nbytes=0):
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        self.bytes += nbytes
+        self.buckets[min(31, (ns // 1000).bit_length())] += 1
+
+    def percentile(self, p):
+        # Upper edge of the bucket holding the p-th percentile, in microseconds.
+        target = self.count * p / 100
+        seen = 0
+        for b, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return 2 ** b
+        return 0
+
+    def as_dict(self):
+        return {"count": self.count, "total_ms": self.total / 1e6, "max_ms": self.max / 1e6, "bytes": self.bytes,
+                "histogram_us": {f"<{2 ** b}": n for b, n in enumerate(self.buckets) if n}}
+
+
+stats = {}
+patched = []  # (owner, attribute, original) to restore on disable()
+enabled = False
+
+
+def _owner(path):
+    module, _, cls = path.partition(".")
+    owner = sys.modules.get(module)
+    if owner is not None and cls:
+        owner = getattr(owner, cls, None)
+    return owner
+
+
+def _wrap(func, stage, size):
+    perf = time.perf_counter_ns
+
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        t0 = perf()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            target = stage if isinstance(stage, StageStats) else stats.setdefault(stage(args), StageStats())
+            target.add(perf() - t0, size(args, result) if size is not None else 0)
+    return timed
+
+
+def enable():
+    global enabled
+    if enabled:
+        return
+    importlib.import_module("foosball")  # the owners below live there
+    for path, attribute, name, size in TARGETS:
+        owner = _owner(path)
+        if owner is None:
+            continue  # e.g. the GUI isn't loaded
+        original = getattr(owner, attribute)
+        wrapper = _wrap(original, name if callable(name) else stats.setdefault(name, StageStats()), size)
+        setattr(owner, attribute, wrapper)
+        patched.append((owner, attribute, original))
+        if "." not in path:
+            for module in list(sys.modules.values()):
+                if module is not owner and vars(module).get(attribute) is original:
+                    setattr(module, attribute, wrapper)
+                    patched.append((module, attribute, original))
+    enabled = True
+
+
+def disable():
+    global enabled
+    while patched:
+        owner, attribute, original = patched.pop()
+        setattr(owner, attribute, original)
+    enabled = False
+
+
+def reset():
+    for stage in stats.values():
+        stage.__init__()
+
+
+def report():
+    if not enabled and not stats:
+        return "Instrumentation is off. Use 'stats on' to start recording."
+    header = f"{'stage':<20} {'calls':>7} {'total ms':>10} {'mean ms':>8} {'p50 us':>8} {'p90 us':>8} {'p99 us':>8} {'max ms':>8} {'bytes':>10}"
+    lines = [("Recording" if enabled else "Stopped") + " (times include nested stages):", header, "-" * len(header)]
+    for name, stage in sorted(stats.items(), key=lambda item: -item[1].total):
+        if not stage.count:
+            continue
+        lines.append(f"{name:<20} {stage.count:>7} {stage.total / 1e6:>10.1f} {stage.total / stage.count / 1e6:>8.3f} "
+                     f"{stage.percentile(50):>8} {stage.percentile(90):>8} {stage.percentile(99):>8} "
+                     f"{stage.max / 1e6:>8.2f} {stage.bytes:>10}")
+    return '\n'.join(lines)
+
+
+def dump(path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "stages": {name: stage.as_dict() for name, stage in stats.items() if stage.count}}, f, indent=1)
+    return f"Wrote stats to {path}."
+
+
+def profile(command):
+    # Runs one command under cProfile and appends the top functions by cumulative time.
+    import foosball
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(foosball.run_command, command)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return f"{result}\n\n{out.getvalue().strip()}"
+
+
+def run_stats_command(command):
+    # "stats", "stats on|off|reset", "stats dump FILE"
+    parts = command.split(None, 2)
+    action = parts[1].lower() if len(parts) > 1 else ""
+    if action == "on":
+        enable()
+        return "Recording stats."
+    if action == "off":
+        disable()
+        return "Stopped recording stats."
+    if action == "reset":
+        reset()
+        return "Stats cleared."
+    if action == "dump":
+        if len(parts) < 3:
+            return "Invalid format. Use: stats dump FILE."
+        return dump(parts[2].strip())
+    if action:
+        return "Invalid format. Use: stats [on|off|reset|dump FILE]."
+    return report()
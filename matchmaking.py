@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Balanced 2v2 matchmaking. With process_game's rules a team's predicted win rate is the
+# mean of two duels: its offense against the other defense, and its defense against the
+# other offense. Writing M[i][j] for "i on offense beats j on defense", team A (a_o;a_d)
+# against team B (b_o;b_d) wins with probability (M[a_o][b_d] + 1 - M[b_o][a_d]) / 2,
+# so a game is even exactly when its two duels have equal M. Balanced games are therefore
+# neighbours in the sorted list of all duels, and the search only scans neighbours until
+# the gap exceeds the k-th best imbalance found so far.
+#   python matchmaking.py Brady Larry Lincoln Grayson Justin ... [--top 5]
+#   python matchmaking.py ... --rounds 6 --tables 2 --workers 4
+import argparse
+import bisect
+import heapq
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import foosball
+
+
+class RoleRatings:
+    # Offense/defense ratings of the people present, read once; unknown names count as new players.
+    def __init__(self, names):
+        self.names = []
+        self.offense = []
+        self.defense = []
+        seen = set()
+        for name in names:
+            key = foosball.canonicalize(name)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            if key in foosball.players:
+                data = foosball.players[key]
+                self.names.append(data["display"])
+                self.offense.append(data["offense"])
+                self.defense.append(data["defense"])
+            else:
+                self.names.append(name)
+                self.offense.append(foosball.RATING_MIN)
+                self.defense.append(foosball.RATING_MIN)
+        n = len(self.names)
+        rate = foosball.calculate_expected_win_rate
+        self.duel = [[rate(self.offense[i], self.defense[j]) / 100 for j in range(n)] for i in range(n)]
+        self.single = [[rate(self.offense[i], self.offense[j]) / 100 for j in range(n)] for i in range(n)]
+
+    def __len__(self):
+        return len(self.names)
+
+    def win_rate(self, a_o, a_d, b_o, b_d):
+        return (self.duel[a_o][b_d] + 1 - self.duel[b_o][a_d]) / 2
+
+
+def balanced_games(ratings, top=5, allowed=None):
+    # Up to `top` 2v2 games as (imbalance, team A win rate, (a_o, a_d, b_o, b_d)), most even first.
+    people = range(len(ratings)) if allowed is None else sorted(allowed)
+    duels = sorted((ratings.duel[i][j], i, j) for i in people for j in people if i != j)
+    values = [d[0] for d in duels]
+    best = []  # max-heap on imbalance via negation
+    for x, (p, a_o, b_d) in enumerate(duels):
+        limit = -best[0][0] if len(best) >= top else 1.0
+        # Only duels with M within 2*limit of p can make a game this even.
+        end = bisect.bisect_right(values, p + 2 * limit, lo=x + 1)
+        for y in range(x + 1, end):
+            q, b_o, a_d = duels[y]
+            if len({a_o, b_d, b_o, a_d}) < 4:
+                continue
+            # Each game is exactly one unordered pair of duels, so it is met once.
+            game = (a_o, a_d, b_o, b_d)
+            imbalance = (q - p) / 2
+            if len(best) < top:
+                heapq.heappush(best, (-imbalance, game))
+            elif imbalance < -best[0][0]:
+                heapq.heapreplace(best, (-imbalance, game))
+            else:
+                break
+    result = []
+    for neg, game in best:
+        result.append((-neg, ratings.win_rate(*game), game))
+    result.sort()
+    return result
+
+
+def balanced_singles(ratings, top=5):
+    n = len(ratings)
+    games = sorted((abs(ratings.single[i][j] - 0.5), ratings.single[i][j], (i, j)) for i in range(n) for j in range(i + 1, n))
+    return games[:top]
+
+
+def format_game(ratings, game):
+    if len(game) == 2:
+        return f"{ratings.names[game[0]]} vs {ratings.names[game[1]]}"
+    a_o, a_d, b_o, b_d = game
+    return f"{ratings.names[a_o]};{ratings.names[a_d]} vs {ratings.names[b_o]};{ratings.names[b_d]}"
+
+
+def get_match_display(names, top=5):
+    ratings = RoleRatings(names)
+    if len(ratings) < 2:
+        return "Need at least two players for a match."
+    games = balanced_games(ratings, top) if len(ratings) >= 4 else balanced_singles(ratings, top)
+    lines = ["Most balanced games (team as offense;defense):"]
+    for idx, (_, rate, game) in enumerate(games, start=1):
+        lines.append(f"{idx}. {format_game(ratings, game)}  ({rate * 100:.1f}% / {(1 - rate) * 100:.1f}%)")
+    return '\n'.join(lines)
+
+
+def plan_rounds(ratings, rounds, tables, seed):
+    # Randomized greedy schedule: each round seats whoever has played least, then fills each
+    # table with the most even game among them, lightly penalizing repeated teammates.
+    rng = random.Random(seed)
+    n = len(ratings)
+    played = [0] * n
+    partners = set()
+    schedule = []
+    total = 0.0
+    for _ in range(rounds):
+        order = list(range(n))
+        rng.shuffle(order)
+        order.sort(key=lambda i: played[i])
+        free = set(order[:min(n, tables * 4)])
+        games = []
+        while len(free) >= 4:
+            options = balanced_games(ratings, 8, free)
+            if not options:
+                break
+            imbalance, rate, game = min(options, key=lambda g: g[0] + 0.05 * (frozenset(g[2][:2]) in partners)
+                                        + 0.05 * (frozenset(g[2][2:]) in partners))
+            games.append((imbalance, rate, game))
+            total += imbalance
+            for i in game:
+                free.discard(i)
+                played[i] += 1
+            partners.add(frozenset(game[:2]))
+            partners.add(frozenset(game[2:]))
+        schedule.append(games)
+    return total, schedule
+
+
+_ratings = None  # the parent's RoleRatings, in a worker process
+
+
+def _init_worker(ratings):
+    global _ratings
+    _ratings = ratings
+
+
+def _plan_worker(args):
+    return plan_rounds(_ratings, *args)
+
+
+def plan_session(names, rounds, tables=1, tries=16, workers=None):
+    # Tries `tries` randomized schedules, in parallel when workers > 1, and keeps the most even.
+    # Workers plan with the ratings built here (journaled games, aliases and all), not elo.txt.
+    ratings = RoleRatings(names)
+    jobs = [(rounds, tables, seed) for seed in range(tries)]
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ratings,)) as pool:
+            results = list(pool.map(_plan_worker, jobs))
+    else:
+        results = [plan_rounds(ratings, *job) for job in jobs]
+    return min(results, key=lambda r: r[0])
+
+
+def get_session_display(names, rounds, tables=1, tries=16, workers=None):
+    ratings = RoleRatings(names)
+    total, schedule = plan_session(names, rounds, tables, tries, workers)
+    lines = [f"Session plan ({rounds} rounds, {tables} table(s), mean imbalance {total / max(1, sum(map(len, schedule))) * 100:.1f}%):"]
+    for idx, games in enumerate(schedule, start=1):
+        seated = {i for _, _, game in games for i in game}
+        sitting = [ratings.names[i] for i in range(len(ratings)) if i not in seated]
+        text = ", ".join(f"{format_game(ratings, game)} ({rate * 100:.0f}%)" for _, rate, game in games)
+        lines.append(f"Round {idx}: {text}" + (f"  [out: {', '.join(sitting)}]" if sitting else ""))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suggest balanced 2v2 games from the players present.")
+    parser.add_argument("names", nargs="+")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--rounds", type=int, help="plan a whole session of this many rounds")
+    parser.add_argument("--tables", type=int, default=1)
+    parser.add_argument("--tries", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    foosball.load_data()
+    names = [n for arg in args.names for n in arg.split(",") if n.strip()]
+    if args.rounds:
+        print(get_session_display(names, args.rounds, args.tables, args.tries, args.workers))
+    else:
+        print(get_match_display(names, args.top))
+    foosball.shutdown(save=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
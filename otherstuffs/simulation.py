@@ -1,8 +1,17 @@
-import pygame
+#!/usr/bin/env python3
+# Electronic foosball.
+#   python simulation.py                 play live: pygame window, keyboard rods, 60 fps
+#   python simulation.py --headless --matches 1000 --procs 4 > games.txt
+#                                        AI matches with no display and no frame limit, one
+#                                        process_game command per match (foosball.py --ingest games.txt)
+# Both run the same rules, Match.step(), one tick at a time. pygame is only imported live.
+import argparse
+import bisect
 import random
+import sys
+import time
 
-# Initialize Pygame
-pygame.init()
+import numpy as np
 
 # Constants
 WIDTH, HEIGHT = 800, 600
@@ -10,6 +19,9 @@ PLAYER_RADIUS = 10
 BALL_RADIUS = 8
 PLAYER_SPEED = 5
 BALL_SPEED = 3
+SHOT_ANGLE = 1.5  # dy/dx of a ball coming off the edge of a figure
+SHOT_ANGLE_MIN = 0.3  # ... and off its middle (dead straight, it would never get past the figures in line)
+FPS = 60
 
 # Colors
 BLACK = (0, 0, 0)
@@ -18,20 +30,29 @@ GREEN = (0, 255, 0)
 RED = (255, 0, 0)
 BLUE = (0, 0, 255)
 
-# Initialize screen
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Electronic Foosball")
+# Goals, as (x, y, width, height)
+LEFT_GOAL = (0, 200, 50, 200)
+RIGHT_GOAL = (WIDTH - 50, 200, 50, 200)
+
+# Headless matches
+GOALS_TO_WIN = 5
+MAX_TICKS = 10 * 60 * FPS  # ten minutes of play; a tie then goes to a golden goal
+LOOKAHEAD = 90  # ticks of ball path the AI rods plan with
+AI_NOISE = 100  # pixels by which a skill-0 player misjudges where the ball will be
+# Win type by goal margin (a shut-out is a perfectwin); see foosball.WIN_TYPE_MULTIPLIERS.
+WIN_TYPES = {1: "closewin", 2: "smallwin", 3: "win"}
 
-clock = pygame.time.Clock()
 
 class Rod:
-    def __init__(self, x, y_positions, color, left_key, right_key):
+    def __init__(self, x, y_positions, color, left_key=None, right_key=None):
         self.x = x
+        self.attack = 1 if x < WIDTH // 2 else -1  # direction of the goal this rod's team shoots at
         self.y_positions = y_positions
         self.color = color
         self.left_key = left_key
         self.right_key = right_key
         self.speed = PLAYER_SPEED
+        self.home = x
 
     def move_left(self):
         self.x -= self.speed
@@ -44,18 +65,21 @@ class Rod:
             self.x = WIDTH - 50
 
     def draw(self, surface):
-        for y in self.y_positions:
-            pygame.draw.circle(surface, self.color, (self.x, y), PLAYER_RADIUS)
+        # Returns the areas drawn.
+        import pygame
+        return [pygame.draw.circle(surface, self.color, (self.x, y), PLAYER_RADIUS) for y in self.y_positions]
+
 
 class Ball:
-    def __init__(self):
+    def __init__(self, rng=random):
+        self.rng = rng
         self.reset()
 
     def reset(self):
         self.x = WIDTH // 2
         self.y = HEIGHT // 2
-        self.dx = random.choice([-BALL_SPEED, BALL_SPEED])
-        self.dy = random.choice([-BALL_SPEED, BALL_SPEED])
+        self.dx = self.rng.choice([-BALL_SPEED, BALL_SPEED])
+        self.dy = self.rng.choice([-BALL_SPEED, BALL_SPEED])
         self.radius = BALL_RADIUS
 
     def update(self):
@@ -63,111 +87,436 @@ class Ball:
         self.y += self.dy
 
     def draw(self, surface):
-        pygame.draw.circle(surface, WHITE, (int(self.x), int(self.y)), self.radius)
-
-# Create game objects
-left_defensive = Rod(100, [200, 300, 400], RED, pygame.K_a, pygame.K_d)
-left_offensive = Rod(200, [200, 300, 400], RED, pygame.K_w, pygame.K_s)
-right_defensive = Rod(700, [200, 300, 400], BLUE, pygame.K_LEFT, pygame.K_RIGHT)
-right_offensive = Rod(600, [200, 300, 400], BLUE, pygame.K_UP, pygame.K_DOWN)
-ball = Ball()
-
-# Goals
-left_goal = pygame.Rect(0, 200, 50, 200)
-right_goal = pygame.Rect(WIDTH - 50, 200, 50, 200)
-
-# Score
-left_score = 0
-right_score = 0
-font = pygame.font.Font(None, 74)
-
-def check_collision(ball, player_x, player_y):
-    distance = ((ball.x - player_x)**2 + (ball.y - player_y)**2)**0.5
-    return distance < ball.radius + PLAYER_RADIUS
-
-running = True
-while running:
-    # Handle events
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # Move rods
-    keys = pygame.key.get_pressed()
-    
-    if keys[left_defensive.left_key]:
-        left_defensive.move_left()
-    if keys[left_defensive.right_key]:
-        left_defensive.move_right()
-    
-    if keys[left_offensive.left_key]:
-        left_offensive.move_left()
-    if keys[left_offensive.right_key]:
-        left_offensive.move_right()
-    
-    if keys[right_defensive.left_key]:
-        right_defensive.move_left()
-    if keys[right_defensive.right_key]:
-        right_defensive.move_right()
-    
-    if keys[right_offensive.left_key]:
-        right_offensive.move_left()
-    if keys[right_offensive.right_key]:
-        right_offensive.move_right()
-
-    # Update ball position
-    ball.update()
-
-    # Check collisions with walls
-    if ball.y - ball.radius <= 0 or ball.y + ball.radius >= HEIGHT:
-        ball.dy *= -1
-
-    # Check goals
-    ball_rect = pygame.Rect(ball.x - ball.radius, ball.y - ball.radius, 
-                           ball.radius*2, ball.radius*2)
-    
-    if left_goal.colliderect(ball_rect):
-        right_score += 1
-        ball.reset()
-    elif right_goal.colliderect(ball_rect):
-        left_score += 1
-        ball.reset()
-    else:
-        # Check field boundaries
-        if ball.x - ball.radius <= 50 or ball.x + ball.radius >= WIDTH - 50:
-            ball.dx *= -1
-
-    # Check collisions with players
-    rods = [left_defensive, left_offensive, right_defensive, right_offensive]
-    for rod in rods:
-        for y in rod.y_positions:
-            if check_collision(ball, rod.x, y):
-                # Simple collision response
+        import pygame
+        return pygame.draw.circle(surface, WHITE, (int(self.x), int(self.y)), self.radius)
+
+
+def rects_collide(a, b):
+    # pygame.Rect.colliderect for (x, y, width, height) tuples.
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+class Match:
+    # One table: rods, ball(s) and the score. step() is one frame of the live game. The usual
+    # table has two rods a side and one ball; more of either are for stress-testing the loop.
+    def __init__(self, rng=random, rods_per_side=2, balls=1):
+        gap = min(100, (WIDTH - 200) // (2 * rods_per_side - 1))
+        left = [Rod(100 + k * gap, [200, 300, 400], RED) for k in range(rods_per_side)]
+        right = [Rod(WIDTH - 100 - k * gap, [200, 300, 400], BLUE) for k in range(rods_per_side)]
+        self.left_defensive, self.left_offensive = left[:2]
+        self.right_defensive, self.right_offensive = right[:2]
+        self.rods = [self.left_defensive, self.left_offensive, self.right_defensive, self.right_offensive]
+        self.rods += left[2:] + right[2:]
+        self.balls = [Ball(rng) for _ in range(balls)]
+        self.ball = self.balls[0]
+        self.left_score = 0
+        self.right_score = 0
+        self.ticks = 0
+        self.path = None  # ball forecast for this tick, shared by the AI rods
+        # Figures as arrays, in self.rods order, for collide(); rod_x follows the rods as they move.
+        reach = BALL_RADIUS + PLAYER_RADIUS
+        self.rod_x = np.array([rod.x for rod in self.rods], dtype=np.float64)
+        self.rod_top = np.array([min(rod.y_positions) - reach for rod in self.rods], dtype=np.float64)
+        self.rod_bottom = np.array([max(rod.y_positions) + reach for rod in self.rods], dtype=np.float64)
+        self.figure_rod = np.array([i for i, rod in enumerate(self.rods) for _ in rod.y_positions], dtype=np.intp)
+        self.figure_y = np.array([y for rod in self.rods for y in rod.y_positions], dtype=np.float64)
+
+    def step(self, moves):
+        # moves: -1 (left), 0 or 1 (right) per rod, in self.rods order. Returns True on a goal.
+        self.ticks += 1
+        self.path = None
+        for i, (rod, move) in enumerate(zip(self.rods, moves)):
+            if move:
+                if move < 0:
+                    rod.move_left()
+                else:
+                    rod.move_right()
+                self.rod_x[i] = rod.x
+        scored = False
+        for ball in self.balls:
+            scored |= self.move_ball(ball)
+        self.collide()
+        return scored
+
+    def move_ball(self, ball):
+        # Update ball position
+        ball.update()
+
+        # Check collisions with walls (moving into them: a shot's dy needn't be a whole number of pixels)
+        if (ball.y - ball.radius <= 0 and ball.dy < 0) or (ball.y + ball.radius >= HEIGHT and ball.dy > 0):
+            ball.dy *= -1
+
+        # Check goals
+        ball_rect = (ball.x - ball.radius, ball.y - ball.radius, ball.radius*2, ball.radius*2)
+        scored = False
+        if rects_collide(LEFT_GOAL, ball_rect):
+            self.right_score += 1
+            ball.reset()
+            scored = True
+        elif rects_collide(RIGHT_GOAL, ball_rect):
+            self.left_score += 1
+            ball.reset()
+            scored = True
+        elif not (LEFT_GOAL[1] < ball.y + ball.radius and ball.y - ball.radius < LEFT_GOAL[1] + LEFT_GOAL[3]):
+            # Check field boundaries (the goal mouths are open: with the ball moving 3px a tick
+            # from the centre, bouncing there too kept it 1px short of ever scoring)
+            if (ball.x - ball.radius <= 50 and ball.dx < 0) or (ball.x + ball.radius >= WIDTH - 50 and ball.dx > 0):
                 ball.dx *= -1
-                ball.dy *= -1
-
-    # Draw everything
-    screen.fill(GREEN)
-    
-    # Draw field
-    pygame.draw.rect(screen, WHITE, (0, 0, WIDTH, HEIGHT), 5)
-    pygame.draw.rect(screen, RED, left_goal)
-    pygame.draw.rect(screen, BLUE, right_goal)
-    
-    # Draw rods
-    for rod in rods:
-        rod.draw(screen)
-    
-    # Draw ball
-    ball.draw(screen)
-    
-    # Draw scores
-    text = font.render(str(left_score), True, WHITE)
-    screen.blit(text, (WIDTH//4, 10))
-    text = font.render(str(right_score), True, WHITE)
-    screen.blit(text, (3*WIDTH//4, 10))
 
+        return scored
+
+    def collide(self):
+        # Check collisions with players, in squared distances, figure by figure in self.rods
+        # order. With several balls they are all tested against every figure at once; most
+        # frames end at the broad phase, where no ball is within reach of a rod's column.
+        reach = BALL_RADIUS + PLAYER_RADIUS
+        balls = self.balls
+        if len(balls) == 1:
+            # The usual table: plain floats are cheaper than building arrays every tick.
+            ball = balls[0]
+            for rod in self.rods:
+                dx = rod.x - ball.x
+                if -reach < dx < reach:
+                    for y in rod.y_positions:
+                        dy = y - ball.y
+                        if dx * dx + dy * dy < reach * reach:
+                            self.kick(ball, rod, y)
+            return
+        pos = np.array([(ball.x, ball.y) for ball in balls])
+        gap = np.abs(self.rod_x - pos[:, :1])
+        if gap.min() >= reach:
+            return
+        by = pos[:, 1:]
+        near = (gap < reach) & (self.rod_top < by) & (by < self.rod_bottom)
+        for b in np.flatnonzero(near.any(axis=1)):
+            dx = self.rod_x[self.figure_rod] - pos[b, 0]
+            dy = self.figure_y - pos[b, 1]
+            for f in np.flatnonzero(dx * dx + dy * dy < reach * reach):
+                self.kick(balls[b], self.rods[self.figure_rod[f]], float(self.figure_y[f]))
+
+    @staticmethod
+    def kick(ball, rod, y):
+        # The figure at (rod.x, y) kicks the ball towards the other goal, angled by where it met
+        # it. (Just reversing dx and dy kept the ball on a few diagonals that never cross a goal
+        # mouth, and glued it to a rod moving through it.)
+        ball.dx = BALL_SPEED * rod.attack
+        offset = (ball.y - y) / (ball.radius + PLAYER_RADIUS) or ball.rng.choice([-0.01, 0.01])
+        ball.dy = BALL_SPEED * (SHOT_ANGLE_MIN + (SHOT_ANGLE - SHOT_ANGLE_MIN) * abs(offset)) * (1 if offset > 0 else -1)
+
+    def forecast(self):
+        # [(x, y)] of the ball over the next LOOKAHEAD ticks, with wall bounces but no rods.
+        if self.path is None:
+            x, y, dx, dy = self.ball.x, self.ball.y, self.ball.dx, self.ball.dy
+            r = self.ball.radius
+            path = []
+            for _ in range(LOOKAHEAD):
+                x += dx
+                y += dy
+                if (y - r <= 0 and dy < 0) or (y + r >= HEIGHT and dy > 0):
+                    dy = -dy
+                if x - r <= 0 or x + r >= WIDTH:
+                    break  # in a goal by now
+                path.append((x, y))
+            self.path = path
+        return self.path
+
+
+class RodAI:
+    # A player on one rod. While the ball heads for their own goal they slide the rod to where
+    # it will next cross one of their figures' lines; otherwise they drift back home. Each
+    # attack is misjudged by a fixed error, larger for lower skill, as is the reaction time.
+    def __init__(self, rod, side, skill, rng):
+        self.rod = rod
+        self.side = side  # -1: defends the left goal, 1: the right one
+        self.reaction = 1 + round((1 - skill) * 12)  # ticks between decisions
+        self.noise = (1 - skill) * AI_NOISE
+        self.rng = rng
+        self.target = rod.home
+        self.wait = 0
+        self.error = None  # this attack's misjudgement, in pixels
+
+    def __call__(self, match):
+        self.wait -= 1
+        if self.wait <= 0:
+            self.wait = self.reaction
+            self.target = self.plan(match)
+        diff = self.target - self.rod.x
+        if abs(diff) < self.rod.speed:
+            return 0
+        return 1 if diff > 0 else -1
+
+    def plan(self, match):
+        ball = match.ball
+        rod = self.rod
+        if (ball.dx > 0) != (self.side > 0):
+            self.error = None
+            return rod.home
+        if self.error is None:
+            self.error = self.rng.gauss(0, self.noise)
+        reach = BALL_RADIUS + PLAYER_RADIUS
+        for x, y in match.forecast():
+            if (x - rod.x) * self.side < reach and any(abs(y - fy) < reach for fy in rod.y_positions):
+                return x + self.error
+        return rod.home
+
+
+def play_match(seed, left, right):
+    # left/right: (offense skill, defense skill). Returns (left goals, right goals, ticks).
+    rng = random.Random(seed)
+    match = Match(rng)
+    ais = [RodAI(match.left_defensive, -1, left[1], rng), RodAI(match.left_offensive, -1, left[0], rng),
+           RodAI(match.right_defensive, 1, right[1], rng), RodAI(match.right_offensive, 1, right[0], rng)]
+    while True:
+        match.step([ai(match) for ai in ais])
+        lead = match.left_score - match.right_score
+        if max(match.left_score, match.right_score) >= GOALS_TO_WIN:
+            break
+        if match.ticks >= MAX_TICKS and lead:
+            break
+        if match.ticks >= 3 * MAX_TICKS:
+            # Nobody can score: settle it on a coin flip rather than loop forever.
+            match.left_score += rng.random() < 0.5
+            match.right_score += match.left_score == match.right_score
+            break
+    return match.left_score, match.right_score, match.ticks
+
+
+def win_type(winner, loser):
+    if loser == 0:
+        return "perfectwin"
+    return WIN_TYPES.get(winner - loser, "bigwin")
+
+
+# Rosters and schedules
+
+def load_roster(path):
+    # Names and skills from an elo.txt: skill is the rating's percentile in the league, per role.
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = [p.strip() for p in line.strip().rstrip(".").split(",")]
+            if len(parts) >= 5 and parts[1].isdigit() and parts[2].isdigit():
+                rows.append((parts[0], int(parts[1]), int(parts[2])))
+    offense = sorted(r[1] for r in rows)
+    defense = sorted(r[2] for r in rows)
+
+    def percentile(values, value):
+        return (bisect.bisect_left(values, value) + 0.5) / len(values)
+
+    return [(name, percentile(offense, off), percentile(defense, deff)) for name, off, deff in rows]
+
+
+def make_roster(count, rng):
+    # Synthetic players with a hidden skill per role.
+    roster = []
+    for i in range(count):
+        base = rng.gauss(0.55, 0.18)
+        roster.append((f"Sim{i + 1}", *(min(0.98, max(0.02, base + rng.gauss(0, 0.08))) for _ in range(2))))
+    return roster
+
+
+def make_schedule(roster, count, seed):
+    # (seed, left team, right team) per match; a team is ([(name, skill)] offense, [(name, skill)] defense).
+    # Mostly 2v2, some 1v1; busy players turn up far more often than others.
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) ** 0.8 for i in range(len(roster))]
+    order = list(roster)
+    rng.shuffle(order)
+    schedule = []
+    for i in range(count):
+        size = 4 if rng.random() < 0.85 or len(roster) < 4 else 2
+        picked = []
+        while len(picked) < size:
+            player = rng.choices(order, weights)[0]
+            if player not in picked:
+                picked.append(player)
+        if size == 4:
+            teams = (([picked[0][:2]], [picked[1][::2]]), ([picked[2][:2]], [picked[3][::2]]))
+        else:
+            teams = (([picked[0][:2]], []), ([picked[1][:2]], []))
+        schedule.append((seed * 1000003 + i, *teams))
+    return schedule
+
+
+def team_skills(team):
+    # A side with nobody on defense has its offense player run both rods.
+    offense, defense = team
+    off = sum(s for _, s in offense) / len(offense)
+    deff = sum(s for _, s in defense) / len(defense) if defense else off
+    return off, deff
+
+
+def team_text(team):
+    offense, defense = team
+    text = ",".join(name for name, _ in offense)
+    return text + (";" + ",".join(name for name, _ in defense) if defense else "")
+
+
+def run_fixture(fixture):
+    seed, left, right = fixture
+    left_goals, right_goals, ticks = play_match(seed, team_skills(left), team_skills(right))
+    if left_goals > right_goals:
+        command = f"{team_text(left)} {win_type(left_goals, right_goals)} {team_text(right)}"
+    else:
+        command = f"{team_text(right)} {win_type(right_goals, left_goals)} {team_text(left)}"
+    return command, ticks
+
+
+def headless(args):
+    from concurrent.futures import ProcessPoolExecutor
+
+    roster = load_roster(args.roster) if args.roster else make_roster(args.players, random.Random(args.seed))
+    schedule = make_schedule(roster, args.matches, args.seed)
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    t0 = time.perf_counter()
+    ticks = 0
+    try:
+        if args.procs == 1:
+            results = map(run_fixture, schedule)
+            for command, n in results:
+                out.write(command + "\n")
+                ticks += n
+        else:
+            with ProcessPoolExecutor(args.procs) as pool:
+                for command, n in pool.map(run_fixture, schedule, chunksize=max(1, len(schedule) // (args.procs * 8))):
+                    out.write(command + "\n")
+                    ticks += n
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    seconds = time.perf_counter() - t0
+    print(f"{args.matches} matches, {ticks} ticks in {seconds:.2f}s: {ticks / max(seconds, 1e-9):.0f} ticks/s, "
+          f"{ticks / FPS / max(seconds, 1e-9):.0f}x real time", file=sys.stderr)
+    return 0
+
+
+def live(rods_per_side=2, balls=1, overlay=False):
+    import pygame
+
+    # Initialize Pygame
+    pygame.init()
+
+    # Initialize screen
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Electronic Foosball")
+
+    clock = pygame.time.Clock()
+
+    # Create game objects
+    match = Match(rods_per_side=rods_per_side, balls=balls)
+    keys_for = [(pygame.K_a, pygame.K_d), (pygame.K_w, pygame.K_s),
+                (pygame.K_LEFT, pygame.K_RIGHT), (pygame.K_UP, pygame.K_DOWN)]
+    for rod, (left_key, right_key) in zip(match.rods, keys_for):
+        rod.left_key, rod.right_key = left_key, right_key
+    # Rods beyond the four on the keyboard play themselves.
+    ais = {i: RodAI(rod, -rod.attack, 0.5, random) for i, rod in enumerate(match.rods) if i >= len(keys_for)}
+
+    # The field never changes: draw it once, then each frame repaint only where something moved
+    # and pass just those rects to the display instead of flipping the whole screen.
+    field = pygame.Surface((WIDTH, HEIGHT))
+    field.fill(GREEN)
+    pygame.draw.rect(field, WHITE, (0, 0, WIDTH, HEIGHT), 5)
+    pygame.draw.rect(field, RED, LEFT_GOAL)
+    pygame.draw.rect(field, BLUE, RIGHT_GOAL)
+    screen.blit(field, (0, 0))
     pygame.display.flip()
-    clock.tick(60)
 
-pygame.quit()
+    font = pygame.font.Font(None, 74)
+    small = pygame.font.Font(None, 24)
+    rod_x = [None] * len(match.rods)  # where each rod was last drawn
+    rod_rects = [[] for _ in match.rods]
+    ball_rects = []
+    labels = {}  # name -> (surface, rect): the scores and the frame-time overlay (F3)
+    score = None
+    frame_times = []
+    overlay_at = 0
+
+    running = True
+    while running:
+        started = time.perf_counter()
+        # Handle events
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                overlay = not overlay
+                overlay_at = 0
+
+        # Move rods
+        keys = pygame.key.get_pressed()
+        match.step([ais[i](match) if i in ais else keys[rod.right_key] - keys[rod.left_key]
+                    for i, rod in enumerate(match.rods)])
+
+        # Text that changed: the scores are only rendered again after a goal, the overlay
+        # twice a second.
+        changed = {}
+        if score != (match.left_score, match.right_score):
+            score = (match.left_score, match.right_score)
+            for name, value, x in (("left", score[0], WIDTH//4), ("right", score[1], 3*WIDTH//4)):
+                text = font.render(str(value), True, WHITE)
+                changed[name] = (text, text.get_rect(topleft=(x, 10)))
+        if overlay and started >= overlay_at and frame_times:
+            overlay_at = started + 0.5
+            text = small.render(f"{1000 * sum(frame_times) / len(frame_times):.2f} ms/frame "
+                                f"(max {1000 * max(frame_times):.2f}), {clock.get_fps():.0f} fps, "
+                                f"{len(match.rods)} rods, {len(match.balls)} balls", True, WHITE, BLACK)
+            changed["overlay"] = (text, text.get_rect(bottomleft=(10, HEIGHT - 10)))
+            frame_times = []
+        elif not overlay and "overlay" in labels:
+            changed["overlay"] = None
+
+        # Erase the balls, the rods that moved and the text being replaced.
+        erased = list(ball_rects)
+        for i, rod in enumerate(match.rods):
+            if rod.x != rod_x[i]:
+                erased += rod_rects[i]
+        for name, label in changed.items():
+            if name in labels:
+                erased.append(labels.pop(name)[1])
+            if label is not None:
+                labels[name] = label
+        for rect in erased:
+            screen.blit(field, rect, rect)
+
+        # Draw what moved, and anything the erasing cut into
+        dirty = erased
+        for i, rod in enumerate(match.rods):
+            if rod.x != rod_x[i] or any(rect.collidelist(erased) >= 0 for rect in rod_rects[i]):
+                rod_x[i] = rod.x
+                rod_rects[i] = rod.draw(screen)
+                dirty += rod_rects[i]
+        ball_rects = [ball.draw(screen) for ball in match.balls]
+        dirty += ball_rects
+        for name, (text, rect) in labels.items():
+            if name in changed or rect.collidelist(dirty) >= 0:
+                screen.blit(text, rect)
+                dirty.append(rect)
+
+        pygame.display.update(dirty)
+        frame_times.append(time.perf_counter() - started)
+        clock.tick(FPS)
+
+    pygame.quit()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Electronic foosball, live or as a headless match generator.")
+    parser.add_argument("--headless", action="store_true", help="play AI matches without a display and print the results")
+    parser.add_argument("--matches", type=int, default=100)
+    parser.add_argument("--procs", type=int, default=1, help="processes playing matches in parallel")
+    parser.add_argument("--players", type=int, default=40, help="synthetic players when there is no --roster")
+    parser.add_argument("--roster", metavar="ELO_TXT", help="take names from an elo.txt, with skill from their ratings")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", metavar="FILE", help="write the game commands to FILE instead of stdout")
+    parser.add_argument("--rods", type=int, default=2, help="rods a side in the live game; past two they play themselves")
+    parser.add_argument("--balls", type=int, default=1, help="balls in play in the live game")
+    parser.add_argument("--overlay", action="store_true", help="start the live game with the frame-time overlay on (F3)")
+    args = parser.parse_args()
+    if args.headless:
+        return headless(args)
+    return live(max(2, args.rods), max(1, args.balls), args.overlay)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# Columnar storage for the players table. Each player gets an integer id; numbers live in
+# typed arrays, display names in an interned list and ranks as small integer codes.
+# PlayerStore behaves like the old dict-of-dicts (players[key]["offense"] += 1 etc.),
+# handing out PlayerRecord views that read and write the columns in place.
+# A store can also be attached to a read-only backing (snapshot.Snapshot): players are then
+# decoded from it the first time they are looked up, and all at once on iteration.
+import sys
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+NUMERIC_FIELDS = ("offense", "defense", "played", "wins", "avg")
+RANK_FIELDS = ("rank_d", "rank_o", "rank_a")
+FIELDS = ("display",) + NUMERIC_FIELDS + RANK_FIELDS
+
+
+class PlayerRecord(MutableMapping):
+    __slots__ = ("store", "pid")
+
+    def __init__(self, store, pid):
+        self.store = store
+        self.pid = pid
+
+    def __getitem__(self, field):
+        store = self.store
+        column = store.numeric.get(field)
+        if column is not None:
+            return column[self.pid]
+        if field in store.ranks:
+            return store.rank_names[store.ranks[field][self.pid]]
+        if field == "display":
+            return store.display[self.pid]
+        raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        store = self.store
+        column = store.numeric.get(field)
+        if column is not None:
+            column[self.pid] = value
+        elif field in store.ranks:
+            store.ranks[field][self.pid] = store.rank_code(value)
+        elif field == "display":
+            store.display[self.pid] = sys.intern(value)
+        else:
+            raise KeyError(field)
+
+    def __delitem__(self, field):
+        raise TypeError("player records have a fixed set of fields")
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class PlayerStore(MutableMapping):
+    def __init__(self, rank_names=()):
+        self.index = {}  # canonical name -> player id, in insertion order like a dict
+        self.free = []  # ids of deleted players, reused first
+        self.display = []
+        self.numeric = {field: array("i") for field in NUMERIC_FIELDS}
+        self.ranks = {field: array("H") for field in RANK_FIELDS}
+        self.rank_names = []
+        self.rank_codes = {}
+        for name in rank_names:
+            self.rank_code(name)
+        self.backing = None
+        self.backing_left = 0
+        self.backing_done = set()  # keys already pulled from (or shadowed over) the backing
+
+    def attach(self, backing):
+        # backing needs get(key) -> record dict or None, keys() and len().
+        self.backing = backing
+        self.backing_left = len(backing)
+        self.backing_done = set()
+
+    def fault(self, key):
+        if self.backing is None or key in self.backing_done:
+            return False
+        self.backing_done.add(key)
+        record = self.backing.get(key)
+        if record is None:
+            return False
+        self.backing_left -= 1
+        self.__setitem__(key, record)
+        return True
+
+    def load_all(self):
+        backing = self.backing
+        if backing is None:
+            return
+        for key in backing.keys():
+            if key not in self.backing_done:
+                self.fault(key)
+        self.backing = None
+        self.backing_done = set()
+        backing.close()
+
+    def rank_code(self, name):
+        code = self.rank_codes.get(name)
+        if code is None:
+            code = self.rank_codes[name] = len(self.rank_names)
+            self.rank_names.append(name)
+        return code
+
+    def __getitem__(self, key):
+        pid = self.index.get(key)
+        if pid is None:
+            if not self.fault(key):
+                raise KeyError(key)
+            pid = self.index[key]
+        return PlayerRecord(self, pid)
+
+    def __setitem__(self, key, record):
+        pid = self.index.get(key)
+        if pid is None and self.backing is not None and key not in self.backing_done:
+            self.fault(key)
+            pid = self.index.get(key)
+        if pid is None:
+            if self.free:
+                pid = self.free.pop()
+            else:
+                pid = len(self.display)
+                self.display.append(None)
+                for column in self.numeric.values():
+                    column.append(0)
+                for column in self.ranks.values():
+                    column.append(0)
+            self.index[key] = pid
+        # Read everything first: record may be a view of this very slot.
+        values = [record[field] for field in FIELDS]
+        self.display[pid] = sys.intern(values[0])
+        for field, value in zip(NUMERIC_FIELDS, values[1:6]):
+            self.numeric[field][pid] = value
+        for field, value in zip(RANK_FIELDS, values[6:]):
+            self.ranks[field][pid] = self.rank_code(value)
+
+    def __delitem__(self, key):
+        if key not in self.index:
+            self.fault(key)
+        pid = self.index.pop(key)
+        self.display[pid] = None
+        self.free.append(pid)
+
+    def __contains__(self, key):
+        return key in self.index or self.fault(key)
+
+    def __iter__(self):
+        self.load_all()
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index) + self.backing_left
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return len(self) == len(other) and all(key in other and dict(self[key]) == dict(other[key]) for key in self)
+
+    def clear(self):
+        if self.backing is not None:
+            self.backing.close()
+        self.__init__(self.rank_names)
+
+    def id_of(self, key):
+        return self.index[key]
+
+    def nbytes(self):
+        # Approximate footprint of the columns and the name index (display strings excluded).
+        total = sys.getsizeof(self.index) + sys.getsizeof(self.display) + sys.getsizeof(self.free)
+        total += sum(column.buffer_info()[1] * column.itemsize for column in self.numeric.values())
+        total += sum(column.buffer_info()[1] * column.itemsize for column in self.ranks.values())
+        return total
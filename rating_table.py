@@ -0,0 +1,87 @@
+# Precomputed rating math. Ratings are integers in [rating_min, rating_max] and opponent
+# ratings are team averages, so almost every rating difference is a multiple of 1/2:
+# expected scores for those are looked up instead of calling math.pow. Protection
+# adjustments and computed ranks are tabulated per rating. Every table entry is produced
+# by the same expression foosball.py uses, so lookups match the direct formulas exactly;
+# anything outside the tables falls back to those formulas.
+import bisect
+import math
+
+
+def expected_score(diff):
+    return 1 / (1 + math.pow(10, diff / 400))
+
+
+class RatingTables:
+    def __init__(self, rating_min, rating_max, protection, rank_thresholds, default_rank="iron"):
+        self.rating_min = rating_min
+        self.rating_max = rating_max
+        self.protection = list(protection)
+        self.rank_thresholds = list(rank_thresholds)
+        self.default_rank = default_rank
+        # expected[k + half_span] = expected_score(k / 2) for k in [-half_span, half_span]
+        self.half_span = 2 * (rating_max - rating_min)
+        self.expected = [expected_score(k / 2) for k in range(-self.half_span, self.half_span + 1)]
+        self.prot_thresholds = [threshold for threshold, _ in self.protection]
+        self.prot_values = [adj for _, adj in self.protection]
+        self.adjust = [self.protection_adjustment_slow(r) for r in range(rating_min, rating_max + 1)]
+        self.ranks = [self.computed_rank_slow(s) for s in range(0, rating_max + 1)]
+        self._np = None
+
+    def protection_adjustment_slow(self, rating):
+        i = bisect.bisect_left(self.prot_thresholds, rating)
+        return self.prot_values[i] if i < len(self.prot_values) else 0
+
+    def computed_rank_slow(self, score):
+        for threshold, rank in self.rank_thresholds:
+            if score >= threshold:
+                return rank
+        return self.default_rank
+
+    def expected_for(self, diff):
+        k = diff * 2
+        i = int(k) + self.half_span
+        if i == k + self.half_span and 0 <= i < len(self.expected):
+            return self.expected[i]
+        return expected_score(diff)
+
+    def protection_adjustment(self, rating):
+        i = rating - self.rating_min
+        if i.__class__ is int and 0 <= i < len(self.adjust):
+            return self.adjust[i]
+        return self.protection_adjustment_slow(rating)
+
+    def computed_rank(self, score):
+        if 0 <= score <= self.rating_max and int(score) == score:
+            return self.ranks[int(score)]
+        return self.computed_rank_slow(score)
+
+    # Vectorized entry points (NumPy is only imported when they are used).
+
+    def arrays(self):
+        if self._np is None:
+            import numpy as np
+            self._np = (np, np.array(self.expected), np.array(self.prot_thresholds, dtype=np.float64),
+                        np.array(self.prot_values + [0], dtype=np.float64))
+        return self._np
+
+    def expected_array(self, diffs):
+        np, table, _, _ = self.arrays()
+        diffs = np.asarray(diffs, dtype=np.float64)
+        k = diffs * 2 + self.half_span
+        index = k.astype(np.int64)
+        hit = (index == k) & (index >= 0) & (index < len(table))
+        result = table[np.where(hit, index, 0)]
+        for i in np.nonzero(~hit)[0]:
+            result[i] = expected_score(float(diffs[i]))
+        return result
+
+    def protection_array(self, ratings):
+        np, _, thresholds, values = self.arrays()
+        return values[np.searchsorted(thresholds, np.asarray(ratings, dtype=np.float64), side="left")]
+
+    def rank_index_array(self, scores):
+        # Index into rank_thresholds (len(rank_thresholds) meaning default_rank) for each score.
+        np, _, _, _ = self.arrays()
+        descending = np.array([threshold for threshold, _ in self.rank_thresholds], dtype=np.float64)
+        return np.searchsorted(-descending, -np.asarray(scores, dtype=np.float64), side="left")
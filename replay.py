@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# Rebuilds every player's ratings from elo.history, so changes to K_FACTOR,
+# WIN_TYPE_MULTIPLIERS or RATING_PROTECTION_THRESHOLDS can be applied to past games.
+# Ratings live in NumPy arrays indexed by player id; games that share no players are
+# grouped into levels and each level is updated in one vectorized step, using the exact
+# lookup tables from rating_table.py.
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import foosball
+from aliases import AliasTable
+from rating_table import RatingTables, expected_score
+from series import RatingSeries
+
+OFF, DEF = 0, 1
+
+
+class History:
+    # A parsed history: base roster, flat per-slot game arrays and combine barriers.
+    def __init__(self):
+        self.ids = {}  # canonical name -> player id (live players only)
+        self.keys = {}  # name as typed -> canonical name
+        self.display = []
+        self.base = []  # (pid, offense, defense, played, wins, rank_d, rank_o, rank_a)
+        self.game_mult = []
+        self.game_serial = []
+        self.game_start = [0]
+        self.slot_player = []
+        self.slot_role = []
+        self.slot_team = []
+        self.combines = []  # (games before the combine, src id, dest id)
+        self.aliases = AliasTable()  # as built up by the combines and aliases replayed so far
+        self.undo_floor = 0  # undo stops here as well as at the last combine
+        self.game_created = []  # canonical names each game added, so an undo can drop them again
+        self.cache = {}  # NumPy views and segment plans, rebuilt after any change
+
+    def arrays(self):
+        # (slot_player, slot_role, slot_team, game_start, game_serial, slot_game) as NumPy arrays.
+        arrays = self.cache.get("arrays")
+        if arrays is None:
+            game_start = np.array(self.game_start, dtype=np.int64)
+            arrays = self.cache["arrays"] = (
+                np.array(self.slot_player, dtype=np.int64),
+                np.array(self.slot_role, dtype=np.int64),
+                np.array(self.slot_team, dtype=np.int64),
+                game_start,
+                np.array(self.game_serial, dtype=bool),
+                np.repeat(np.arange(len(self.game_mult)), np.diff(game_start)),
+            )
+        return arrays
+
+    def segment_plan(self, a, b):
+        plan = self.cache.get((a, b))
+        if plan is None:
+            plan = self.cache[a, b] = SegmentPlan(self, a, b)
+        return plan
+
+    def canonical(self, name):
+        return self.aliases.resolve(foosball.normalize_name(name))
+
+    def player_id(self, name):
+        key = self.keys.get(name)
+        if key is None:
+            key = self.keys[name] = self.canonical(name)
+        pid = self.ids.get(key)
+        if pid is None:
+            pid = self.ids[key] = len(self.display)
+            self.display.append(name)
+        return pid
+
+    def add_base(self, fields):
+        display, off, deff, played, wins, rank_d, rank_o, rank_a = fields
+        key = self.canonical(display)
+        if key in self.ids:
+            return
+        pid = self.player_id(display)
+        self.base.append((pid, int(off), int(deff), int(played), int(wins), rank_d, rank_o, rank_a))
+
+    def add_game(self, command):
+        self.cache.clear()
+        try:
+            team1_off, team1_def, win_type, team2_off, team2_def = foosball.parse_game_command(command)
+        except ValueError:
+            return False
+        known = set(self.ids)
+        slots = []
+        for names, role, team in ((team1_off, OFF, 0), (team1_def, DEF, 0), (team2_off, OFF, 1), (team2_def, DEF, 1)):
+            for name in names:
+                slots.append((self.player_id(name), role, team))
+        for pid, role, team in slots:
+            self.slot_player.append(pid)
+            self.slot_role.append(role)
+            self.slot_team.append(team)
+        self.game_start.append(len(self.slot_player))
+        self.game_mult.append(win_type)
+        # The same player twice in one role updates sequentially; those games are replayed one by one.
+        self.game_serial.append(len({(pid, role) for pid, role, _ in slots}) != len(slots))
+        self.game_created.append([key for key in self.ids if key not in known])
+        return True
+
+    def add_undo(self, command):
+        # foosball.undo_games never reaches back past a combine, and records how many games it undid.
+        self.cache.clear()
+        parts = command.split()
+        count = int(parts[1]) if len(parts) == 2 and parts[1].isdigit() else 1
+        barrier = max(self.combines[-1][0] if self.combines else 0, self.undo_floor)
+        for _ in range(min(count, len(self.game_mult) - barrier)):
+            del self.slot_player[self.game_start[-2]:]
+            del self.slot_role[self.game_start[-2]:]
+            del self.slot_team[self.game_start[-2]:]
+            self.game_start.pop()
+            self.game_mult.pop()
+            self.game_serial.pop()
+            for key in self.game_created.pop():
+                del self.ids[key]
+
+    def add_combine(self, command):
+        self.cache.clear()
+        match = re.match(r"^combine\s+(.*?)\s+to\s+(.*?)\.?$", command, re.IGNORECASE)
+        if not match:
+            return False
+        src_key = self.canonical(match.group(1).strip())
+        dest_key = self.canonical(match.group(2).strip())
+        if src_key not in self.ids or dest_key not in self.ids or src_key == dest_key:
+            return False
+        self.combines.append((len(self.game_mult), self.ids[src_key], self.ids[dest_key]))
+        del self.ids[src_key]
+        self.aliases.union(src_key, dest_key)
+        self.keys.clear()
+        return True
+
+    def add_alias(self, command):
+        # Same as foosball.add_aliases for one pair: a record filed under the alias is combined
+        # into the player it now resolves to, or just renamed if there is none.
+        self.cache.clear()
+        try:
+            alias, name = foosball.parse_alias(command)
+        except ValueError:
+            return False
+        alias_key, name_key = foosball.normalize_name(alias), foosball.normalize_name(name)
+        if not alias_key or not name_key:
+            return False
+        touched = (alias_key, self.aliases.resolve(alias_key), self.aliases.resolve(name_key))
+        self.aliases.union(alias_key, name_key)
+        self.keys.clear()
+        for key in touched:
+            root = self.aliases.resolve(key)
+            if root == key or key not in self.ids:
+                continue
+            if root in self.ids:
+                self.combines.append((len(self.game_mult), self.ids[key], self.ids[root]))
+                del self.ids[key]
+            else:
+                self.ids[root] = self.ids.pop(key)
+            self.undo_floor = len(self.game_mult)
+        return True
+
+
+def parse_history(lines):
+    # Accepts elo.history lines ("p"/"g"/"c" records) as well as plain --ingest command files.
+    history = History()
+    for line in lines:
+        line = line.rstrip("\n")
+        kind, sep, rest = line.partition("\t")
+        if sep and kind == "p":
+            history.add_base(rest.split("\t"))
+            continue
+        if sep and kind == "r":
+            continue  # end of a glicko2 rating period; replays use the Elo rules
+        command = rest if sep and kind in ("g", "c", "u", "a") else line
+        command = command.strip()
+        if not command or command.startswith("#"):
+            continue
+        if command.lower().startswith("combine"):
+            history.add_combine(command)
+        elif command.lower().split()[0] == "undo":
+            history.add_undo(command)
+        elif command.lower().split()[0] == "alias":
+            history.add_alias(command)
+        else:
+            history.add_game(command)
+    return history
+
+
+class SegmentPlan:
+    # The parameter-free part of replaying games a..b: games that share no players are grouped
+    # into levels, and each level's slots are sorted by (game, team, role) group with the group
+    # each one plays against. Any K, multipliers or protection can then run the same plan.
+    def __init__(self, h, a, b):
+        slot_player, slot_role, slot_team, game_start, game_serial, slot_game = h.arrays()
+        level = [0] * (b - a)
+        last = {}
+        for g in range(a, b):
+            pids = h.slot_player[h.game_start[g]:h.game_start[g + 1]]
+            lvl = 1 + max(last.get(p, -1) for p in pids)
+            for p in pids:
+                last[p] = lvl
+            level[g - a] = lvl
+        level = np.array(level, dtype=np.int64)
+        self.nlevels = int(level.max()) + 1
+        gorder = np.argsort(level, kind="stable")
+        pos = np.empty(b - a, dtype=np.int64)
+        pos[gorder] = np.arange(b - a)
+        level_game_bounds = np.searchsorted(level[gorder], np.arange(self.nlevels + 1))
+
+        s0, s1 = game_start[a], game_start[b]
+        games = slot_game[s0:s1] - a
+        keep = ~game_serial[slot_game[s0:s1]]
+        idx = np.arange(s0, s1)[keep]
+        games = games[keep]
+        team = slot_team[idx]
+        role = slot_role[idx]
+        groups = pos[games] * 4 + team * 2 + role
+        has = np.zeros((b - a) * 4, dtype=bool)
+        has[groups] = True
+        opp_team = 1 - team
+        opp_base = pos[games] * 4 + opp_team * 2
+        # Offense plays against the opposing defense (or offense if they have none), and vice versa.
+        opp_role = np.where(role == OFF,
+                            np.where(has[opp_base + DEF], DEF, OFF),
+                            np.where(has[opp_base + OFF], OFF, DEF))
+        opp_groups = opp_base + opp_role
+        order = np.argsort(groups, kind="stable")
+        self.idx, self.groups, self.opp_groups, self.role = idx[order], groups[order], opp_groups[order], role[order]
+        self.group_count = np.bincount(self.groups, minlength=(b - a) * 4).astype(np.float64)
+        self.group_bounds = level_game_bounds * 4
+        self.slot_bounds = np.searchsorted(self.groups, self.group_bounds)
+        self.players = slot_player[self.idx]
+        self.scores = (1 - slot_team[self.idx]).astype(np.float64)
+        self.serial = {}  # level -> serial games replayed after it
+        for g in np.nonzero(game_serial[a:b])[0]:
+            self.serial.setdefault(int(level[g]), []).append(a + int(g))
+
+    def levels(self):
+        # (level, slot slice, group offset, group count) for each level.
+        for lvl in range(self.nlevels):
+            g0 = self.group_bounds[lvl]
+            yield lvl, slice(self.slot_bounds[lvl], self.slot_bounds[lvl + 1]), g0, self.group_bounds[lvl + 1] - g0
+
+
+def scalar_update(curr_rating, score, opposition_rating, multiplier, k_factor, protection):
+    # Same arithmetic as foosball.update_rating, with the parameters passed in.
+    expected = expected_score(opposition_rating - curr_rating)
+    change = multiplier * k_factor * (score - expected)
+    adjustment = 0
+    for threshold, adj in protection:
+        if curr_rating <= threshold:
+            adjustment = adj
+            break
+    change += adjustment
+    if score == 0:
+        change = min(change, 0)
+    if change < 0 and curr_rating <= foosball.RATING_MIN:
+        return foosball.RATING_MIN
+    new_rating = round(curr_rating + change)
+    return max(min(new_rating, foosball.RATING_MAX), foosball.RATING_MIN)
+
+
+def upgrade_rank(current, score):
+    # foosball.update_player_ranks for one field; applying it to the peak score equals applying it after every game.
+    if current in (foosball.HIDDEN_RANK, foosball.SPECIAL_IM):
+        return current
+    new_val = foosball.get_computed_rank(score)
+    return new_val if foosball.RANK_ORDER[new_val] > foosball.RANK_ORDER.get(current, 1) else current
+
+
+class Replay:
+    def __init__(self, history, k_factor=None, multipliers=None, protection=None):
+        self.h = history
+        self.k = foosball.K_FACTOR if k_factor is None else k_factor
+        multipliers = foosball.WIN_TYPE_MULTIPLIERS if multipliers is None else multipliers
+        self.protection = foosball.RATING_PROTECTION_THRESHOLDS if protection is None else protection
+        if protection is None:
+            self.tables = foosball.rating_tables()
+        else:
+            self.tables = RatingTables(foosball.RATING_MIN, foosball.RATING_MAX, protection, foosball.RANK_THRESHOLDS)
+        n = len(history.display)
+        self.rating = np.full((2, n), foosball.RATING_MIN, dtype=np.int64)
+        self.played = np.zeros(n, dtype=np.int64)
+        self.wins = np.zeros(n, dtype=np.int64)
+        self.avg = np.full(n, foosball.RATING_MIN, dtype=np.int64)
+        self.ranks = [["iron"] * n for _ in range(3)]  # rank_o, rank_d, rank_a as last materialized
+        for pid, off, deff, played, wins, rank_d, rank_o, rank_a in history.base:
+            self.rating[OFF, pid] = off
+            self.rating[DEF, pid] = deff
+            self.played[pid] = played
+            self.wins[pid] = wins
+            self.avg[pid] = round((off + deff) / 2)
+            self.ranks[0][pid], self.ranks[1][pid], self.ranks[2][pid] = rank_o, rank_d, rank_a
+        # Peak offense/defense/avg since ranks were last materialized.
+        self.peak = np.vstack([self.rating, self.avg[None, :]])
+        slot_game = history.arrays()[5]
+        self.game_mult = np.array([multipliers[w] for w in history.game_mult], dtype=np.float64)
+        self.slot_mult = self.game_mult[slot_game] if len(slot_game) else np.zeros(0)
+        self.levels = 0
+
+    def run(self):
+        start = 0
+        for end, src, dest in self.h.combines:
+            self.run_segment(start, end)
+            self.combine(src, dest)
+            start = end
+        self.run_segment(start, len(self.h.game_mult))
+        return self
+
+    def run_segment(self, a, b):
+        if a == b:
+            return
+        plan = self.h.segment_plan(a, b)
+        self.levels += plan.nlevels
+        mults = self.slot_mult[plan.idx]
+        for lvl, part, g0, ng in plan.levels():
+            if part.stop > part.start:
+                self.apply_level(plan.players[part], plan.role[part], plan.scores[part], mults[part],
+                                 plan.groups[part] - g0, plan.opp_groups[part] - g0, plan.group_count[g0:g0 + ng], ng)
+            for g in plan.serial.get(lvl, ()):
+                self.apply_serial(g)
+
+    def apply_level(self, players, role, scores, mults, groups, opp_groups, group_count, ng):
+        pre = self.rating[role, players].astype(np.float64)
+        sums = np.bincount(groups, weights=pre, minlength=ng)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages = sums / group_count
+        opp = averages[opp_groups]
+        expected = self.tables.expected_array(opp - pre)
+        change = mults * self.k * (scores - expected)
+        change += self.tables.protection_array(pre)
+        change = np.where(scores == 0, np.minimum(change, 0.0), change)
+        new = np.clip(np.rint(pre + change), foosball.RATING_MIN, foosball.RATING_MAX)
+        new[(change < 0) & (pre <= foosball.RATING_MIN)] = foosball.RATING_MIN
+        self.rating[role, players] = new
+        np.add.at(self.played, players, 1)
+        np.add.at(self.wins, players, scores.astype(np.int64))
+        self.touch(players)
+
+    def apply_serial(self, g):
+        # Mirrors process_game for games that name the same player twice in one role.
+        s0, s1 = self.h.game_start[g], self.h.game_start[g + 1]
+        slots = [(self.h.slot_player[s], self.h.slot_role[s], self.h.slot_team[s]) for s in range(s0, s1)]
+        mult = float(self.game_mult[g])
+
+        def average(team, role):
+            ratings = [int(self.rating[role, p]) for p, r, t in slots if t == team and r == role]
+            return sum(ratings) / len(ratings) if ratings else None
+
+        averages = {(t, r): average(t, r) for t in (0, 1) for r in (OFF, DEF)}
+        for p, r, t in slots:
+            u = 1 - t
+            if r == OFF:
+                opp = averages[(u, DEF)] if averages[(u, DEF)] is not None else averages[(u, OFF)]
+            else:
+                opp = averages[(u, OFF)] if averages[(u, OFF)] is not None else averages[(u, DEF)]
+            self.rating[r, p] = scalar_update(int(self.rating[r, p]), 1 - t, opp, mult, self.k, self.protection)
+            self.played[p] += 1
+            self.wins[p] += 1 - t
+        self.touch(np.array([p for p, _, _ in slots], dtype=np.int64))
+
+    def touch(self, players):
+        self.avg[players] = np.rint((self.rating[OFF, players] + self.rating[DEF, players]) / 2)
+        self.peak[OFF, players] = np.maximum(self.peak[OFF, players], self.rating[OFF, players])
+        self.peak[DEF, players] = np.maximum(self.peak[DEF, players], self.rating[DEF, players])
+        self.peak[2, players] = np.maximum(self.peak[2, players], self.avg[players])
+
+    def materialize_ranks(self, pid):
+        for field in range(3):
+            self.ranks[field][pid] = upgrade_rank(self.ranks[field][pid], int(self.peak[field, pid]))
+        return self.ranks[0][pid], self.ranks[1][pid], self.ranks[2][pid]
+
+    def combine(self, src, dest):
+        # Mirrors process_combine_command / merge_record.
+        old_o, old_d, old_a = self.materialize_ranks(dest)
+        old_off, old_def = int(self.rating[OFF, dest]), int(self.rating[DEF, dest])
+        old_played, played = int(self.played[dest]), int(self.played[src])
+        off, deff = int(self.rating[OFF, src]), int(self.rating[DEF, src])
+        total_played = old_played + played
+        if total_played > 0:
+            new_off = round((old_off * old_played + off * played) / total_played)
+            new_def = round((old_def * old_played + deff * played) / total_played)
+        else:
+            new_off, new_def = off, deff
+        new_avg = round((new_off + new_def) / 2)
+
+        def choose_rank(old_rank, new_rank):
+            return new_rank if foosball.RANK_ORDER.get(new_rank, 0) > foosball.RANK_ORDER.get(old_rank, 0) else old_rank
+
+        self.wins[dest] += self.wins[src]
+        self.played[dest] = total_played
+        self.rating[OFF, dest], self.rating[DEF, dest], self.avg[dest] = new_off, new_def, new_avg
+        self.ranks[0][dest] = choose_rank(old_o, foosball.get_computed_rank(new_off))
+        self.ranks[1][dest] = choose_rank(old_d, foosball.get_computed_rank(new_def))
+        self.ranks[2][dest] = choose_rank(old_a, foosball.get_computed_rank(new_avg))
+        self.peak[:, dest] = (new_off, new_def, new_avg)
+
+    def players(self):
+        # The players dict as process_games would leave it after its final save_data.
+        result = {}
+        for key, pid in self.h.ids.items():
+            off, deff = int(self.rating[OFF, pid]), int(self.rating[DEF, pid])
+            avg = round((off + deff) / 2)
+            self.peak[2, pid] = max(int(self.peak[2, pid]), avg)
+            rank_o, rank_d, rank_a = self.materialize_ranks(pid)
+            result[key] = {
+                "display": self.h.display[pid],
+                "offense": off,
+                "defense": deff,
+                "played": int(self.played[pid]),
+                "wins": int(self.wins[pid]),
+                "avg": avg,
+                "rank_d": rank_d,
+                "rank_o": rank_o,
+                "rank_a": rank_a
+            }
+        return result
+
+
+def replay(lines, k_factor=None, multipliers=None, protection=None):
+    return Replay(parse_history(lines), k_factor, multipliers, protection).run().players()
+
+
+def replay_python(history_lines):
+    # The reference path: the same history pushed through process_game one game at a time.
+    saved = {key: dict(data) for key, data in foosball.players.items()}
+    saved_aliases, saved_series = foosball.aliases, foosball.rating_series
+    foosball.players.clear()
+    foosball.aliases = AliasTable()  # only the merges in the history itself
+    foosball.rating_series = RatingSeries(os.devnull)
+    commands = []
+    for line in history_lines:
+        line = line.rstrip("\n")
+        kind, sep, rest = line.partition("\t")
+        if sep and kind == "p":
+            display, off, deff, played, wins, rank_d, rank_o, rank_a = rest.split("\t")
+            key = foosball.canonicalize(display)
+            if key not in foosball.players:
+                foosball.players[key] = {"display": display, "offense": int(off), "defense": int(deff),
+                                         "played": int(played), "wins": int(wins),
+                                         "avg": round((int(off) + int(deff)) / 2),
+                                         "rank_d": rank_d, "rank_o": rank_o, "rank_a": rank_a}
+        elif not (sep and kind == "r"):
+            commands.append(rest if sep and kind in ("g", "c", "u", "a") else line)
+    foosball.batch_depth += 1  # keep process_games from journaling or saving
+    foosball.journal.replaying = True  # ... and record_change from writing history or series points
+    try:
+        foosball.process_games(commands)
+        foosball.format_data()
+        return {k: dict(v) for k, v in foosball.players.items()}
+    finally:
+        foosball.batch_depth -= 1
+        foosball.journal.replaying = False
+        foosball.players.clear()
+        foosball.players.update(saved)
+        foosball.aliases, foosball.rating_series = saved_aliases, saved_series
+        foosball.leaderboard.rebuild()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay elo.history with the current (or given) rating constants.")
+    parser.add_argument("history", nargs="?", default=foosball.HISTORY_FILE)
+    parser.add_argument("--k", type=float, help="override K_FACTOR")
+    parser.add_argument("--check", action="store_true", help="also replay through process_game and compare")
+    parser.add_argument("--write", action="store_true", help="replace elo.txt with the replayed ratings")
+    args = parser.parse_args()
+    with open(args.history, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    t0 = time.perf_counter()
+    engine = Replay(parse_history(lines), args.k).run()
+    result = engine.players()
+    elapsed = time.perf_counter() - t0
+    print(f"Replayed {len(engine.h.game_mult)} games in {elapsed:.2f}s ({engine.levels} levels, {len(result)} players).")
+    status = 0
+    if args.check:
+        if args.k is not None:
+            parser.error("--check compares against process_game, which always uses K_FACTOR")
+        reference = replay_python(lines)
+        diff = [k for k in set(reference) | set(result) if reference.get(k) != result.get(k)]
+        print("Matches process_game." if not diff else f"{len(diff)} player(s) differ: {', '.join(sorted(diff)[:10])}")
+        status = 1 if diff else 0
+    if args.write:
+        foosball.players.clear()
+        foosball.players.update(result)
+        foosball.leaderboard.rebuild()
+        foosball.save_data()
+        print(f"Wrote {foosball.FILE_NAME}.")
+    else:
+        foosball.players.clear()
+        foosball.players.update(result)
+        foosball.leaderboard.rebuild()
+        print(foosball.get_players_display())
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
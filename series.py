@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# Rating history per player and role (elo.series): one timestamped point for every rating a
+# game changes, so progress can be charted and "what was Lincoln's defense on March 1st"
+# answered. elo.txt only keeps the current numbers.
+#
+# The file is append-only. Every process that records games starts its own segment, and
+# inside a segment each series is delta-encoded against its previous point in that segment,
+# so appending never needs to read the file. Each flush is one write that starts by naming
+# its segment, so stations sharing the file (--shared) can interleave safely. Integers are
+# LEB128 varints (zigzag for deltas); a record's first byte is kind << 2 | role.
+#   MAGIC
+#   SEGMENT   varint segment id, varint base time (unix seconds)
+#   RESUME    varint segment id: the records that follow belong to it
+#   NAME      varint byte length, UTF-8 canonical key; gets the segment's next local id
+#   POINT     varint local id, zigzag seconds since the previous point (or base), zigzag rating delta (or rating)
+#   RETRACT   varint local id; drops that series' last point in the segment (undo)
+#
+# Reading decodes everything once, into two typed arrays per series (times and ratings), so
+# range, peak and downsampling queries are a bisect plus a slice.
+#   python series.py [elo.series] NAME [offense|defense|avg]
+import bisect
+import os
+import random
+import sys
+import time
+from array import array
+
+MAGIC = b"ELOSERIES1\n"
+ROLES = ("offense", "defense", "avg")
+SEGMENT, RESUME, NAME, POINT, RETRACT = range(5)
+
+
+def _varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _zigzag(out, value):
+    _varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+
+
+class RatingSeries:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.segment = None
+        self.started = False
+        self.buffer = bytearray()
+        self.local = {}  # key -> local id in the segment this process is writing
+        self.last = {}  # (local id, role) -> [(time, rating), ...] written in that segment
+        self.base = 0
+        self.series = None  # key -> [(times, ratings)] per role, once read
+
+    # Writing
+
+    def open(self):
+        if self.file is not None:
+            return
+        self.file = open(self.path, "ab")
+        self.segment = random.getrandbits(32)
+        self.base = int(time.time())
+        self.started = False
+        self.local = {}
+        self.last = {}
+
+    def flush(self):
+        if not self.buffer:
+            return
+        head = bytearray()
+        if not self.started:
+            if self.file.tell() == 0:
+                head += MAGIC
+            head.append(SEGMENT << 2)
+            _varint(head, self.segment)
+            _varint(head, self.base)
+            self.started = True
+        else:
+            head.append(RESUME << 2)
+            _varint(head, self.segment)
+        self.file.write(head + self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def record(self, key, role, rating, now=None):
+        self.open()
+        now = int(time.time()) if now is None else now
+        out = self.buffer
+        lid = self.local.get(key)
+        if lid is None:
+            lid = self.local[key] = len(self.local)
+            name = key.encode("utf-8")
+            out.append(NAME << 2)
+            _varint(out, len(name))
+            out += name
+        r = ROLES.index(role)
+        points = self.last.setdefault((lid, r), [])
+        prev_time, prev_rating = points[-1] if points else (self.base, 0)
+        out.append(POINT << 2 | r)
+        _varint(out, lid)
+        _zigzag(out, now - prev_time)
+        _zigzag(out, rating - prev_rating)
+        points.append((now, rating))
+        if self.series is not None:
+            times, ratings = self._series(key)[r]
+            times.append(now)
+            ratings.append(rating)
+
+    def retract(self, key, role, rating):
+        # Takes back the last point of a series, if this process wrote it and it still holds `rating`.
+        lid = self.local.get(key)
+        r = ROLES.index(role)
+        points = self.last.get((lid, r))
+        if not points or points[-1][1] != rating:
+            return False
+        points.pop()
+        self.buffer.append(RETRACT << 2 | r)
+        _varint(self.buffer, lid)
+        if self.series is not None:
+            times, ratings = self._series(key)[r]
+            times.pop()
+            ratings.pop()
+        return True
+
+    # Reading
+
+    def _series(self, key):
+        entry = self.series.get(key)
+        if entry is None:
+            entry = self.series[key] = [(array("q"), array("i")) for _ in ROLES]
+        return entry
+
+    def load(self):
+        if self.series is not None:
+            return
+        self.series = {}
+        if self.file is not None:
+            self.flush()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        pos, end = 0, len(data)
+        segments = {}  # segment id -> (base, local id -> series, points held per local id * 4 + role)
+        base, names, live = 0, [], []
+        magic = MAGIC[0] >> 2
+        try:
+            while pos < end:
+                head = data[pos]
+                kind, r = head >> 2, head & 3
+                if kind == magic and data.startswith(MAGIC, pos):
+                    pos += len(MAGIC)  # two stations created the file at once
+                    continue
+                # Inline varint reads, with a shortcut for one-byte values (most of them):
+                # this loop runs for every point ever recorded.
+                value = data[pos + 1]
+                pos += 2
+                if value >= 0x80:
+                    value, pos = _read_varint(data, pos - 1)
+                if kind == POINT:
+                    dt = data[pos]
+                    pos += 1
+                    if dt >= 0x80:
+                        dt, pos = _read_varint(data, pos - 1)
+                    dv = data[pos]
+                    pos += 1
+                    if dv >= 0x80:
+                        dv, pos = _read_varint(data, pos - 1)
+                    times, ratings = names[value][r]
+                    slot = value * 4 + r
+                    if live[slot]:
+                        times.append(times[-1] + ((dt >> 1) ^ -(dt & 1)))
+                        ratings.append(ratings[-1] + ((dv >> 1) ^ -(dv & 1)))
+                    else:
+                        times.append(base + ((dt >> 1) ^ -(dt & 1)))
+                        ratings.append((dv >> 1) ^ -(dv & 1))
+                    live[slot] += 1
+                elif kind == NAME:
+                    names.append(self._series(data[pos:pos + value].decode("utf-8")))
+                    live += (0, 0, 0, 0)
+                    pos += value
+                elif kind == RETRACT:
+                    slot = value * 4 + r
+                    if live[slot]:
+                        times, ratings = names[value][r]
+                        times.pop()
+                        ratings.pop()
+                        live[slot] -= 1
+                elif kind == RESUME:
+                    base, names, live = segments[value]
+                elif kind == SEGMENT:
+                    base, pos = _read_varint(data, pos)
+                    names, live = [], []
+                    segments[value] = (base, names, live)
+                else:
+                    break  # not a series file, or damaged past here
+        except (IndexError, KeyError):
+            pass  # last record cut short by a crash
+
+    def __contains__(self, key):
+        self.load()
+        return key in self.series
+
+    def points(self, key, role, start=None, end=None):
+        # (times, ratings) for start <= time < end, as arrays (a copy of that slice).
+        self.load()
+        entry = self.series.get(key)
+        if entry is None:
+            return array("q"), array("i")
+        times, ratings = entry[ROLES.index(role)]
+        lo = 0 if start is None else bisect.bisect_left(times, start)
+        hi = len(times) if end is None else bisect.bisect_left(times, end)
+        return times[lo:hi], ratings[lo:hi]
+
+    def value_at(self, key, role, when):
+        # The rating after the last point at or before `when`, or None before the first one.
+        self.load()
+        entry = self.series.get(key)
+        if entry is None:
+            return None
+        times, ratings = entry[ROLES.index(role)]
+        idx = bisect.bisect_right(times, when)
+        return ratings[idx - 1] if idx else None
+
+    def peak(self, key, role, start=None, end=None):
+        # (time, rating) of the highest point in the range, the first one on ties; None if empty.
+        times, ratings = self.points(key, role, start, end)
+        if not ratings:
+            return None
+        best = max(ratings)
+        return times[ratings.index(best)], best
+
+    def low(self, key, role, start=None, end=None):
+        times, ratings = self.points(key, role, start, end)
+        if not ratings:
+            return None
+        worst = min(ratings)
+        return times[ratings.index(worst)], worst
+
+    def downsample(self, key, role, buckets, start=None, end=None):
+        # Splits the range into `buckets` equal spans of time and returns
+        # (span start, low, high, last rating) for every span that has points.
+        times, ratings = self.points(key, role, start, end)
+        if not times:
+            return []
+        first = times[0] if start is None else start
+        stop = times[-1] + 1 if end is None else end
+        width = max(1, -(-(stop - first) // buckets))
+        result = []
+        lo = 0
+        while lo < len(times):
+            span = first + (times[lo] - first) // width * width
+            hi = bisect.bisect_left(times, span + width, lo)
+            part = ratings[lo:hi]
+            result.append((span, min(part), max(part), part[-1]))
+            lo = hi
+        return result
+
+
+def main():
+    from foosball import canonicalize
+
+    args = sys.argv[1:]
+    path = args.pop(0) if args and args[0].endswith(".series") else "elo.series"
+    if not args:
+        print("usage: series.py [elo.series] NAME [offense|defense|avg]")
+        return 2
+    series = RatingSeries(path)
+    key = canonicalize(args[0])
+    for role in (args[1:2] or ROLES):
+        times, ratings = series.points(key, role)
+        for when, rating in zip(times, ratings):
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(when))}\t{role}\t{rating}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# JSON API over the live ratings, so web pages can show elo.txt without re-implementing
+# the rating logic.
+#   python server.py [--host 127.0.0.1] [--port 8080]
+#
+#   GET  /leaderboard[?rank=gold]  players in "pp" order
+#   GET  /best
+#   GET  /players/<name>
+#   POST /games      body: a game command, or {"command": "Brady;Larry win Lincoln;Grayson"}
+#   POST /combine    body: "a to b", or {"command": "combine a to b"}
+#
+# Every response carries ETag "<RUN_ID>-v<foosball.data_version>"; a GET whose If-None-Match
+# still matches gets 304. The counter starts again with every process, hence RUN_ID. Rendered
+# GET bodies are cached until a game or combine bumps the version. Writes and cache misses
+# run one at a time on a single worker thread, so they never interleave; cache hits are
+# answered straight from the event loop. With --shared, a request first picks up whatever
+# other stations have saved to elo.txt, as run_command does.
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import foosball
+from export import player_json
+
+IDLE_TIMEOUT = 15.0  # seconds a kept-alive connection may sit idle
+MAX_BODY = 64 * 1024
+CACHE_ENTRIES = 1024
+RUN_ID = os.urandom(4).hex()  # tells this process's versions from an earlier run's
+
+REASONS = {200: "OK", 204: "No Content", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+def render_leaderboard(query):
+    rank = query.get("rank", [None])[0]
+    if rank is not None:
+        rank = rank.lower()
+        valid = [name for _, name in foosball.RANK_THRESHOLDS]
+        if rank not in valid:
+            return 400, {"error": f"Invalid rank '{rank}'. Valid ranks are: {', '.join(valid)}."}
+    return 200, [dict(player_json(key), no=idx) for idx, key in enumerate(foosball.leaderboard.keys(rank), start=1)]
+
+
+def render_best(query):
+    if not foosball.players:
+        return 200, {}
+    best_avg, best_off, best_def, most_played, highest_win = foosball.best_players()
+    result = {
+        "avg": {"name": best_avg["display"], "value": best_avg["avg"]},
+        "offense": {"name": best_off["display"], "value": best_off["offense"]},
+        "defense": {"name": best_def["display"], "value": best_def["defense"]},
+        "played": {"name": most_played["display"], "value": most_played["played"]},
+    }
+    if highest_win["played"] > 0:
+        result["win_rate"] = {"name": highest_win["display"],
+                              "value": round(highest_win["wins"] / highest_win["played"] * 100, 1)}
+    return 200, result
+
+
+def render_player(name):
+    key = foosball.canonicalize(name)
+    if key not in foosball.players:
+        return 404, {"error": f"Player '{name}' not found."}
+    return 200, player_json(key)
+
+
+def submit_game(command):
+    try:
+        plan = foosball.GamePlan(command)
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    return 200, {"report": plan.commit(), "version": foosball.data_version}
+
+
+def submit_combine(command):
+    if not command.lower().startswith("combine"):
+        command = "combine " + command
+    result = foosball.process_combine_command(command)
+    if not result.startswith("Combined"):
+        return 400, {"error": result}
+    return 200, {"result": result, "version": foosball.data_version}
+
+
+def etag(version):
+    return f'"{RUN_ID}-v{version}"'
+
+
+def command_from_body(body):
+    text = body.decode("utf-8", "replace").strip()
+    if text.startswith("{"):
+        try:
+            text = str(json.loads(text).get("command", ""))
+        except (ValueError, AttributeError):
+            return None
+    return text or None
+
+
+class Server:
+    def __init__(self):
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.cache = {}  # request target -> (status, body), for cache_version only
+        self.cache_version = None
+
+    def render(self, path, query):
+        # Runs on the worker thread. Returns (version, status, payload).
+        version = foosball.data_version
+        if path == "/leaderboard":
+            status, payload = render_leaderboard(query)
+        elif path == "/best":
+            status, payload = render_best(query)
+        elif path.startswith("/players/"):
+            status, payload = render_player(unquote(path[len("/players/"):]))
+        else:
+            status, payload = 404, {"error": "Not found."}
+        return version, status, payload
+
+    def refresh(self):
+        # Runs on the worker thread.
+        if foosball.SHARED_MODE and not foosball.batch_depth:
+            foosball.refresh_from_disk()
+
+    def write(self, path, body):
+        self.refresh()
+        command = command_from_body(body)
+        if command is None:
+            return foosball.data_version, 400, {"error": "Empty command."}
+        if path == "/games":
+            status, payload = submit_game(command)
+        else:
+            status, payload = submit_combine(command)
+        return foosball.data_version, status, payload
+
+    async def get(self, target):
+        loop = asyncio.get_running_loop()
+        version = foosball.data_version
+        if self.cache_version != version:
+            self.cache.clear()
+            self.cache_version = version
+        cached = self.cache.get(target)
+        if cached is not None:
+            return version, cached[0], cached[1]
+        parts = urlsplit(target)
+        version, status, payload = await loop.run_in_executor(self.worker, self.render, parts.path, parse_qs(parts.query))
+        body = json.dumps(payload).encode("utf-8")
+        if version == self.cache_version:
+            if len(self.cache) >= CACHE_ENTRIES:
+                self.cache.clear()
+            self.cache[target] = (status, body)
+        return version, status, body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, http_version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, json.dumps({"error": "Bad request line."}).encode(), None, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if http_version == "HTTP/1.1" else connection == "keep-alive"
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY:
+                    await self.respond(writer, 413 if length > 0 else 400, b'{"error": "Bad Content-Length."}', None, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                await self.dispatch(writer, method, target, headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, writer, method, target, headers, body, keep_alive):
+        path = urlsplit(target).path
+        if method == "GET":
+            if foosball.SHARED_MODE and foosball.source_stat(foosball.FILE_NAME) != foosball.disk_stat:
+                await asyncio.get_running_loop().run_in_executor(self.worker, self.refresh)
+            tag = etag(foosball.data_version)
+            if headers.get("if-none-match") == tag:
+                await self.respond(writer, 304, b"", tag, keep_alive)
+                return
+            version, status, data = await self.get(target)
+            await self.respond(writer, status, data, etag(version), keep_alive)
+        elif method == "POST" and path in ("/games", "/combine"):
+            loop = asyncio.get_running_loop()
+            version, status, payload = await loop.run_in_executor(self.worker, self.write, path, body)
+            await self.respond(writer, status, json.dumps(payload).encode("utf-8"), etag(version), keep_alive)
+        elif method == "OPTIONS":
+            await self.respond(writer, 204, b"", None, keep_alive)
+        else:
+            await self.respond(writer, 405, b'{"error": "Method not allowed."}', None, keep_alive)
+
+    async def respond(self, writer, status, body, etag, keep_alive):
+        head = [f"HTTP/1.1 {status} {REASONS[status]}",
+                "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(body)}",
+                "Cache-Control: no-cache",
+                "Access-Control-Allow-Origin: *",
+                "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+                "Access-Control-Allow-Headers: Content-Type, If-None-Match",
+                "Access-Control-Expose-Headers: ETag",
+                "Connection: " + ("keep-alive" if keep_alive else "close")]
+        if etag is not None:
+            head.append(f"ETag: {etag}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    def close(self):
+        # Let queued writes finish, then save like the GUI does on exit.
+        self.worker.shutdown(wait=True)
+        foosball.shutdown()
+
+
+async def serve(host, port):
+    server = Server()
+    listener = await asyncio.start_server(server.handle, host, port)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, listener.close)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C still cancels serve_forever through asyncio.run
+    print(f"Serving {len(foosball.players)} players on http://{host}:{port}/leaderboard", flush=True)
+    try:
+        await listener.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the leaderboard and accept games over HTTP (JSON).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--shared", action="store_true", help="elo.txt is shared with other stations (see foosball.py --shared)")
+    args = parser.parse_args()
+    foosball.SHARED_MODE = foosball.SHARED_MODE or args.shared
+    foosball.load_data()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
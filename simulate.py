@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# Monte Carlo forecasts: plays many independent seasons from the current ratings with the
+# real rating rules (foosball.update_rating, protection table, un-droppable ranks) and
+# reports how often each player reaches each rank, plus the spread of final ratings.
+# Seasons run on copies of the players they involve, never on foosball.players.
+#   python simulate.py Brady --games 50 --seasons 20000
+#   python simulate.py --tournament "Brady;Larry" "Lincoln;Grayson" "Justin;William" --legs 2
+import argparse
+import os
+import random
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import foosball
+
+CHUNK = 500  # seasons per task; chunks (not workers) get seeds, so results don't depend on --workers
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def win_type_weights():
+    # How often each win type was recorded, from elo.history; every type equally likely without it.
+    counts = Counter()
+    if os.path.exists(foosball.HISTORY_FILE):
+        with open(foosball.HISTORY_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("g\t"):
+                    match = re.search(r"(smallwin|closewin|bigwin|perfectwin|win)", line[2:], re.IGNORECASE)
+                    if match:
+                        counts[match.group(1).lower()] += 1
+    types = list(foosball.WIN_TYPE_MULTIPLIERS)
+    if not counts:
+        return types, [1] * len(types)
+    return types, [counts[t] for t in types]
+
+
+def initial_state(keys):
+    # Plain-dict copies of the given players (unknown names start as new players).
+    state = {}
+    for name in keys:
+        key = foosball.canonicalize(name)
+        if key in foosball.players:
+            state[key] = dict(foosball.players[key])
+        else:
+            state[key] = {"display": name, "offense": foosball.RATING_MIN, "defense": foosball.RATING_MIN,
+                          "played": 0, "wins": 0, "avg": foosball.RATING_MIN,
+                          "rank_d": foosball.get_computed_rank(foosball.RATING_MIN),
+                          "rank_o": foosball.get_computed_rank(foosball.RATING_MIN),
+                          "rank_a": foosball.get_computed_rank(foosball.RATING_MIN)}
+    return state
+
+
+def top_rank(rec):
+    return max(foosball.RANK_ORDER.get(rec[field], 0) for field in ("rank_o", "rank_d", "rank_a"))
+
+
+def team_win_rate(state, team1, team2):
+    # Team 1's expected win rate as process_game reports it, as a fraction.
+    (o1, d1), (o2, d2) = team1, team2
+    off1, def1 = state[o1]["offense"], state[d1]["defense"]
+    off2, def2 = state[o2]["offense"], state[d2]["defense"]
+    expected = foosball.rating_tables().expected_for
+    return (expected(def2 - off1) + expected(off2 - def1)) / 2
+
+
+def play(state, winners, losers, multiplier):
+    # process_game's update for a 2v2 game of distinct players, on plain dicts.
+    (wo, wd), (lo, ld) = winners, losers
+    opp_for_w, opp_off_w = state[ld]["defense"], state[lo]["offense"]
+    opp_for_l, opp_off_l = state[wd]["defense"], state[wo]["offense"]
+    update = foosball.update_rating
+    for key, role, score, opponent in ((wo, "offense", 1, opp_for_w), (wd, "defense", 1, opp_off_w),
+                                       (lo, "offense", 0, opp_for_l), (ld, "defense", 0, opp_off_l)):
+        rec = state[key]
+        rec[role] = update(rec[role], score, opponent, multiplier)[0]
+        rec["played"] += 1
+        rec["wins"] += score
+        rec["avg"] = round((rec["offense"] + rec["defense"]) / 2)
+        # A loss never raises a rating, so only winners can reach a new rank.
+        if score:
+            foosball.upgrade_ranks(rec)
+
+
+def play_sampled(state, team1, team2, rng, types, weights):
+    # Samples the result from the current ratings and applies it; True if team 1 won.
+    team1_won = rng.random() < team_win_rate(state, team1, team2)
+    multiplier = foosball.WIN_TYPE_MULTIPLIERS[rng.choices(types, weights)[0]]
+    if team1_won:
+        play(state, team1, team2, multiplier)
+    else:
+        play(state, team2, team1, multiplier)
+    return team1_won
+
+
+def run_season(state, focus, pool, games, rng, types, weights):
+    # Every focus player plays `games` games, each with a random role, partner and opponents from the pool.
+    for _ in range(games):
+        for key in rng.sample(focus, len(focus)):
+            others = [p for p in rng.sample(pool, 4) if p != key][:3]
+            me = (key, others[0]) if rng.random() < 0.5 else (others[0], key)
+            play_sampled(state, me, (others[1], others[2]), rng, types, weights)
+
+
+def _season_chunk(args):
+    base, focus, pool, games, seed, chunk, count, types, weights = args
+    rng = random.Random(f"{seed}:{chunk}")
+    reached = {key: Counter() for key in focus}
+    finals = {key: (Counter(), Counter(), Counter()) for key in focus}
+    for _ in range(count):
+        state = {key: dict(rec) for key, rec in base.items()}
+        run_season(state, focus, pool, games, rng, types, weights)
+        for key in focus:
+            rec = state[key]
+            reached[key][top_rank(rec)] += 1
+            for counter, field in zip(finals[key], ("avg", "offense", "defense")):
+                counter[rec[field]] += 1
+    return reached, finals
+
+
+def _tournament_chunk(args):
+    base, teams, legs, seed, chunk, count, types, weights = args
+    rng = random.Random(f"{seed}:{chunk}")
+    firsts = Counter()
+    for _ in range(count):
+        state = {key: dict(rec) for key, rec in base.items()}
+        wins = Counter()
+        for _ in range(legs):
+            for i in range(len(teams)):
+                for j in range(i + 1, len(teams)):
+                    wins[i if play_sampled(state, teams[i], teams[j], rng, types, weights) else j] += 1
+        # Ties for first are split evenly.
+        top = max(wins.values())
+        leaders = [i for i in range(len(teams)) if wins[i] == top]
+        for i in leaders:
+            firsts[i] += 1 / len(leaders)
+    return firsts
+
+
+def run_chunks(func, jobs, workers):
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(func, jobs))
+    return [func(job) for job in jobs]
+
+
+def split(seasons):
+    return [(chunk, min(CHUNK, seasons - start)) for chunk, start in enumerate(range(0, seasons, CHUNK))]
+
+
+def percentiles(counter, points=PERCENTILES):
+    total = sum(counter.values())
+    result = []
+    values = sorted(counter)
+    seen = 0
+    idx = 0
+    for value in values:
+        seen += counter[value]
+        while idx < len(points) and seen * 100 >= points[idx] * total:
+            result.append(value)
+            idx += 1
+    return result
+
+
+def simulate_season(names, games=50, seasons=10000, pool=None, seed=0, workers=None):
+    # Returns {key: {"display", "reach": {rank: probability}, "avg"/"offense"/"defense": percentiles,
+    # "mean_avg"}} for each focus player.
+    focus = list(dict.fromkeys(foosball.canonicalize(n) for n in names if foosball.canonicalize(n)))
+    if pool is None:
+        pool = [key for key in foosball.players if foosball.players[key]["played"] > 0]
+    typed = {}  # key -> the name as first typed, for players not in the league yet
+    for name in list(names) + list(pool):
+        typed.setdefault(foosball.canonicalize(name), name)
+    pool = list(dict.fromkeys(focus + [foosball.canonicalize(n) for n in pool]))
+    if len(pool) < 4:
+        raise ValueError("Need at least four players to simulate 2v2 games.")
+    base = initial_state([typed[key] for key in pool])
+    types, weights = win_type_weights()
+    jobs = [(base, focus, pool, games, seed, chunk, count, types, weights) for chunk, count in split(seasons)]
+    reached = {key: Counter() for key in focus}
+    finals = {key: (Counter(), Counter(), Counter()) for key in focus}
+    for chunk_reached, chunk_finals in run_chunks(_season_chunk, jobs, workers):
+        for key in focus:
+            reached[key].update(chunk_reached[key])
+            for total, part in zip(finals[key], chunk_finals[key]):
+                total.update(part)
+    result = {}
+    for key in focus:
+        reach = {}
+        for rank, order in sorted(foosball.RANK_ORDER.items(), key=lambda item: -item[1]):
+            if rank in (foosball.HIDDEN_RANK, foosball.SPECIAL_IM):
+                continue
+            reach[rank] = sum(n for o, n in reached[key].items() if o >= order) / seasons
+        avg, off, deff = finals[key]
+        result[key] = {
+            "display": base[key]["display"],
+            "start": top_rank(base[key]),
+            "reach": reach,
+            "avg": percentiles(avg),
+            "offense": percentiles(off),
+            "defense": percentiles(deff),
+            "mean_avg": sum(v * n for v, n in avg.items()) / seasons,
+        }
+    return result
+
+
+def simulate_tournament(teams, legs=1, seasons=10000, seed=0, workers=None):
+    # teams: "offense;defense" strings. Returns [(team, probability of finishing first)].
+    parsed = []
+    names = []
+    for team in teams:
+        offense, defense = foosball.parse_team(team)
+        if len(offense) != 1 or len(defense) != 1:
+            raise ValueError(f"Teams are written offense;defense: {team}")
+        parsed.append((foosball.canonicalize(offense[0]), foosball.canonicalize(defense[0])))
+        names += [offense[0], defense[0]]
+    base = initial_state(names)
+    types, weights = win_type_weights()
+    jobs = [(base, parsed, legs, seed, chunk, count, types, weights) for chunk, count in split(seasons)]
+    firsts = Counter()
+    for part in run_chunks(_tournament_chunk, jobs, workers):
+        firsts.update(part)
+    return sorted(((teams[i], firsts[i] / seasons) for i in range(len(teams))), key=lambda t: -t[1])
+
+
+def get_season_display(result, games, seasons):
+    lines = [f"{seasons} simulated seasons of {games} games each:"]
+    names_by_order = {order: rank for rank, order in foosball.RANK_ORDER.items()
+                      if rank not in (foosball.HIDDEN_RANK, foosball.SPECIAL_IM)}
+    for data in result.values():
+        lines.append(f"{data['display']} (now {names_by_order.get(data['start'], '?')}), "
+                     f"final avg mean {data['mean_avg']:.0f}, "
+                     f"p5/p25/p50/p75/p95 {'/'.join(map(str, data['avg']))}")
+        for rank, probability in data["reach"].items():
+            if foosball.RANK_ORDER[rank] > data["start"] and probability > 0:
+                lines.append(f"  reach {rank:<13} {probability * 100:5.1f}%")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast ranks and ratings by simulating many seasons.")
+    parser.add_argument("names", nargs="*", help="players to forecast")
+    parser.add_argument("--games", type=int, default=50, help="games per player per season")
+    parser.add_argument("--seasons", type=int, default=10000)
+    parser.add_argument("--pool", help="comma-separated opponents/partners (default: everyone who has played)")
+    parser.add_argument("--tournament", nargs="+", metavar="OFF;DEF", help="round-robin between these teams")
+    parser.add_argument("--legs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    foosball.load_data()
+    try:
+        if args.tournament:
+            standings = simulate_tournament(args.tournament, args.legs, args.seasons, args.seed, args.workers)
+            print(f"{args.seasons} simulated round-robins ({args.legs} leg(s)):")
+            for team, probability in standings:
+                print(f"  {team:<30} wins {probability * 100:5.1f}%")
+        else:
+            if not args.names:
+                parser.error("name at least one player, or use --tournament")
+            pool = [n.strip() for n in args.pool.split(",") if n.strip()] if args.pool else None
+            result = simulate_season(args.names, args.games, args.seasons, pool, args.seed, args.workers)
+            print(get_season_display(result, args.games, args.seasons))
+    except ValueError as e:
+        print(e)
+        return 1
+    finally:
+        foosball.shutdown(save=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
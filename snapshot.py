@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# Binary, memory-mapped snapshot of the players table (elo.snap), written next to elo.txt.
+#
+# Layout (little endian), version 1:
+#   header      HEADER
+#   rank table  rank_count x RANK_ENTRY (offset, length) into the string table
+#   records     count x RECORD, in leaderboard order (-avg, display)
+#   key index   count x uint32 record numbers, sorted by canonical key
+#   strings     UTF-8 display names, canonical keys and rank names
+#
+# Readers mmap the file and decode a record only when it is asked for, so opening a
+# snapshot costs the same for ten players as for a million.
+#   python snapshot.py to-binary elo.txt elo.snap
+#   python snapshot.py to-text elo.snap elo.txt
+#   python snapshot.py top elo.snap [N] [rank]
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"FELO"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIQQ24sQQQQ")
+RANK_ENTRY = struct.Struct("<IH2x")
+RECORD = struct.Struct("<5i3H2xIIHH")
+INDEX_ENTRY = struct.Struct("<I")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def fsync_dir(path):
+    # Makes a rename into path's directory durable.
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def source_stat(path):
+    # (size, mtime_ns): a cheap check for whether a file has changed since it was last seen.
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0
+    return st.st_size, st.st_mtime_ns
+
+
+def write_snapshot(path, records, rank_names, fingerprint="", source=(0, 0)):
+    # records: iterable of (key, record dict) in the order readers should see them.
+    records = list(records)
+    rank_codes = {name: code for code, name in enumerate(rank_names)}
+    rank_names = list(rank_names)
+    strings = bytearray()
+
+    def add_string(text):
+        offset = len(strings)
+        data = text.encode("utf-8")
+        strings.extend(data)
+        return offset, len(data)
+
+    rank_table = []
+    body = bytearray()
+    keys = []
+    for key, data in records:
+        codes = []
+        for field in ("rank_d", "rank_o", "rank_a"):
+            name = data[field]
+            if name not in rank_codes:
+                rank_codes[name] = len(rank_names)
+                rank_names.append(name)
+            codes.append(rank_codes[name])
+        name_off, name_len = add_string(data["display"])
+        key_off, key_len = add_string(key)
+        keys.append(key.encode("utf-8"))
+        body += RECORD.pack(data["offense"], data["defense"], data["played"], data["wins"], data["avg"],
+                            *codes, name_off, key_off, name_len, key_len)
+    for name in rank_names:
+        rank_table.append(RANK_ENTRY.pack(*add_string(name)))
+    index = sorted(range(len(records)), key=keys.__getitem__)
+    records_offset = HEADER.size + RANK_ENTRY.size * len(rank_names)
+    index_offset = records_offset + len(body)
+    strings_offset = index_offset + INDEX_ENTRY.size * len(index)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(records), len(rank_names), source[0], source[1],
+                         fingerprint.encode("ascii"), records_offset, index_offset, strings_offset, len(strings))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(b"".join(rank_table))
+        f.write(body)
+        f.write(b"".join(INDEX_ENTRY.pack(i) for i in index))
+        f.write(strings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path)
+
+
+class Snapshot:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size:
+            self.close()
+            raise SnapshotError(f"{path}: truncated header")
+        (magic, version, _, self.count, rank_count, size, mtime_ns, fingerprint,
+         self.records_offset, self.index_offset, self.strings_offset, strings_size) = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise SnapshotError(f"{path}: not a version {VERSION} snapshot")
+        if self.strings_offset + strings_size > len(self.mm):
+            self.close()
+            raise SnapshotError(f"{path}: truncated")
+        self.source = (size, mtime_ns)
+        self.fingerprint = fingerprint.rstrip(b"\0").decode("ascii")
+        self.rank_names = [self.string(*RANK_ENTRY.unpack_from(self.mm, HEADER.size + RANK_ENTRY.size * i))
+                           for i in range(rank_count)]
+
+    def close(self):
+        self.mm.close()
+
+    def string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.mm[start:start + length].decode("utf-8")
+
+    def __len__(self):
+        return self.count
+
+    def key(self, i):
+        _, _, _, _, _, _, _, _, _, key_off, _, key_len = RECORD.unpack_from(self.mm, self.records_offset + RECORD.size * i)
+        return self.string(key_off, key_len)
+
+    def record(self, i):
+        off, deff, played, wins, avg, rank_d, rank_o, rank_a, name_off, key_off, name_len, key_len = \
+            RECORD.unpack_from(self.mm, self.records_offset + RECORD.size * i)
+        return self.string(key_off, key_len), {
+            "display": self.string(name_off, name_len),
+            "offense": off,
+            "defense": deff,
+            "played": played,
+            "wins": wins,
+            "avg": avg,
+            "rank_d": self.rank_names[rank_d],
+            "rank_o": self.rank_names[rank_o],
+            "rank_a": self.rank_names[rank_a]
+        }
+
+    def find(self, key):
+        # Binary search of the key index; returns a record number or None.
+        target = key.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = INDEX_ENTRY.unpack_from(self.mm, self.index_offset + INDEX_ENTRY.size * mid)[0]
+            _, _, _, _, _, _, _, _, _, key_off, _, key_len = RECORD.unpack_from(self.mm, self.records_offset + RECORD.size * i)
+            start = self.strings_offset + key_off
+            probe = self.mm[start:start + key_len]
+            if probe == target:
+                return i
+            if probe < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def get(self, key):
+        i = self.find(key)
+        return None if i is None else self.record(i)[1]
+
+    def keys(self):
+        return (self.key(i) for i in range(self.count))
+
+    def items(self):
+        return (self.record(i) for i in range(self.count))
+
+    def top(self, n=None, accept=None):
+        # Leaderboard order straight off the record table; accept(record) filters (e.g. by rank).
+        result = []
+        for i in range(self.count):
+            key, data = self.record(i)
+            if accept is None or accept(data):
+                result.append((key, data))
+                if n is not None and len(result) >= n:
+                    break
+        return result
+
+
+def main(argv):
+    import foosball
+
+    if len(argv) < 3 or argv[0] not in ("to-binary", "to-text", "top"):
+        print("usage: snapshot.py to-binary|to-text SRC DEST, or snapshot.py top SNAP N [rank]")
+        return 2
+    command, src = argv[0], argv[1]
+    if command == "to-binary":
+        with open(src, "rb") as f:
+            raw = f.read()
+        foosball.load_text(raw)
+        foosball.format_data()
+        write_snapshot(argv[2], ((key, foosball.players[key]) for key in foosball.leaderboard.keys()),
+                       list(foosball.RANK_ORDER), foosball.snapshot_fingerprint(raw), source_stat(src))
+        print(f"Wrote {len(foosball.players)} players to {argv[2]}.")
+    elif command == "to-text":
+        snap = Snapshot(src)
+        for key, data in snap.items():
+            foosball.players[key] = data
+        foosball.atomic_write(argv[2], foosball.format_data())
+        print(f"Wrote {len(snap)} players to {argv[2]}.")
+    else:
+        snap = Snapshot(src)
+        n = int(argv[2])
+        rank = argv[3].lower() if len(argv) > 3 else None
+        accept = (lambda data: foosball.highest_visible_rank(data) == rank) if rank else None
+        for idx, (key, data) in enumerate(snap.top(n, accept), start=1):
+            print(f"{idx:<3} {data['display']:<15} {data['avg']:>5} {data['offense']:>5} {data['defense']:>5} {data['played']:>3}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
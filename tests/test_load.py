@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# Loading elo.txt and elo.snap: rank codes other than the full names, stale snapshots.
+#   python -m unittest discover tests
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import foosball  # noqa: E402
+
+ROWS = (
+    "Foo, 500, 500, 3, 50, 500, g, g, g.\n"  # initials, as get_rank_display reads them
+    "Bar, 300, 200, 5, 2, 250, s, zz, iron.\n"  # one code this file doesn't know
+    "Baz, 90, 90, 1, 0, 90, xx, yy, zz.\n"  # none it knows
+)
+
+
+class LoadRankCodes(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        with open(foosball.FILE_NAME, "w", encoding="utf-8") as f:
+            f.write(ROWS)
+
+    def tearDown(self):
+        foosball.shutdown(save=False)
+        foosball.players.clear()
+        foosball.leaderboard.rebuild()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def check_board(self):
+        self.assertEqual(sorted(foosball.leaderboard.keys()), ["bar", "baz", "foo"])
+        self.assertEqual(foosball.leaderboard.keys("gold"), ["foo"])
+        self.assertEqual(foosball.leaderboard.keys("silver"), ["bar"])
+        self.assertIn("gold(a)", foosball.get_players_display())
+
+    def test_text(self):
+        foosball.load_data()
+        self.check_board()
+
+    def test_snapshot(self):
+        # Saved once, the next start loads elo.snap instead of elo.txt.
+        foosball.load_data()
+        foosball.save_data()
+        foosball.shutdown(save=False)
+        foosball.players.clear()
+        foosball.leaderboard.rebuild()
+        foosball.load_data()
+        self.check_board()
+
+    def test_stale_snapshot(self):
+        # elo.txt edited without changing its size or mtime: elo.snap no longer applies.
+        foosball.load_data()
+        foosball.save_data()
+        foosball.shutdown(save=False)
+        foosball.players.clear()
+        foosball.leaderboard.rebuild()
+        st = os.stat(foosball.FILE_NAME)
+        with open(foosball.FILE_NAME, "rb") as f:
+            raw = f.read()
+        with open(foosball.FILE_NAME, "wb") as f:
+            f.write(raw.replace(b"Foo,", b"Qux,"))
+        os.utime(foosball.FILE_NAME, ns=(st.st_atime_ns, st.st_mtime_ns))
+        foosball.load_data()
+        self.assertIn("qux", foosball.players)
+        self.assertNotIn("foo", foosball.players)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# Fits K_FACTOR, WIN_TYPE_MULTIPLIERS and the protection adjustments to a recorded history.
+# Every candidate replays elo.history (replay.py's level plan, shared by all candidates) and
+# is scored on how well it predicted each game before playing it: the probability it gave
+# the actual winners is the mean, over every player in the game, of update_rating's expected
+# score for their result. Lower log-loss / Brier score is better.
+#
+# Candidates are replayed in batches: ratings carry a candidate axis, so one pass over the
+# history updates up to BATCH parameter sets at once. The sets are split evenly over the
+# workers of a process pool, so a dozen candidates still keep every core busy.
+#   python tune.py --k 16,24,32,40 --bigwin 1,1.25,1.5 --protection-scale 0,0.5,1
+#   python tune.py --optimize [--metric brier] [--burn-in 2000] [--workers 8]
+import argparse
+import itertools
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import foosball
+from replay import DEF, OFF, expected_score, parse_history, scalar_update
+
+BATCH = 32  # most candidates replayed together
+EPSILON = 1e-12  # probabilities are clipped to [EPSILON, 1 - EPSILON] for log-loss
+WIN_TYPES = list(foosball.WIN_TYPE_MULTIPLIERS)
+
+
+def candidate(k=None, multipliers=None, protection_scale=1.0):
+    # A parameter set as a plain dict (picklable); protection is RATING_PROTECTION_THRESHOLDS
+    # with every adjustment multiplied by protection_scale.
+    return {"k": foosball.K_FACTOR if k is None else k,
+            "multipliers": dict(foosball.WIN_TYPE_MULTIPLIERS if multipliers is None else multipliers),
+            "protection_scale": protection_scale}
+
+
+def as_vector(cand):
+    # What the search moves: K, every multiplier but "win" (it stays 1.0; it would only rescale K)
+    # and the protection scale.
+    return [cand["k"]] + [cand["multipliers"][w] for w in WIN_TYPES[1:]] + [cand["protection_scale"]]
+
+
+def from_vector(vector):
+    multipliers = {"win": 1.0}
+    multipliers.update(zip(WIN_TYPES[1:], vector[1:-1]))
+    return candidate(vector[0], multipliers, vector[-1])
+
+
+class BatchReplay:
+    # Replay.run for many parameter sets at once, keeping only what the scores need
+    # (ratings and games played, not ranks). Rating arithmetic matches Replay exactly.
+    def __init__(self, history, candidates, burn_in=0):
+        self.h = history
+        self.burn_in = burn_in
+        c = len(candidates)
+        n = len(history.display)
+        self.rating = np.full((c, 2, n), foosball.RATING_MIN, dtype=np.int64)
+        self.played = np.zeros(n, dtype=np.int64)
+        for pid, off, deff, played, *_ in history.base:
+            self.rating[:, OFF, pid] = off
+            self.rating[:, DEF, pid] = deff
+            self.played[pid] = played
+        self.k = np.array([cand["k"] for cand in candidates], dtype=np.float64)[:, None]
+        codes = np.array([WIN_TYPES.index(w) for w in history.game_mult], dtype=np.int64)
+        self.game_mult = np.array([[cand["multipliers"][w] for w in WIN_TYPES] for cand in candidates])[:, codes]
+        self.slot_game = history.arrays()[5]
+        # Protection adjustment for every rating, per candidate: rating - RATING_MIN -> adjustment.
+        thresholds = np.array([t for t, _ in foosball.RATING_PROTECTION_THRESHOLDS], dtype=np.float64)
+        values = np.array([adj for _, adj in foosball.RATING_PROTECTION_THRESHOLDS] + [0], dtype=np.float64)
+        base = values[np.searchsorted(thresholds, np.arange(foosball.RATING_MIN, foosball.RATING_MAX + 1), side="left")]
+        self.adjust = np.array([cand["protection_scale"] for cand in candidates])[:, None] * base
+        self.protection = [[(t, adj * cand["protection_scale"]) for t, adj in foosball.RATING_PROTECTION_THRESHOLDS]
+                           for cand in candidates]
+        self.tables = foosball.rating_tables()
+        self.log_loss = np.zeros(c)
+        self.brier = np.zeros(c)
+        self.games = 0
+
+    def run(self):
+        start = 0
+        for end, src, dest in self.h.combines:
+            self.run_segment(start, end)
+            self.combine(src, dest)
+            start = end
+        self.run_segment(start, len(self.h.game_mult))
+        return self
+
+    def run_segment(self, a, b):
+        if a == b:
+            return
+        plan = self.h.segment_plan(a, b)
+        games = self.slot_game[plan.idx]
+        mults = self.game_mult[:, games]
+        for lvl, part, g0, ng in plan.levels():
+            if part.stop > part.start:
+                self.apply_level(plan.players[part], plan.role[part], plan.scores[part], mults[:, part], games[part],
+                                 plan.groups[part] - g0, plan.opp_groups[part] - g0, plan.group_count[g0:g0 + ng], ng)
+            for g in plan.serial.get(lvl, ()):
+                self.apply_serial(g)
+
+    def apply_level(self, players, role, scores, mults, games, groups, opp_groups, group_count, ng):
+        c = self.rating.shape[0]
+        pre = self.rating[:, role, players].astype(np.float64)
+        # Per-candidate group sums in one bincount: candidate i uses bins i*ng ... i*ng + ng - 1.
+        offsets = (np.arange(c) * ng)[:, None]
+        sums = np.bincount((groups + offsets).ravel(), weights=pre.ravel(), minlength=c * ng).reshape(c, ng)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages = sums / group_count
+        opp = averages[:, opp_groups]
+        expected = self.tables.expected_array((opp - pre).ravel()).reshape(pre.shape)
+        self.score(np.where(scores == 1, expected, 1 - expected), games, groups // 4, ng // 4)
+        change = mults * self.k * (scores - expected)
+        change += np.take_along_axis(self.adjust, pre.astype(np.int64) - foosball.RATING_MIN, axis=1)
+        change = np.where(scores == 0, np.minimum(change, 0.0), change)
+        new = np.clip(np.rint(pre + change), foosball.RATING_MIN, foosball.RATING_MAX)
+        new[(change < 0) & (pre <= foosball.RATING_MIN)] = foosball.RATING_MIN
+        self.rating[:, role, players] = new
+        np.add.at(self.played, players, 1)
+
+    def score(self, right, games, local, count):
+        # right: (candidates, slots) probability each slot gave its actual result; a game's
+        # prediction is the mean over its slots.
+        c = right.shape[0]
+        per_game = np.bincount(local, minlength=count)
+        game_id = np.zeros(count, dtype=np.int64)
+        game_id[local] = games
+        use = (per_game > 0) & (game_id >= self.burn_in)
+        if not use.any():
+            return
+        offsets = (np.arange(c) * count)[:, None]
+        sums = np.bincount((local + offsets).ravel(), weights=right.ravel(), minlength=c * count).reshape(c, count)
+        p = sums[:, use] / per_game[use]
+        self.log_loss -= np.log(np.clip(p, EPSILON, 1 - EPSILON)).sum(axis=1)
+        self.brier += ((1 - p) ** 2).sum(axis=1)
+        self.games += int(use.sum())
+
+    def apply_serial(self, g):
+        # Replay.apply_serial per candidate (games naming the same player twice in one role).
+        s0, s1 = self.h.game_start[g], self.h.game_start[g + 1]
+        slots = [(self.h.slot_player[s], self.h.slot_role[s], self.h.slot_team[s]) for s in range(s0, s1)]
+        for i in range(self.rating.shape[0]):
+            rating = self.rating[i]
+
+            def average(team, role):
+                ratings = [int(rating[role, p]) for p, r, t in slots if t == team and r == role]
+                return sum(ratings) / len(ratings) if ratings else None
+
+            averages = {(t, r): average(t, r) for t in (0, 1) for r in (OFF, DEF)}
+            right = 0.0
+            for p, r, t in slots:
+                u = 1 - t
+                if r == OFF:
+                    opp = averages[(u, DEF)] if averages[(u, DEF)] is not None else averages[(u, OFF)]
+                else:
+                    opp = averages[(u, OFF)] if averages[(u, OFF)] is not None else averages[(u, DEF)]
+                expected = expected_score(opp - int(rating[r, p]))
+                right += expected if t == 0 else 1 - expected
+                rating[r, p] = scalar_update(int(rating[r, p]), 1 - t, opp, float(self.game_mult[i, g]),
+                                             float(self.k[i, 0]), self.protection[i])
+            if g >= self.burn_in:
+                p = min(max(right / len(slots), EPSILON), 1 - EPSILON)
+                self.log_loss[i] -= math.log(p)
+                self.brier[i] += (1 - p) ** 2
+        if g >= self.burn_in:
+            self.games += 1
+        for p, _, _ in slots:
+            self.played[p] += 1
+
+    def combine(self, src, dest):
+        # Ratings part of Replay.combine, for every candidate.
+        old_played, played = int(self.played[dest]), int(self.played[src])
+        total = old_played + played
+        if total > 0:
+            self.rating[:, :, dest] = np.rint((self.rating[:, :, dest] * old_played + self.rating[:, :, src] * played) / total)
+        else:
+            self.rating[:, :, dest] = self.rating[:, :, src]
+        self.played[dest] = total
+
+    def results(self):
+        # (log-loss, Brier score) per game, per candidate.
+        games = max(self.games, 1)
+        return list(zip((self.log_loss / games).tolist(), (self.brier / games).tolist()))
+
+
+_history = None
+
+
+def _init_worker(path):
+    global _history
+    with open(path, "r", encoding="utf-8") as f:
+        _history = parse_history(f)
+
+
+def _evaluate(args):
+    candidates, burn_in = args
+    return BatchReplay(_history, candidates, burn_in).run().results()
+
+
+def evaluate(candidates, path, burn_in=0, workers=None, pool=None):
+    # Scores for each candidate, in order: [(log-loss, Brier)].
+    size = BATCH
+    if pool is not None and workers:
+        size = max(1, min(BATCH, math.ceil(len(candidates) / workers)))
+    jobs = [(candidates[i:i + size], burn_in) for i in range(0, len(candidates), size)]
+    if pool is not None:
+        parts = list(pool.map(_evaluate, jobs))
+    else:
+        if _history is None:
+            _init_worker(path)
+        parts = [_evaluate(job) for job in jobs]
+    return [score for part in parts for score in part]
+
+
+def grid(args):
+    values = [args.k or [foosball.K_FACTOR]]
+    for w in WIN_TYPES[1:]:
+        values.append(getattr(args, w) or [foosball.WIN_TYPE_MULTIPLIERS[w]])
+    values.append(args.protection_scale or [1.0])
+    return [from_vector(list(v)) for v in itertools.product(*values)]
+
+
+def optimize(start, path, metric, burn_in, pool, workers=None, steps=None, rounds=50):
+    # Pattern search: try every parameter one step up and down (all in parallel), move to the
+    # best, halve the steps when nothing improves.
+    steps = steps or [4.0] + [0.125] * (len(WIN_TYPES) - 1) + [0.25]
+    best = as_vector(start)
+    best_score = evaluate([from_vector(best)], path, burn_in, pool=pool)[0]
+    tried = 1
+    for _ in range(rounds):
+        trial = []
+        for i, step in enumerate(steps):
+            for sign in (1, -1):
+                v = list(best)
+                v[i] = max(0.0, v[i] + sign * step)
+                if v != best:
+                    trial.append(v)
+        scores = evaluate([from_vector(v) for v in trial], path, burn_in, workers, pool)
+        tried += len(trial)
+        idx = min(range(len(trial)), key=lambda i: scores[i][metric])
+        if scores[idx][metric] < best_score[metric]:
+            best, best_score = trial[idx], scores[idx]
+        else:
+            steps = [s / 2 for s in steps]
+            if max(s / max(abs(b), 1) for s, b in zip(steps, best)) < 0.01:
+                break
+    return from_vector(best), best_score, tried
+
+
+def describe(cand):
+    mults = ", ".join(f"{w} {cand['multipliers'][w]:g}" for w in WIN_TYPES)
+    return f"K {cand['k']:g}; {mults}; protection x{cand['protection_scale']:g}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the rating constants to a recorded history by predictive log-loss / Brier score.")
+    parser.add_argument("history", nargs="?", default=foosball.HISTORY_FILE)
+    floats = lambda text: [float(v) for v in text.split(",")]
+    parser.add_argument("--k", type=floats, help="K_FACTOR values to try, comma-separated")
+    for w in WIN_TYPES[1:]:
+        parser.add_argument(f"--{w}", type=floats, help=f"{w} multipliers to try")
+    parser.add_argument("--protection-scale", type=floats, help="factors for every protection adjustment (0 turns protection off)")
+    parser.add_argument("--optimize", action="store_true", help="after the grid, refine the best set with a local search")
+    parser.add_argument("--metric", choices=("log-loss", "brier"), default="log-loss")
+    parser.add_argument("--burn-in", type=int, default=0, help="don't score the first N games (ratings still settling)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    metric = 0 if args.metric == "log-loss" else 1
+    candidates = grid(args)
+    baseline = candidate()
+    if baseline not in candidates:
+        candidates.append(baseline)
+    t0 = time.perf_counter()
+    pool = None
+    if args.workers and args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.history,))
+    try:
+        scores = evaluate(candidates, args.history, args.burn_in, args.workers, pool)
+        ranked = sorted(zip(scores, range(len(candidates))), key=lambda item: item[0][metric])
+        print(f"{len(candidates)} parameter sets in {time.perf_counter() - t0:.1f}s:")
+        print(f"{'log-loss':>9} {'Brier':>7}  parameters")
+        for (loss, brier), i in ranked[:args.top]:
+            print(f"{loss:>9.4f} {brier:>7.4f}  {describe(candidates[i])}")
+        loss, brier = scores[candidates.index(baseline)]
+        print(f"{loss:>9.4f} {brier:>7.4f}  current constants")
+        if args.optimize:
+            best, (loss, brier), tried = optimize(candidates[ranked[0][1]], args.history, metric, args.burn_in, pool, args.workers)
+            print(f"\nLocal search ({tried} sets, {time.perf_counter() - t0:.1f}s total):")
+            print(f"{loss:>9.4f} {brier:>7.4f}  {describe(best)}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())